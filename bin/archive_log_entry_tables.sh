@@ -1,6 +1,9 @@
 #!/bin/bash
 # Moved expired data from logging_entry to logging_entry_old
 # Moved associated data from logging_entry_attribute to logging_entry_attribute_old
+# Whole monthly partitions older than the given time are re-parented
+# (see logging_archive_before in db/logging/postgresql/update-4.sql).
+# CHAPI also does this on a schedule (chapi.log_archive_months).
 #
 # Usage: archive_log_entry_table.sh expired_time
 
@@ -11,10 +14,7 @@ else
    
     EXPIRED_TIME=$1
     echo "BEGIN;" > /tmp/log_entry_mod.sql
-    echo "insert into logging_entry_old (select * from logging_entry where event_time < '$EXPIRED_TIME');" >> /tmp/log_entry_mod.sql
-    echo "insert into logging_entry_attribute_old select * from logging_entry_attribute where event_id in (select id from logging_entry where event_time < '$EXPIRED_TIME');" >> /tmp/log_entry_mod.sql
-    echo "delete from logging_entry_attribute where event_id in (select id from logging_entry where event_time < '$EXPIRED_TIME');" >> /tmp/log_entry_mod.sql
-    echo "delete from logging_entry where event_time < '$EXPIRED_TIME';" >> /tmp/log_entry_mod.sql
+    echo "select logging_archive_before('$EXPIRED_TIME');" >> /tmp/log_entry_mod.sql
     echo "COMMIT;" >> /tmp/log_entry_mod.sql
     psql -U portal -h localhost portal -f /tmp/log_entry_mod.sql
 fi
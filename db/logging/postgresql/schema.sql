@@ -9,11 +9,12 @@ set client_min_messages='WARNING';
 DROP INDEX IF EXISTS logging_entry_event_time;
 DROP INDEX IF EXISTS logging_entry_attribute_event_id;
 
-DROP TABLE IF EXISTS logging_entry_attribute;
-DROP TABLE IF EXISTS logging_entry;
+-- CASCADE drops the monthly partitions too
+DROP TABLE IF EXISTS logging_entry_attribute CASCADE;
+DROP TABLE IF EXISTS logging_entry CASCADE;
 DROP TABLE IF EXISTS logging_entry_context;
-DROP TABLE IF EXISTS logging_entry_attribute_old;
-DROP TABLE IF EXISTS logging_entry_old;
+DROP TABLE IF EXISTS logging_entry_attribute_old CASCADE;
+DROP TABLE IF EXISTS logging_entry_old CASCADE;
 
 -- Now create the table
 CREATE TABLE logging_entry (
@@ -29,11 +30,14 @@ CREATE INDEX logging_entry_event_time ON logging_entry(event_time);
 CREATE TABLE logging_entry_attribute (
   event_id INT NOT NULL REFERENCES logging_entry(id),
   attribute_name VARCHAR NOT NULL,
-  attribute_value VARCHAR
+  attribute_value VARCHAR,
+  event_time TIMESTAMP -- of the event, for partitioning
 );
 
 CREATE INDEX logging_entry_attribute_event_id 
       ON logging_entry_attribute(event_id);
+CREATE INDEX logging_entry_attribute_name_value
+      ON logging_entry_attribute(attribute_name, attribute_value);
 
 -- Now create the table
 CREATE TABLE logging_entry_old (
@@ -47,6 +51,140 @@ CREATE TABLE logging_entry_old (
 CREATE TABLE logging_entry_attribute_old (
   event_id INT NOT NULL REFERENCES logging_entry_old(id),
   attribute_name VARCHAR NOT NULL,
-  attribute_value VARCHAR
+  attribute_value VARCHAR,
+  event_time TIMESTAMP
 );
 
+-- ----------------------------------------------------------------------
+-- Monthly partitions of logging_entry and logging_entry_attribute
+-- (see update-4.sql)
+-- ----------------------------------------------------------------------
+
+-- Create the partitions for the month containing the given time,
+-- if they don't exist
+CREATE OR REPLACE FUNCTION logging_create_partition(month TIMESTAMP)
+RETURNS VOID AS $$
+DECLARE
+  month_start TIMESTAMP := date_trunc('month', month);
+  month_end TIMESTAMP := date_trunc('month', month) + interval '1 month';
+  suffix VARCHAR := to_char(month, 'YYYYMM');
+BEGIN
+  PERFORM 1 FROM pg_class WHERE relname = 'logging_entry_' || suffix;
+  IF FOUND THEN
+    RETURN;
+  END IF;
+  EXECUTE format('CREATE TABLE logging_entry_%s ('
+                 || ' CHECK (event_time >= %L AND event_time < %L),'
+                 || ' PRIMARY KEY (id)) INHERITS (logging_entry)',
+                 suffix, month_start, month_end);
+  EXECUTE format('CREATE INDEX logging_entry_%s_event_time'
+                 || ' ON logging_entry_%s(event_time)', suffix, suffix);
+  EXECUTE format('CREATE TABLE logging_entry_attribute_%s ('
+                 || ' CHECK (event_time >= %L AND event_time < %L))'
+                 || ' INHERITS (logging_entry_attribute)',
+                 suffix, month_start, month_end);
+  EXECUTE format('CREATE INDEX logging_entry_attribute_%s_event_id'
+                 || ' ON logging_entry_attribute_%s(event_id)',
+                 suffix, suffix);
+  EXECUTE format('CREATE INDEX logging_entry_attribute_%s_name_value'
+                 || ' ON logging_entry_attribute_%s(attribute_name, attribute_value)',
+                 suffix, suffix);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Route new logging entries to their month
+CREATE OR REPLACE FUNCTION logging_entry_insert()
+RETURNS TRIGGER AS $$
+DECLARE
+  suffix VARCHAR := to_char(NEW.event_time, 'YYYYMM');
+BEGIN
+  BEGIN
+    EXECUTE format('INSERT INTO logging_entry_%s SELECT ($1).*', suffix)
+      USING NEW;
+  EXCEPTION WHEN undefined_table THEN
+    PERFORM logging_create_partition(NEW.event_time);
+    EXECUTE format('INSERT INTO logging_entry_%s SELECT ($1).*', suffix)
+      USING NEW;
+  END;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Route new logging entry attributes to the month of their entry
+CREATE OR REPLACE FUNCTION logging_entry_attribute_insert()
+RETURNS TRIGGER AS $$
+DECLARE
+  suffix VARCHAR;
+BEGIN
+  IF NEW.event_time IS NULL THEN
+    SELECT event_time INTO NEW.event_time
+      FROM logging_entry WHERE id = NEW.event_id;
+  END IF;
+  IF NEW.event_time IS NULL THEN
+    RETURN NEW;
+  END IF;
+  suffix := to_char(NEW.event_time, 'YYYYMM');
+  BEGIN
+    EXECUTE format('INSERT INTO logging_entry_attribute_%s SELECT ($1).*',
+                   suffix) USING NEW;
+  EXCEPTION WHEN undefined_table THEN
+    PERFORM logging_create_partition(NEW.event_time);
+    EXECUTE format('INSERT INTO logging_entry_attribute_%s SELECT ($1).*',
+                   suffix) USING NEW;
+  END;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER logging_entry_insert
+  BEFORE INSERT ON logging_entry
+  FOR EACH ROW EXECUTE PROCEDURE logging_entry_insert();
+
+CREATE TRIGGER logging_entry_attribute_insert
+  BEFORE INSERT ON logging_entry_attribute
+  FOR EACH ROW EXECUTE PROCEDURE logging_entry_attribute_insert();
+
+-- Move logging entries older than cutoff into the _old tables:
+-- whole months are re-parented, rows from before partitioning are copied.
+-- Returns the number of months archived.
+CREATE OR REPLACE FUNCTION logging_archive_before(cutoff TIMESTAMP)
+RETURNS INTEGER AS $$
+DECLARE
+  part RECORD;
+  suffix VARCHAR;
+  archived INTEGER := 0;
+BEGIN
+  FOR part IN
+    SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+     WHERE i.inhparent = 'logging_entry'::regclass
+       AND c.relname ~ '^logging_entry_[0-9]{6}$'
+  LOOP
+    suffix := substring(part.relname from '[0-9]{6}$');
+    IF to_date(suffix, 'YYYYMM') + interval '1 month' <= cutoff THEN
+      EXECUTE format('ALTER TABLE logging_entry_%s'
+                     || ' NO INHERIT logging_entry', suffix);
+      EXECUTE format('ALTER TABLE logging_entry_%s'
+                     || ' INHERIT logging_entry_old', suffix);
+      EXECUTE format('ALTER TABLE logging_entry_attribute_%s'
+                     || ' NO INHERIT logging_entry_attribute', suffix);
+      EXECUTE format('ALTER TABLE logging_entry_attribute_%s'
+                     || ' INHERIT logging_entry_attribute_old', suffix);
+      archived := archived + 1;
+    END IF;
+  END LOOP;
+
+  INSERT INTO logging_entry_old
+    SELECT * FROM ONLY logging_entry WHERE event_time < cutoff;
+  INSERT INTO logging_entry_attribute_old
+    SELECT * FROM ONLY logging_entry_attribute WHERE event_id IN
+      (SELECT id FROM ONLY logging_entry WHERE event_time < cutoff);
+  DELETE FROM ONLY logging_entry_attribute WHERE event_id IN
+    (SELECT id FROM ONLY logging_entry WHERE event_time < cutoff);
+  DELETE FROM ONLY logging_entry WHERE event_time < cutoff;
+
+  RETURN archived;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT logging_create_partition(now() at time zone 'utc');
+SELECT logging_create_partition((now() at time zone 'utc') + interval '1 month');
@@ -0,0 +1,156 @@
+-- -------------------
+-- Partition logging_entry and logging_entry_attribute by month.
+--
+-- Each month gets child tables logging_entry_YYYYMM and
+-- logging_entry_attribute_YYYYMM with a CHECK constraint on
+-- event_time, so queries on recent history (event_time >= ...) skip
+-- older months (constraint_exclusion = partition, the default).
+-- Inserts into the parent tables are routed to the children by
+-- trigger. Rows from before this update stay in the parent tables
+-- until archived.
+--
+-- Archiving a month re-parents its tables to logging_entry_old and
+-- logging_entry_attribute_old (see logging_archive_before).
+-- -------------------
+
+-- Attributes carry their event's time so they can be partitioned too
+ALTER TABLE logging_entry_attribute ADD COLUMN event_time TIMESTAMP;
+ALTER TABLE logging_entry_attribute_old ADD COLUMN event_time TIMESTAMP;
+
+UPDATE logging_entry_attribute SET event_time = logging_entry.event_time
+  FROM logging_entry WHERE logging_entry_attribute.event_id = logging_entry.id;
+UPDATE logging_entry_attribute_old SET event_time = logging_entry_old.event_time
+  FROM logging_entry_old
+  WHERE logging_entry_attribute_old.event_id = logging_entry_old.id;
+
+CREATE INDEX logging_entry_attribute_name_value
+      ON logging_entry_attribute(attribute_name, attribute_value);
+
+-- Create the partitions for the month containing the given time,
+-- if they don't exist
+CREATE OR REPLACE FUNCTION logging_create_partition(month TIMESTAMP)
+RETURNS VOID AS $$
+DECLARE
+  month_start TIMESTAMP := date_trunc('month', month);
+  month_end TIMESTAMP := date_trunc('month', month) + interval '1 month';
+  suffix VARCHAR := to_char(month, 'YYYYMM');
+BEGIN
+  PERFORM 1 FROM pg_class WHERE relname = 'logging_entry_' || suffix;
+  IF FOUND THEN
+    RETURN;
+  END IF;
+  EXECUTE format('CREATE TABLE logging_entry_%s ('
+                 || ' CHECK (event_time >= %L AND event_time < %L),'
+                 || ' PRIMARY KEY (id)) INHERITS (logging_entry)',
+                 suffix, month_start, month_end);
+  EXECUTE format('CREATE INDEX logging_entry_%s_event_time'
+                 || ' ON logging_entry_%s(event_time)', suffix, suffix);
+  EXECUTE format('CREATE TABLE logging_entry_attribute_%s ('
+                 || ' CHECK (event_time >= %L AND event_time < %L))'
+                 || ' INHERITS (logging_entry_attribute)',
+                 suffix, month_start, month_end);
+  EXECUTE format('CREATE INDEX logging_entry_attribute_%s_event_id'
+                 || ' ON logging_entry_attribute_%s(event_id)',
+                 suffix, suffix);
+  EXECUTE format('CREATE INDEX logging_entry_attribute_%s_name_value'
+                 || ' ON logging_entry_attribute_%s(attribute_name, attribute_value)',
+                 suffix, suffix);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Route new logging entries to their month
+CREATE OR REPLACE FUNCTION logging_entry_insert()
+RETURNS TRIGGER AS $$
+DECLARE
+  suffix VARCHAR := to_char(NEW.event_time, 'YYYYMM');
+BEGIN
+  BEGIN
+    EXECUTE format('INSERT INTO logging_entry_%s SELECT ($1).*', suffix)
+      USING NEW;
+  EXCEPTION WHEN undefined_table THEN
+    PERFORM logging_create_partition(NEW.event_time);
+    EXECUTE format('INSERT INTO logging_entry_%s SELECT ($1).*', suffix)
+      USING NEW;
+  END;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Route new logging entry attributes to the month of their entry
+CREATE OR REPLACE FUNCTION logging_entry_attribute_insert()
+RETURNS TRIGGER AS $$
+DECLARE
+  suffix VARCHAR;
+BEGIN
+  IF NEW.event_time IS NULL THEN
+    SELECT event_time INTO NEW.event_time
+      FROM logging_entry WHERE id = NEW.event_id;
+  END IF;
+  IF NEW.event_time IS NULL THEN
+    RETURN NEW;
+  END IF;
+  suffix := to_char(NEW.event_time, 'YYYYMM');
+  BEGIN
+    EXECUTE format('INSERT INTO logging_entry_attribute_%s SELECT ($1).*',
+                   suffix) USING NEW;
+  EXCEPTION WHEN undefined_table THEN
+    PERFORM logging_create_partition(NEW.event_time);
+    EXECUTE format('INSERT INTO logging_entry_attribute_%s SELECT ($1).*',
+                   suffix) USING NEW;
+  END;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER logging_entry_insert
+  BEFORE INSERT ON logging_entry
+  FOR EACH ROW EXECUTE PROCEDURE logging_entry_insert();
+
+CREATE TRIGGER logging_entry_attribute_insert
+  BEFORE INSERT ON logging_entry_attribute
+  FOR EACH ROW EXECUTE PROCEDURE logging_entry_attribute_insert();
+
+-- Move logging entries older than cutoff into the _old tables:
+-- whole months are re-parented, rows from before partitioning are copied.
+-- Returns the number of months archived.
+CREATE OR REPLACE FUNCTION logging_archive_before(cutoff TIMESTAMP)
+RETURNS INTEGER AS $$
+DECLARE
+  part RECORD;
+  suffix VARCHAR;
+  archived INTEGER := 0;
+BEGIN
+  FOR part IN
+    SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+     WHERE i.inhparent = 'logging_entry'::regclass
+       AND c.relname ~ '^logging_entry_[0-9]{6}$'
+  LOOP
+    suffix := substring(part.relname from '[0-9]{6}$');
+    IF to_date(suffix, 'YYYYMM') + interval '1 month' <= cutoff THEN
+      EXECUTE format('ALTER TABLE logging_entry_%s'
+                     || ' NO INHERIT logging_entry', suffix);
+      EXECUTE format('ALTER TABLE logging_entry_%s'
+                     || ' INHERIT logging_entry_old', suffix);
+      EXECUTE format('ALTER TABLE logging_entry_attribute_%s'
+                     || ' NO INHERIT logging_entry_attribute', suffix);
+      EXECUTE format('ALTER TABLE logging_entry_attribute_%s'
+                     || ' INHERIT logging_entry_attribute_old', suffix);
+      archived := archived + 1;
+    END IF;
+  END LOOP;
+
+  INSERT INTO logging_entry_old
+    SELECT * FROM ONLY logging_entry WHERE event_time < cutoff;
+  INSERT INTO logging_entry_attribute_old
+    SELECT * FROM ONLY logging_entry_attribute WHERE event_id IN
+      (SELECT id FROM ONLY logging_entry WHERE event_time < cutoff);
+  DELETE FROM ONLY logging_entry_attribute WHERE event_id IN
+    (SELECT id FROM ONLY logging_entry WHERE event_time < cutoff);
+  DELETE FROM ONLY logging_entry WHERE event_time < cutoff;
+
+  RETURN archived;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT logging_create_partition(now() at time zone 'utc');
+SELECT logging_create_partition((now() at time zone 'utc') + interval '1 month');
@@ -39,6 +39,81 @@ CREATE INDEX ma_member_attribute_index_member_id
 CREATE INDEX ma_member_attribute_name_value 
   ON ma_member_attribute (name, value);
 
+-- ----------------------------------------------------------------------
+-- Member summary table. One row per member with the attributes that
+-- lookups filter on most, pivoted out of ma_member_attribute.
+-- Maintained by trigger on ma_member_attribute; do not write directly.
+-- ----------------------------------------------------------------------
+DROP TABLE IF EXISTS ma_member_summary;
+
+CREATE TABLE ma_member_summary (
+  member_id UUID PRIMARY KEY REFERENCES ma_member (member_id),
+  urn VARCHAR,
+  email_address VARCHAR,
+  username VARCHAR,
+  eppn VARCHAR,
+  member_enabled BOOLEAN NOT NULL,
+  is_operator BOOLEAN NOT NULL
+);
+
+CREATE INDEX ma_member_summary_urn ON ma_member_summary (urn);
+
+CREATE INDEX ma_member_summary_email_address
+  ON ma_member_summary (lower(email_address));
+
+CREATE INDEX ma_member_summary_username ON ma_member_summary (username);
+
+CREATE INDEX ma_member_summary_eppn ON ma_member_summary (eppn);
+
+CREATE INDEX ma_member_summary_eppn_lower
+  ON ma_member_summary (lower(eppn));
+
+CREATE INDEX ma_member_summary_operator
+  ON ma_member_summary (member_id) WHERE is_operator;
+
+-- Recompute the summary row of a member from ma_member_attribute
+CREATE OR REPLACE FUNCTION ma_member_summary_refresh(member UUID)
+RETURNS VOID AS $$
+BEGIN
+  -- Serialize refreshes of the same member
+  PERFORM 1 FROM ma_member WHERE member_id = member FOR UPDATE;
+  DELETE FROM ma_member_summary WHERE member_id = member;
+  INSERT INTO ma_member_summary
+    SELECT member,
+           max(CASE WHEN name = 'urn' THEN value END),
+           max(CASE WHEN name = 'email_address' THEN value END),
+           max(CASE WHEN name = 'username' THEN value END),
+           max(CASE WHEN name = 'eppn' THEN value END),
+           -- Members with no member_enabled attribute are enabled
+           coalesce(max(CASE WHEN name = 'member_enabled' THEN value END),
+                    'y') = 'y',
+           coalesce(bool_or(name = 'OPERATOR'), false)
+      FROM ma_member_attribute WHERE member_id = member
+    HAVING count(*) > 0;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION ma_member_summary_update()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP <> 'INSERT' AND OLD.name IN
+      ('urn', 'email_address', 'username', 'eppn', 'member_enabled',
+       'OPERATOR') THEN
+    PERFORM ma_member_summary_refresh(OLD.member_id);
+  END IF;
+  IF TG_OP <> 'DELETE' AND NEW.name IN
+      ('urn', 'email_address', 'username', 'eppn', 'member_enabled',
+       'OPERATOR') THEN
+    PERFORM ma_member_summary_refresh(NEW.member_id);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER ma_member_summary_update
+  AFTER INSERT OR UPDATE OR DELETE ON ma_member_attribute
+  FOR EACH ROW EXECUTE PROCEDURE ma_member_summary_update();
+
 -- ----------------------------------------------------------------------
 -- Privilege table. List all available privileges.
 -- ----------------------------------------------------------------------
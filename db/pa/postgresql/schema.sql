@@ -27,6 +27,9 @@ CREATE TABLE pa_project (
 
 -- lead_id is not indexed unless we do so explicitly
 
+-- For the periodic expiration sweep
+CREATE INDEX pa_project_expired_expiration ON pa_project (expired, expiration);
+
 -- These are for common queries, but so far the DB doesn't use these. Tables too small?
 -- CREATE INDEX project_index_project_id ON pa_project (project_id);
 -- CREATE INDEX project_index_lead_project ON pa_project (lead_id, project_id);
@@ -63,8 +66,11 @@ create table pa_project_member_request (
        resolution_description VARCHAR
 );
 
--- requestor is not indexed by default
 -- Is context_id a project_id?
+CREATE INDEX pa_project_member_request_context_status
+  ON pa_project_member_request (context_id, status);
+CREATE INDEX pa_project_member_request_requestor
+  ON pa_project_member_request (requestor);
 
 -- Create table of invitations from leads to candidate members
 drop TABLE if EXISTS pa_project_member_invitation;
@@ -0,0 +1,5 @@
+-- -------------------
+-- Index project expiration for the periodic expiration sweep
+-- -------------------
+
+CREATE INDEX pa_project_expired_expiration ON pa_project (expired, expiration);
@@ -0,0 +1,9 @@
+-- -------------------
+-- Index the request predicates the PA and guards filter on most:
+-- pending requests by project and by requestor
+-- -------------------
+
+CREATE INDEX pa_project_member_request_context_status
+  ON pa_project_member_request (context_id, status);
+CREATE INDEX pa_project_member_request_requestor
+  ON pa_project_member_request (requestor);
@@ -29,7 +29,11 @@ create TABLE sa_slice (
 );
 
 CREATE INDEX sa_slice_expired ON sa_slice (expired);
--- owner_id and project_id are not indexed by default
+-- For the periodic expiration sweep
+CREATE INDEX sa_slice_expired_expiration ON sa_slice (expired, expiration);
+CREATE INDEX sa_slice_urn_expired ON sa_slice (slice_urn, expired);
+CREATE INDEX sa_slice_owner_id ON sa_slice (owner_id);
+CREATE INDEX sa_slice_project_id ON sa_slice (project_id);
 
 DROP TABLE IF EXISTS sa_slice_member CASCADE;
 CREATE TABLE sa_slice_member (
@@ -88,6 +92,7 @@ CREATE TABLE sa_sliver_info (
 );
 CREATE INDEX sa_sliver_info_urn ON sa_sliver_info(sliver_urn);
 -- slice_urn should be a value in sa_slice(slice_urn)
+CREATE INDEX sa_sliver_info_slice_urn ON sa_sliver_info (slice_urn);
 
 -- Add archiving tables sa_slice_old and sa_slice_member_old
 DROP TABLE IF EXISTS sa_slice_old CASCADE;
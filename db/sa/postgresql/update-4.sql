@@ -0,0 +1,5 @@
+-- -------------------
+-- Index slice expiration for the periodic expiration sweep
+-- -------------------
+
+CREATE INDEX sa_slice_expired_expiration ON sa_slice (expired, expiration);
@@ -0,0 +1,10 @@
+-- -------------------
+-- Index the slice predicates the SA and guards filter on most:
+-- lookups by slice URN (active first), by owner and by project,
+-- and sliver info by slice
+-- -------------------
+
+CREATE INDEX sa_slice_urn_expired ON sa_slice (slice_urn, expired);
+CREATE INDEX sa_slice_owner_id ON sa_slice (owner_id);
+CREATE INDEX sa_slice_project_id ON sa_slice (project_id);
+CREATE INDEX sa_sliver_info_slice_urn ON sa_sliver_info (slice_urn);
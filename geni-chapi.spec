@@ -176,6 +176,9 @@ rm -rf $RPM_BUILD_ROOT
 %{_datadir}/geni-ch/chapi/chapi/plugins/logging/plugin.py
 %{_datadir}/geni-ch/chapi/chapi/plugins/logging/plugin.pyc
 %{_datadir}/geni-ch/chapi/chapi/plugins/logging/plugin.pyo
+%{_datadir}/geni-ch/chapi/chapi/plugins/marm/InsideCertRenewer.py
+%{_datadir}/geni-ch/chapi/chapi/plugins/marm/InsideCertRenewer.pyc
+%{_datadir}/geni-ch/chapi/chapi/plugins/marm/InsideCertRenewer.pyo
 %{_datadir}/geni-ch/chapi/chapi/plugins/marm/MANIFEST.json
 %{_datadir}/geni-ch/chapi/chapi/plugins/marm/MAv1Guard.py
 %{_datadir}/geni-ch/chapi/chapi/plugins/marm/MAv1Guard.pyc
@@ -187,6 +190,9 @@ rm -rf $RPM_BUILD_ROOT
 %{_datadir}/geni-ch/chapi/chapi/plugins/marm/plugin.pyc
 %{_datadir}/geni-ch/chapi/chapi/plugins/marm/plugin.pyo
 %{_datadir}/geni-ch/chapi/chapi/plugins/opsmon/MANIFEST.json
+%{_datadir}/geni-ch/chapi/chapi/plugins/opsmon/Metrics.py
+%{_datadir}/geni-ch/chapi/chapi/plugins/opsmon/Metrics.pyc
+%{_datadir}/geni-ch/chapi/chapi/plugins/opsmon/Metrics.pyo
 %{_datadir}/geni-ch/chapi/chapi/plugins/opsmon/OpsMon.py
 %{_datadir}/geni-ch/chapi/chapi/plugins/opsmon/OpsMon.pyc
 %{_datadir}/geni-ch/chapi/chapi/plugins/opsmon/OpsMon.pyo
@@ -203,6 +209,9 @@ rm -rf $RPM_BUILD_ROOT
 %{_datadir}/geni-ch/chapi/chapi/plugins/pgch/plugin.py
 %{_datadir}/geni-ch/chapi/chapi/plugins/pgch/plugin.pyc
 %{_datadir}/geni-ch/chapi/chapi/plugins/pgch/plugin.pyo
+%{_datadir}/geni-ch/chapi/chapi/plugins/sarm/ExpirationSweeper.py
+%{_datadir}/geni-ch/chapi/chapi/plugins/sarm/ExpirationSweeper.pyc
+%{_datadir}/geni-ch/chapi/chapi/plugins/sarm/ExpirationSweeper.pyo
 %{_datadir}/geni-ch/chapi/chapi/plugins/sarm/MANIFEST.json
 %{_datadir}/geni-ch/chapi/chapi/plugins/sarm/SAv1Guard.py
 %{_datadir}/geni-ch/chapi/chapi/plugins/sarm/SAv1Guard.pyc
@@ -231,6 +240,12 @@ rm -rf $RPM_BUILD_ROOT
 %{_datadir}/geni-ch/chapi/chapi/tools/__init__.py
 %{_datadir}/geni-ch/chapi/chapi/tools/__init__.pyc
 %{_datadir}/geni-ch/chapi/chapi/tools/__init__.pyo
+%{_datadir}/geni-ch/chapi/chapi/tools/cache_utils.py
+%{_datadir}/geni-ch/chapi/chapi/tools/cache_utils.pyc
+%{_datadir}/geni-ch/chapi/chapi/tools/cache_utils.pyo
+%{_datadir}/geni-ch/chapi/chapi/tools/call_stats.py
+%{_datadir}/geni-ch/chapi/chapi/tools/call_stats.pyc
+%{_datadir}/geni-ch/chapi/chapi/tools/call_stats.pyo
 %{_datadir}/geni-ch/chapi/chapi/tools/cert_utils.py
 %{_datadir}/geni-ch/chapi/chapi/tools/cert_utils.pyc
 %{_datadir}/geni-ch/chapi/chapi/tools/cert_utils.pyo
@@ -255,6 +270,9 @@ rm -rf $RPM_BUILD_ROOT
 %{_datadir}/geni-ch/chapi/chapi/tools/file_checker.py
 %{_datadir}/geni-ch/chapi/chapi/tools/file_checker.pyc
 %{_datadir}/geni-ch/chapi/chapi/tools/file_checker.pyo
+%{_datadir}/geni-ch/chapi/chapi/tools/generate_dataset.py
+%{_datadir}/geni-ch/chapi/chapi/tools/generate_dataset.pyc
+%{_datadir}/geni-ch/chapi/chapi/tools/generate_dataset.pyo
 %{_datadir}/geni-ch/chapi/chapi/tools/geni_constants.py
 %{_datadir}/geni-ch/chapi/chapi/tools/geni_constants.pyc
 %{_datadir}/geni-ch/chapi/chapi/tools/geni_constants.pyo
@@ -267,12 +285,18 @@ rm -rf $RPM_BUILD_ROOT
 %{_datadir}/geni-ch/chapi/chapi/tools/install_ch
 %{_datadir}/geni-ch/chapi/chapi/tools/install_chapi
 %{_datadir}/geni-ch/chapi/chapi/tools/install_db
+%{_datadir}/geni-ch/chapi/chapi/tools/latency_stats.py
+%{_datadir}/geni-ch/chapi/chapi/tools/latency_stats.pyc
+%{_datadir}/geni-ch/chapi/chapi/tools/latency_stats.pyo
 %{_datadir}/geni-ch/chapi/chapi/tools/manage_service_attributes.py
 %{_datadir}/geni-ch/chapi/chapi/tools/manage_service_attributes.pyc
 %{_datadir}/geni-ch/chapi/chapi/tools/manage_service_attributes.pyo
 %{_datadir}/geni-ch/chapi/chapi/tools/mapped_tables.py
 %{_datadir}/geni-ch/chapi/chapi/tools/mapped_tables.pyc
 %{_datadir}/geni-ch/chapi/chapi/tools/mapped_tables.pyo
+%{_datadir}/geni-ch/chapi/chapi/tools/metrics.py
+%{_datadir}/geni-ch/chapi/chapi/tools/metrics.pyc
+%{_datadir}/geni-ch/chapi/chapi/tools/metrics.pyo
 %{_datadir}/geni-ch/chapi/chapi/tools/multiclient.py
 %{_datadir}/geni-ch/chapi/chapi/tools/multiclient.pyc
 %{_datadir}/geni-ch/chapi/chapi/tools/multiclient.pyo
@@ -283,9 +307,15 @@ rm -rf $RPM_BUILD_ROOT
 %{_datadir}/geni-ch/chapi/chapi/tools/policy_file_checker.py
 %{_datadir}/geni-ch/chapi/chapi/tools/policy_file_checker.pyc
 %{_datadir}/geni-ch/chapi/chapi/tools/policy_file_checker.pyo
+%{_datadir}/geni-ch/chapi/chapi/tools/portal_benchmark.py
+%{_datadir}/geni-ch/chapi/chapi/tools/portal_benchmark.pyc
+%{_datadir}/geni-ch/chapi/chapi/tools/portal_benchmark.pyo
 %{_datadir}/geni-ch/chapi/chapi/tools/portal_client.py
 %{_datadir}/geni-ch/chapi/chapi/tools/portal_client.pyc
 %{_datadir}/geni-ch/chapi/chapi/tools/portal_client.pyo
+%{_datadir}/geni-ch/chapi/chapi/tools/query_audit.py
+%{_datadir}/geni-ch/chapi/chapi/tools/query_audit.pyc
+%{_datadir}/geni-ch/chapi/chapi/tools/query_audit.pyo
 %{_datadir}/geni-ch/chapi/chapi/tools/testall.sh
 
 # /usr/share/geni-chapi/
@@ -311,6 +341,7 @@ rm -rf $RPM_BUILD_ROOT
 %{_datadir}/%{name}/db/logging/postgresql/update-1.sql
 %{_datadir}/%{name}/db/logging/postgresql/update-2.sql
 %{_datadir}/%{name}/db/logging/postgresql/update-3.sql
+%{_datadir}/%{name}/db/logging/postgresql/update-4.sql
 %{_datadir}/%{name}/db/ma/postgresql/data.sql
 %{_datadir}/%{name}/db/ma/postgresql/schema.sql
 %{_datadir}/%{name}/db/ma/postgresql/update-1.sql
@@ -318,6 +349,7 @@ rm -rf $RPM_BUILD_ROOT
 %{_datadir}/%{name}/db/ma/postgresql/update-3.sql
 %{_datadir}/%{name}/db/ma/postgresql/update-4.sql
 %{_datadir}/%{name}/db/ma/postgresql/update-5.sql
+%{_datadir}/%{name}/db/ma/postgresql/update-6.sql
 %{_datadir}/%{name}/db/migration/migrate-assertions.sql
 %{_datadir}/%{name}/db/migration/sliver-info.sql
 %{_datadir}/%{name}/db/pa/postgresql/schema.sql
@@ -326,11 +358,15 @@ rm -rf $RPM_BUILD_ROOT
 %{_datadir}/%{name}/db/pa/postgresql/update-3.sql
 %{_datadir}/%{name}/db/pa/postgresql/update-4.sql
 %{_datadir}/%{name}/db/pa/postgresql/update-5.sql
+%{_datadir}/%{name}/db/pa/postgresql/update-6.sql
+%{_datadir}/%{name}/db/pa/postgresql/update-7.sql
 %{_datadir}/%{name}/db/sa/postgresql/README.txt
 %{_datadir}/%{name}/db/sa/postgresql/schema.sql
 %{_datadir}/%{name}/db/sa/postgresql/update-1.sql
 %{_datadir}/%{name}/db/sa/postgresql/update-2.sql
 %{_datadir}/%{name}/db/sa/postgresql/update-3.sql
+%{_datadir}/%{name}/db/sa/postgresql/update-4.sql
+%{_datadir}/%{name}/db/sa/postgresql/update-5.sql
 %{_datadir}/%{name}/db/sr/postgresql/README.txt
 %{_datadir}/%{name}/db/sr/postgresql/schema.sql
 %{_datadir}/%{name}/db/sr/postgresql/update-1.sql
@@ -83,9 +83,14 @@ class DelegateBase(object):
         self.logger.error(traceback.format_exc())
         return {'code' :  e.code , 'value' : None, 'output' : str(e) }
         
-    def _successReturn(self, result):
-        """Assembles a GENI compliant return result for successful methods."""
-        return { 'code' :  0 , 'value' : result, 'output' : '' }
+    def _successReturn(self, result, cursor=None):
+        """Assembles a GENI compliant return result for successful methods.
+        A cursor (for the next page of a paginated lookup) is returned
+        alongside the value."""
+        ret = { 'code' :  0 , 'value' : result, 'output' : '' }
+        if cursor:
+            ret['cursor'] = cursor
+        return ret
 
     def subcall_options(self, options):
         """Generate options dictionary for subordinate calls to other
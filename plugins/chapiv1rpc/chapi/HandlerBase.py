@@ -25,12 +25,26 @@ import amsoil.core.log
 import amsoil.core.pluginmanager as pm
 from gcf.sfa.trust.certificate import Certificate
 from amsoil.core import serviceinterface
+import hashlib
 import os
 import traceback
 from Exceptions import *
+from tools.SpeaksFor import invalidate_cert_verifications
 
 xmlrpc = pm.getService('xmlrpc')
 
+# Name of the MA CRL, kept next to the MA certificate (see geni-create-ma-crl)
+MA_CRL_FILE = 'ma-crl.pem'
+
+# List of trusted root certificates with a version that changes
+# when the roots or the MA CRL change. Caches of chain verification
+# results are keyed on the version.
+class TrustedRoots(list):
+
+    def __init__(self, certs, version):
+        super(TrustedRoots, self).__init__(certs)
+        self.version = version
+
 # Base class for API handlers, which can have 
 #   plug-replaceable delegates and guards
 class HandlerBase(xmlrpc.Dispatcher):
@@ -41,21 +55,37 @@ class HandlerBase(xmlrpc.Dispatcher):
         self._delegate = None
         self._guard = None
         self._trusted_roots = None
+        self._trusted_roots_stamp = None
         self._trusted_roots = self.getTrustedRoots()
         config = pm.getService('config')
         self._maintenance_file = config.get('geni.maintenance_outage_location')
 
     # Get list of trusted roots for handler
-    # If not set, initialize from chapiv1rpc.ch_cert_root directory
+    # Initialize from chapiv1rpc.ch_cert_root directory, and reload
+    # when that directory or the MA CRL changes
     def getTrustedRoots(self):
-        if self._trusted_roots == None:
-            config = pm.getService('config')
-            trust_roots = config.get('chapiv1rpc.ch_cert_root')
-            pem_files = os.listdir(trust_roots)
+        config = pm.getService('config')
+        trust_roots = config.get('chapiv1rpc.ch_cert_root')
+        crl_file = os.path.join(os.path.dirname(config.get('chapi.ma_cert')),
+                                MA_CRL_FILE)
+        crl_mtime = None
+        if os.path.exists(crl_file):
+            crl_mtime = os.stat(crl_file).st_mtime
+        stamp = (os.stat(trust_roots).st_mtime, crl_mtime)
+        if self._trusted_roots == None or stamp != self._trusted_roots_stamp:
+            pem_files = sorted(os.listdir(trust_roots))
             pems = [open(os.path.join(trust_roots, pem_file)).read() \
                         for pem_file in pem_files \
                         if pem_file != 'CATedCACerts.pem']
-            self._trusted_roots = [Certificate(string=pem) for pem in pems]
+            version = hashlib.sha1(''.join(pems) + str(crl_mtime)).hexdigest()
+            # Drop verifications made against the old roots or CRL
+            if self._trusted_roots is not None and \
+                    version != self._trusted_roots.version:
+                invalidate_cert_verifications()
+            self._trusted_roots = \
+                TrustedRoots([Certificate(string=pem) for pem in pems],
+                             version)
+            self._trusted_roots_stamp = stamp
         return self._trusted_roots
 
     # Interfaces for setting/getting the delegate (for implementing API calls)
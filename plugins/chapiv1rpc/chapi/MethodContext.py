@@ -25,10 +25,13 @@ from tools.chapi_log import *
 from tools.cert_utils import *
 from tools.guard_utils import *
 from tools.geni_constants import *
+from tools.call_stats import get_call_instrumentation
+from tools.metrics import get_metrics_registry
 from Exceptions import *
 import amsoil.core.pluginmanager as pm
 import os
 import sys
+import time
 import traceback
 #import thread, threading
 
@@ -64,6 +67,13 @@ import traceback
 #         mc._result = self._delegate.method(arg1, arg2, arg3, mc._session)
 #  return mc._result
 
+_call_counter = get_metrics_registry().counter(
+    'chapi_calls_total', 'CHAPI calls by result code',
+    ('service', 'method', 'code'))
+_call_duration = get_metrics_registry().histogram(
+    'chapi_call_duration_seconds', 'Duration of CHAPI calls',
+    ('service', 'method'))
+
 class MethodContext:
     def __init__(self, 
                  handler, # Handler object (e.g. SliceAuthority, MemberAuthority)
@@ -87,7 +97,9 @@ class MethodContext:
         self._cert_required = cert_required
 
         # Grab the request certificate and email at initialization
+        # _client_info is the parsed client_cert (see get_cert_info)
         self._client_cert = None
+        self._client_info = None
         self._email = None
         if self._cert_required:
             self._client_cert = self._handler.requestCertificate()
@@ -96,18 +108,22 @@ class MethodContext:
 
         if self._client_cert:
             try:
-                self._email = get_email_from_cert(self._client_cert)
+                self._client_info = get_cert_info(self._client_cert)
+                self._email = self._client_info.email
             except Exception as e:
                 chapi_info("MethodContext", "Error extracting email from cert");
 
         self._error = False
 
-        # Create the session if needed
+        # The session, if needed, is created on entry, once we know
+        # who the caller is (see _createSession)
         self._db = pm.getService('chdbengine')
         self._session = session
-        if create_session and not session:
-            self._session = self._db.getSession()
+        self._create_session = create_session and not session
 
+        # Costs of this call, if instrumented (see tools/call_stats.py)
+        self._instrumentation = get_call_instrumentation()
+        self._call_stats = None
 
     def _adjustIdentity(self):
         """Adjust the identity of the caller when in the speaks-for case.
@@ -129,8 +145,18 @@ class MethodContext:
             self._client_cert = new_client_cert
             self._options = new_options
             # Extract the email from the client cert because it has changed
-            self._email = get_email_from_cert(self._client_cert)
+            self._client_info = get_cert_info(self._client_cert)
+            self._email = self._client_info.email
+
 
+    def _createSession(self):
+        """Create the session for this call if needed. Read-only calls
+        may be sent to a database replica, unless this caller has just
+        written (see CHDatabaseEngine.getSession).
+        """
+        if self._create_session:
+            self._session = self._db.getSession(read_only=self._read_only,
+                                                caller=self._email)
 
     def _checkMaintenanceMode(self):
         """Check wheter the clearinghouse is in a maintenance outage. If so,
@@ -141,7 +167,15 @@ class MethodContext:
         """
         if self._handler.maintenanceOutage():
             if self._session and self._client_cert:
-                user_urn = get_urn_from_cert(self._client_cert)
+                if not self._client_info:
+                    # The certificate could not be parsed: we can't tell
+                    # whether this is an operator, so refuse the call
+                    chapi_info("OUTAGE", "Unparseable certificate denied" +
+                               " access during maintenance outage")
+                    msg = ("Cannot access GENI Clearinghouse during"
+                           + " maintenance outage.")
+                    raise CHAPIv1AuthorizationError(msg)
+                user_urn = self._client_info.urn
                 is_operator = lookup_operator_privilege(user_urn,
                                                         self._session)
                 is_authority = lookup_authority_privilege(user_urn,
@@ -156,12 +190,15 @@ class MethodContext:
 
     # This method is called prior to the 'with MethodContext' block
     def __enter__(self):
+        self._start = time.time()
+        self._call_stats = self._instrumentation.begin(self._method_name)
         try:
             if not isinstance(self._options, dict):
                 raise CHAPIv1ArgumentError("Options argument must be dictionary")
 
             # Handle speaks-for authorization
             self._adjustIdentity()
+            self._createSession()
             # Log the invocation - after identity has been adjusted
             chapi_log_invocation(self._log_prefix,
                                  self._method_name,
@@ -188,6 +225,8 @@ class MethodContext:
             exc_type, exc_value, exc_traceback = sys.exc_info()
             self._handleError(e, exc_traceback)
         finally:
+            if self._call_stats:
+                self._call_stats.start_phase('delegate')
             return self
 
     # Handle any error in MethodContext processing 
@@ -206,6 +245,9 @@ class MethodContext:
     def __exit__(self, type, value, traceback_object):
 #        chapi_info("MC", "MC EXIT method %s user %s: On thread %d: %s. %d current threads" % (self._method_name, self._email, thread.get_ident(), threading.current_thread(), threading.active_count()))
 #        chapi_info("MethodContext", "__exit__ %s %s %s" % (type, value, traceback_object))
+        if self._call_stats:
+            self._call_stats.start_phase('commit')
+
         # If there is an error, handle in standard way (setting result and error)
         if type:
             self._handleError(value, traceback_object)
@@ -218,6 +260,7 @@ class MethodContext:
                         self._session.rollback()
                     else:
                         self._session.commit()
+                        self._db.recordWrite(self._email)
                 self._session.close()
             except Exception as db_error:
                 # We got an error committing, rolling back or closing session
@@ -233,6 +276,16 @@ class MethodContext:
                     self._handleError(db_error, exc_traceback)
                 
 
+        code = None
+        if isinstance(self._result, dict):
+            code = self._result.get('code')
+        _call_counter.inc((self._log_prefix, self._method_name, code))
+        _call_duration.observe((self._log_prefix, self._method_name),
+                               time.time() - self._start)
+        if self._call_stats:
+            self._instrumentation.end(self._call_stats, self._error,
+                                      self._log_prefix, self._email)
+
         # Log the result
         chapi_log_result(self._log_prefix, self._method_name,
                          self._result, {'user': self._email})
@@ -33,7 +33,7 @@ from chapi.Exceptions import *
 import types
 from ABAC import *
 from tools.SpeaksFor import determine_speaks_for
-from tools.ABACManager import ABACManager
+from tools.call_stats import count_abac_query
 from ArgumentCheck import *
 from tools.geni_constants import *
 from tools.geni_utils import *
@@ -42,6 +42,7 @@ import amsoil.core.pluginmanager as pm
 from tools.chapi_log import *
 from tools.mapped_tables import MemberAttribute
 import logging
+import re
 from tools import MA_constants
 import time
 
@@ -97,6 +98,15 @@ class SubjectInvocationCheck(InvocationCheck):
         self.authority = guard.authority
         self._verbose = False # Set this to True for verbose output
 
+        # Compile the templates once: statements without variables go
+        # into a static link table shared by all calls; the rest are
+        # split into literal text and bindings to be filled per subject
+        self._bindings = {}
+        self._static_links = {}
+        self._compiled_assertions = \
+            self._compile_statements(self._assertions)
+        self._compiled_policies = self._compile_statements(self._policies)
+
     # All recognized binding types (variables that can be
     # substituted in assertions and policies)
     RECOGNIZED_BINDINGS = ["$ROLE", "$SLICE", "$PROJECT", \
@@ -115,15 +125,33 @@ class SubjectInvocationCheck(InvocationCheck):
                                "$KEY_OWNER"]
 
     
-    # Gather all bindings in the given ABAC template (policy or assertion)
-    # That is, see which of the RECOGNIZED BINDINGS are in the template
-    # And set these in the provided bindings variable
-    # These are the ones we'll seek to resolve for each subject
-    def _gather_bindings(self, template, bindings):
-        for recognized_binding in SubjectInvocationCheck.RECOGNIZED_BINDINGS:
-            if template.find(recognized_binding) > 0:
-                if recognized_binding not in bindings:
-                    bindings[recognized_binding] = None
+    # Pattern splitting a template into literal text and bindings
+    # Longest names first, so $PROJECT_LEAD is not read as $PROJECT
+    BINDING_PATTERN = re.compile("(%s)" % "|".join(\
+            [re.escape(b) for b in sorted(RECOGNIZED_BINDINGS, key=len,
+                                          reverse=True)]))
+
+    # Compile a list of ABAC templates (policies or assertions)
+    # Statements with no variables are added to the static links.
+    # Return list of (parts, binding_names) for the others, where parts
+    # alternates literal text (even indices) and binding names (odd).
+    # The binding names are gathered into self._bindings: these are
+    # the ones we'll seek to resolve for each subject
+    def _compile_statements(self, statements):
+        compiled = []
+        for stmt in statements:
+            parts = SubjectInvocationCheck.BINDING_PATTERN.split(stmt)
+            if "$" in "".join(parts[0::2]):
+                # Unrecognized variable: can never be bound
+                continue
+            binding_names = parts[1::2]
+            if not binding_names:
+                ABACRoleGraph.add_link(self._static_links, stmt)
+                continue
+            for binding_name in binding_names:
+                self._bindings[binding_name] = None
+            compiled.append((parts, set(binding_names)))
+        return compiled
 
     # Compute the subjects of a given call from call arguments and options
     # The 'subjects' are the entities on our about the call operates and
@@ -375,238 +403,282 @@ class SubjectInvocationCheck(InvocationCheck):
 
     # Generate groups of assertions into a single label
     # e.g. BELONGS_TO means IS_LEAD, IS_ADMIN, ....
-    def _generate_assertion_groups(self, subject_type, subject, abac_manager):
+    def _generate_assertion_groups(self, subject_type, subject, role_graph):
         if subject_type in ['SLICE_URN', 'PROJECT_URN']:
             for role, role_name in attribute_type_names.items():
                 assertion = "ME.BELONGS_TO_%s<-ME.IS_%s_%s" % \
                     (flatten_urn(subject), role_name, flatten_urn(subject))
-                abac_manager.register_assertion(assertion)
+                role_graph.register_assertion(assertion)
 
-    # Determine, for a set of subjects of a particular type, which
-    # subjects have bindings for each binding gathered from the
-    # policies and assertions of the invoked method
+    # Determine, for all subjects of the call, which subjects have
+    # bindings for each binding gathered from the policies and
+    # assertions of the invoked method
+    #
+    # Bindings that need the database are planned as a set of
+    # (label, subject, value) SELECTs, one per binding and subject type,
+    # and run as a single UNION ALL query. The others are computed
+    # from the call itself.
     #
-    # Loop over all bindings and do a query over all subjects to 
-    # determine which subjects have the given attribute relative to the caller
-    # and set these in bindings_by_subject
-    # That is, bindings_by_subject (the return of this call)
-    # is a dictionary of (subject => {binding_name : binding_value...)
+    # Return a fact table of subject_type => (subject => 
+    #    {binding_name : binding_value...})
     # for each binding_name that is determined to have a value (otherwise
-    # the dictionary has no entry for that binding
-    def _generate_bindings_for_subjects(self, caller_urn, subject_type, 
-                                        subjects, bindings,
-                                        options, arguments, session):
-
-        authority = self.authority
-
-#        chapi_info('gen_bindings', 
-#                   "Subject Type: %s; bindings: %s; subjects: %s" % \
-#                       (subject_type, bindings, subjects))
+    # the dictionary has no entry for that binding)
+    def _generate_bindings(self, caller_urn, subjects, bindings,
+                           options, arguments, session):
 
         # Prepare a set of bindings (label => value) for each subject
-        bindings_by_subject = {}
-        for subject in subjects: 
-            bindings_by_subject[subject] = {}
+        facts = {}
+        for subject_type, subjects_of_type in subjects.items():
+            facts[subject_type] = {}
+            for subject in subjects_of_type:
+                facts[subject_type][subject] = {}
 
         if self._verbose:
             chapi_info("ABAC", "BINDINGS = %s" % bindings)
 
-        for binding in bindings:
-            if binding == "$ROLE":
-                if subject_type == "SLICE_URN":
-                    rows = get_slice_role_for_member(caller_urn, \
-                                                         subjects, session)
-                    for row in rows:
-                        role = row.role
-                        role_name = attribute_type_names[role]
-                        subject = row.slice_urn
-                        bindings_by_subject[subject][binding] = role_name
-                elif subject_type == "PROJECT_URN":
-                    rows = get_project_role_for_member(caller_urn, \
-                                                            subjects, session)
-                    for row in rows:
-                        role = row.role
-                        role_name = attribute_type_names[role]
-                        project_name = row.project_name
-                        subject = to_project_urn(authority, project_name)
-                        bindings_by_subject[subject][binding] = role_name
+        fact_queries = []
+        for subject_type, subjects_of_type in subjects.items():
+            if len(subjects_of_type) == 0:
+                continue
+            subject_facts = facts[subject_type]
+            for binding in bindings:
+                if binding in SubjectInvocationCheck.SUBJECT_BINDINGS:
+                    if subject_type == \
+                            SubjectInvocationCheck.SUBJECT_BINDINGS[binding]:
+                        for subject in subjects_of_type:
+                            subject_facts[subject][binding] = subject
+                elif binding == "$SELF":
+                    for subject in subjects_of_type:
+                        subject_facts[subject][binding] = caller_urn
+                elif binding == "$SEARCHING_BY_EMAIL":
+                    # Is this a lookup by email address?
+                    # Specifically, project leads/admins should be allowed 
+                    # to look up member info for members not in their 
+                    # project by email address, to support adding members 
+                    # by email address
+                    if 'match' in options and \
+                            'MEMBER_EMAIL' in options['match']:
+                        for subject in subjects_of_type:
+                            subject_facts[subject][binding] = \
+                                "SEARCHING_BY_EMAIL"
                 else:
-                    # Can't compute role for other than slice/project
-                    continue
-
-            elif binding == "$SLICE":
-                if subject_type == "SLICE_URN":
-                    for subject in subjects: 
-                        bindings_by_subject[subject][binding]=subject
-            elif binding == "$PROJECT":
-                if subject_type == "PROJECT_URN":
-                    for subject in subjects: 
-                        bindings_by_subject[subject][binding]=subject
-            elif binding == "$MEMBER":
-                if subject_type == "MEMBER_URN":
-                    for subject in subjects: 
-                        bindings_by_subject[subject][binding]=subject
-            elif binding == "$SELF":
-                for subject in subjects:
-                    bindings_by_subject[subject][binding]=caller_urn
-            elif binding == "$SHARES_SLICE":
-                if subject_type == "MEMBER_URN":
-                    sharers = shares_slice(caller_urn, subjects, session)
-                    for sharer in sharers:
-                        bindings_by_subject[sharer][binding] = "SHARES_SLICE"
-            elif binding == "$SHARES_PROJECT":
-                if subject_type == "MEMBER_URN":
-                    sharers = shares_project(caller_urn, subjects, session)
-                    for sharer in sharers:
-                        bindings_by_subject[sharer][binding] = "SHARES_PROJECT"
-            elif binding == "$PROJECT_LEAD":
-                # Fill in this binding if the _caller_ is a project lead 
-                # on some project.
-                # Use this EG so a project lead/admin can look up details of 
-                # people they want to add to a project
-                leads = has_role_on_some_project([caller_urn], LEAD_ATTRIBUTE,
-                                                 session)
-                if caller_urn in leads:
-                    for subject in subjects:
-                        bindings_by_subject[subject][binding] = "PROJECT_LEAD"
-            elif binding == "$PROJECT_ADMIN":
-                # Fill in this binding if the _caller_ is a project admin 
-                # on some project.
-                # Use this EG so a project lead/admin can look up details of 
-                # people they want to add to a project
-                admins = has_role_on_some_project([caller_urn], 
-                                                  ADMIN_ATTRIBUTE,
-                                                  session)
-                if caller_urn in admins:
-                    for subject in subjects:
-                        bindings_by_subject[subject][binding] = "PROJECT_ADMIN"
-            elif binding == "$SHARES_ATTRIBUTED_PROJECT":
-                if subject_type == "MEMBER_URN" and \
-                        'attributes' in arguments and \
-                        'PROJECT' in arguments['attributes']:
-                    project_uid = arguments['attributes']['PROJECT']
-                    # Which callers share this project with caller?
-                    sharers = shares_project(caller_urn, 
-                                            subjects, 
-                                            session, 
-                                            project_uid = project_uid)
-                    for sharer in sharers:
-                        bindings_by_subject[sharer][binding] = \
-                            "SHARES_ATTRIBUTED_PROJECT"
-            elif binding == "$SHARES_ATTRIBUTED_SLICE":
-                if subject_type == "MEMBER_URN" and \
-                        'attributes' in arguments and \
-                        'SLICE' in arguments['attributes']:
-                    slice_uid = arguments['attributes']['SLICE']
-                    # Which callers share this slice with caller?
-                    sharers = shares_slice(caller_urn, 
-                                           subjects, 
-                                           session, slice_uid=slice_uid)
-                    for sharer in sharers:
-                        bindings_by_subject[sharer][binding] = \
-                            "SHARES_ATTRIBUTED_SLICE"
-            elif binding == "$SEARCHING_BY_EMAIL":
-                # Is this a lookup by email address?
-                # Specifically, project leads/admins should be allowed to look
-                # up member info for members not in their project by 
-                # email address, to support adding members by email address
-                if 'match' in options and 'MEMBER_EMAIL' in options['match']:
-                    for subject in subjects:
-                        bindings_by_subject[subject][binding] = \
-                            "SEARCHING_BY_EMAIL"
-            elif binding == "$SEARCHING_FOR_PROJECT_LEAD_BY_UID":
-                if 'match' in options and 'MEMBER_UID' in options['match']:
-                    leads = \
-                        has_role_on_some_project(subjects, LEAD_ATTRIBUTE,\
-                                                     session)
-                    for lead in leads:
-                        bindings_by_subject[lead][binding] = \
-                            "SEARCHING_FOR_PROJECT_LEAD_BY_UID"
-            elif binding == "$PENDING_REQUEST_TO_MEMBER":
-
-                # This means I have a pending request to one of these people
-                # Meaning the request is created by me
-                # and is on a project of which they are lead or admin
-                if subject_type == "MEMBER_URN":
-                    leads = \
-                        has_pending_request_on_project_lead_by(subjects, 
-                                                               [caller_urn], 
-                                                               True,
-                                                               session)
-                    for lead in leads:
-                        bindings_by_subject[lead][binding] = \
-                            "PENDING_REQUEST_TO_MEMBER"
-
-            elif binding == "$PENDING_REQUEST_FROM_MEMBER":
-
-                # This means I have a pending request from one of these people
-                # Meaning the request is created by me
-                # and is on a project of which they are lead or admin
-                if subject_type == "MEMBER_URN":
-                    requestors = \
-                        has_pending_request_on_project_lead_by([caller_urn],  
-                                                               subjects, 
-                                                               False,
-                                                               session)
-                    for requestor in requestors:
-                        bindings_by_subject[requestor][binding] = \
-                            "PENDING_REQUEST_FROM_MEMBER"
-
-
-            elif binding == "$REQUEST_ID":
-                if subject_type == "REQUEST_ID":
-                    for subject in subjects:
-                        bindings_by_subject[subject][binding] = subject
-            elif binding == "$REQUEST_ROLE":
-                if subject_type == "REQUEST_ID":
-                    for subject in subjects:
-                        project_urn = \
-                            get_project_request_project_urn(subject, session)
-                        if project_urn is not None:
-                            rows = get_project_role_for_member(caller_urn, 
-                                                               project_urn, 
-                                                               session)
-                            if len(rows) > 0:
-                                role = rows[0].role
-                                role_name = attribute_type_names[role]
-                                bindings_by_subject[subject][binding] = \
-                                    role_name
-            elif binding == "$REQUESTOR":
-                if subject_type == "REQUEST_ID":
-                    for subject in subjects:
-                        requestor_urn = \
-                            get_project_request_requestor_urn(subject,session) 
-                        if caller_urn == requestor_urn:
-                            bindings_by_subject[subject][binding] = "REQUESTOR"
-
-            elif binding == "$KEY_OWNER":
-                if subject_type == "KEY_ID":
-                    for subject in subjects:
-                        key_owner_urn = get_key_owner_urn(subject, session);
-                        if caller_urn == key_owner_urn:
-                            bindings_by_subject[subject][binding] = caller_urn
-
-        return bindings_by_subject
-
-    # Iterate over a list of templated statements (policies or assertions)
-    # Try to replace all template variables (beginning with $) with 
-    # provided bindings. If all template variables are replaced, make
-    # an ABAC assertion for that statement.
-    def _assert_bound_statements(self, abac_manager, statements, bindings):
-        for stmt in statements:
-            orig_stmt = stmt
-            for binding_name, binding_value in bindings.items():
-                if binding_value:
-                    stmt = stmt.replace(binding_name, 
-                                        flatten_urn(binding_value))
-            if stmt.find('$')<0:
-                abac_manager.register_assertion(stmt)
+                    fact_query = self._plan_binding_query(caller_urn,
+                                                          subject_type,
+                                                          subjects_of_type,
+                                                          binding, options,
+                                                          arguments)
+                    if fact_query is not None:
+                        fact_queries.append(fact_query)
+
+        if len(fact_queries) == 0:
+            return facts
+
+        # Index subjects by string form: IDs come back from SQL as text
+        subjects_by_key = {}
+        for subject_type, subjects_of_type in subjects.items():
+            for subject in subjects_of_type:
+                subjects_by_key[(subject_type, str(subject))] = subject
+
+        rows = session.execute(union_all(*fact_queries)).fetchall()
+        for row in rows:
+            subject_type, binding = row.label.split(' ')
+            value = row.value
+            if binding in ["$PROJECT_LEAD", "$PROJECT_ADMIN"]:
+                # A fact about the caller, applying to every subject
+                for subject in facts[subject_type]:
+                    facts[subject_type][subject][binding] = value
+                continue
+            if binding == "$ROLE" and subject_type == "PROJECT_URN":
+                subject = to_project_urn(self.authority, row.subject)
             else:
-#                chapi_info("ABACGuard", 
-#                           "Statement with unbound variables: %s => %s" % \
-#                               (orig_stmt, stmt))
-                pass
-        
+                subject = subjects_by_key.get((subject_type, row.subject))
+            if subject not in facts[subject_type]:
+                continue
+            if binding in ["$ROLE", "$REQUEST_ROLE"]:
+                value = attribute_type_names[int(value)]
+            facts[subject_type][subject][binding] = value
+
+        return facts
+
+    # Bindings whose value is the subject itself, by subject type
+    SUBJECT_BINDINGS = {"$SLICE" : "SLICE_URN",
+                        "$PROJECT" : "PROJECT_URN",
+                        "$MEMBER" : "MEMBER_URN",
+                        "$REQUEST_ID" : "REQUEST_ID"}
+
+    # Return a SELECT of (label, subject, value) rows giving the value of
+    # a binding for those subjects (of given type) that have one,
+    # or None if the binding can't apply to these subjects
+    def _plan_binding_query(self, caller_urn, subject_type, subjects,
+                            binding, options, arguments):
+        db = pm.getService('chdbengine')
+        label = "%s %s" % (subject_type, binding)
+        ms1 = db.MEMBER_SUMMARY_TABLE.alias()
+        ms2 = db.MEMBER_SUMMARY_TABLE.alias()
+        caller_is_ms1 = ms1.c.urn == caller_urn
+
+        def fact(subject, value, *whereclauses):
+            return select([cast(literal(label), String).label('label'),
+                           cast(subject, String).label('subject'),
+                           cast(value, String).label('value')],
+                          and_(*whereclauses))
+
+        if binding == "$ROLE":
+            if subject_type == "SLICE_URN":
+                sm = db.SLICE_MEMBER_TABLE
+                st = db.SLICE_TABLE
+                return fact(st.c.slice_urn, sm.c.role,
+                            sm.c.slice_id == st.c.slice_id,
+                            ms1.c.member_id == sm.c.member_id,
+                            st.c.slice_urn.in_(subjects),
+                            caller_is_ms1)
+            elif subject_type == "PROJECT_URN":
+                project_names = \
+                    [get_name_from_urn(subject) for subject in subjects]
+                pmt = db.PROJECT_MEMBER_TABLE
+                pt = db.PROJECT_TABLE
+                return fact(pt.c.project_name, pmt.c.role,
+                            pmt.c.project_id == pt.c.project_id,
+                            pt.c.project_name.in_(project_names),
+                            ms1.c.member_id == pmt.c.member_id,
+                            caller_is_ms1)
+
+        elif binding in ["$SHARES_SLICE", "$SHARES_ATTRIBUTED_SLICE"]:
+            if subject_type != "MEMBER_URN":
+                return None
+            st = db.SLICE_TABLE
+            sm1 = db.SLICE_MEMBER_TABLE.alias()
+            sm2 = db.SLICE_MEMBER_TABLE.alias()
+            whereclauses = [st.c.slice_id == sm1.c.slice_id,
+                            st.c.expired == False,
+                            sm1.c.slice_id == sm2.c.slice_id,
+                            sm1.c.member_id == ms1.c.member_id,
+                            sm2.c.member_id == ms2.c.member_id,
+                            caller_is_ms1,
+                            ms2.c.urn.in_(subjects)]
+            if binding == "$SHARES_ATTRIBUTED_SLICE":
+                if 'attributes' not in arguments or \
+                        'SLICE' not in arguments['attributes']:
+                    return None
+                slice_uid = arguments['attributes']['SLICE']
+                whereclauses.append(sm1.c.slice_id == slice_uid)
+            return fact(ms2.c.urn, literal(binding[1:]), *whereclauses)
+
+        elif binding in ["$SHARES_PROJECT", "$SHARES_ATTRIBUTED_PROJECT"]:
+            if subject_type != "MEMBER_URN":
+                return None
+            pm1 = db.PROJECT_MEMBER_TABLE.alias()
+            pm2 = db.PROJECT_MEMBER_TABLE.alias()
+            whereclauses = [pm1.c.project_id == pm2.c.project_id,
+                            pm1.c.member_id == ms1.c.member_id,
+                            pm2.c.member_id == ms2.c.member_id,
+                            caller_is_ms1,
+                            ms2.c.urn.in_(subjects)]
+            if binding == "$SHARES_ATTRIBUTED_PROJECT":
+                if 'attributes' not in arguments or \
+                        'PROJECT' not in arguments['attributes']:
+                    return None
+                project_uid = arguments['attributes']['PROJECT']
+                whereclauses.append(pm1.c.project_id == project_uid)
+            return fact(ms2.c.urn, literal(binding[1:]), *whereclauses)
+
+        elif binding in ["$PROJECT_LEAD", "$PROJECT_ADMIN"]:
+            # Fill in this binding if the _caller_ is a project lead/admin 
+            # on some project.
+            # Use this EG so a project lead/admin can look up details of 
+            # people they want to add to a project
+            role = LEAD_ATTRIBUTE
+            if binding == "$PROJECT_ADMIN": role = ADMIN_ATTRIBUTE
+            pmt = db.PROJECT_MEMBER_TABLE
+            return fact(ms1.c.urn, literal(binding[1:]),
+                        ms1.c.member_id == pmt.c.member_id,
+                        pmt.c.role == role,
+                        caller_is_ms1).distinct()
+
+        elif binding == "$SEARCHING_FOR_PROJECT_LEAD_BY_UID":
+            if 'match' not in options or 'MEMBER_UID' not in options['match']:
+                return None
+            pmt = db.PROJECT_MEMBER_TABLE
+            return fact(ms1.c.urn, literal(binding[1:]),
+                        ms1.c.member_id == pmt.c.member_id,
+                        pmt.c.role == LEAD_ATTRIBUTE,
+                        ms1.c.urn.in_(subjects))
+
+        elif binding in ["$PENDING_REQUEST_TO_MEMBER", 
+                         "$PENDING_REQUEST_FROM_MEMBER"]:
+            # TO: I have a pending request to one of these people
+            # (they are lead or admin of the project I asked to join)
+            # FROM: one of these people has a pending request to me
+            # (I am lead or admin of the project they asked to join)
+            if subject_type != "MEMBER_URN":
+                return None
+            if binding == "$PENDING_REQUEST_TO_MEMBER":
+                lead_urns = subjects
+                requestor_urns = [caller_urn]
+                subject_column = ms1.c.urn
+            else:
+                lead_urns = [caller_urn]
+                requestor_urns = subjects
+                subject_column = ms2.c.urn
+            prt = db.PROJECT_REQUEST_TABLE
+            pmt = db.PROJECT_MEMBER_TABLE
+            return fact(subject_column, literal(binding[1:]),
+                        pmt.c.member_id == ms1.c.member_id,
+                        prt.c.requestor == ms2.c.member_id,
+                        ms1.c.urn.in_(lead_urns),
+                        ms2.c.urn.in_(requestor_urns),
+                        prt.c.context_id == pmt.c.project_id,
+                        pmt.c.role.in_([LEAD_ATTRIBUTE, ADMIN_ATTRIBUTE]),
+                        prt.c.status == PENDING_STATUS)
+
+        elif binding == "$REQUEST_ROLE":
+            # Caller's role on the project of the request
+            if subject_type != "REQUEST_ID":
+                return None
+            prt = db.PROJECT_REQUEST_TABLE
+            pmt = db.PROJECT_MEMBER_TABLE
+            return fact(prt.c.id, pmt.c.role,
+                        prt.c.id.in_(subjects),
+                        prt.c.context_id == pmt.c.project_id,
+                        pmt.c.member_id == ms1.c.member_id,
+                        caller_is_ms1)
+
+        elif binding == "$REQUESTOR":
+            if subject_type != "REQUEST_ID":
+                return None
+            prt = db.PROJECT_REQUEST_TABLE
+            return fact(prt.c.id, literal("REQUESTOR"),
+                        prt.c.id.in_(subjects),
+                        prt.c.requestor == ms1.c.member_id,
+                        caller_is_ms1)
+
+        elif binding == "$KEY_OWNER":
+            if subject_type != "KEY_ID":
+                return None
+            kt = db.SSH_KEY_TABLE
+            return fact(kt.c.id, ms1.c.urn,
+                        kt.c.id.in_(subjects),
+                        kt.c.member_id == ms1.c.member_id,
+                        caller_is_ms1)
+
+        return None
+
+    # Iterate over a list of compiled statements (policies or assertions)
+    # If all template variables of a statement have provided bindings,
+    # make an ABAC assertion for that statement.
+    def _assert_bound_statements(self, role_graph, statements, bindings):
+        for parts, binding_names in statements:
+            bound = True
+            for binding_name in binding_names:
+                if not bindings.get(binding_name):
+                    bound = False
+                    break
+            if not bound:
+                continue
+            stmt_parts = list(parts)
+            for i in range(1, len(stmt_parts), 2):
+                stmt_parts[i] = flatten_urn(bindings[stmt_parts[i]])
+            role_graph.register_assertion("".join(stmt_parts))
 
     # Check that there are subjects in the arguments if required
     # Return the list of subjects for later authorization
@@ -639,33 +711,19 @@ class SubjectInvocationCheck(InvocationCheck):
     def authorize_call(self, client_cert, method, credentials, options, \
                            arguments, subjects, session):
 
-        bindings = {}
-        # Gather all required bindings
-        for assertion in self._assertions:
-            self._gather_bindings(assertion, bindings)
-        for policy in self._policies:
-            self._gather_bindings(policy, bindings)
-
-
-        abac_manager =  ABACManager(certs_by_name = {"CALLER" : client_cert}, 
-                                    cert_files_by_name = \
-                                        {"ME" : self.cert_file}, 
-                                    key_files_by_name = \
-                                        {"ME" : self.key_file},
-                                    manage_context = False)
-        if self._verbose:
-            abac_manager._verbose = True
+        bindings = self._bindings
+        role_graph = ABACRoleGraph("CALLER", self._static_links)
 
         client_urn = get_urn_from_cert(client_cert)
 
         # Generate context-free assertions for caller
         if lookup_operator_privilege(client_urn, session):
-            abac_manager.register_assertion("ME.IS_OPERATOR<-CALLER")
+            role_graph.register_assertion("ME.IS_OPERATOR<-CALLER")
         if lookup_pi_privilege(client_urn, session):
-            abac_manager.register_assertion("ME.IS_PI<-CALLER")
+            role_graph.register_assertion("ME.IS_PI<-CALLER")
         if lookup_authority_privilege(client_urn, session):
-            abac_manager.register_assertion("ME.IS_AUTHORITY<-CALLER")
-        abac_manager.register_assertion("ME.IS_%s<-CALLER" % \
+            role_graph.register_assertion("ME.IS_AUTHORITY<-CALLER")
+        role_graph.register_assertion("ME.IS_%s<-CALLER" % \
                                             flatten_urn(client_urn))
 
         if self._verbose:
@@ -683,26 +741,24 @@ class SubjectInvocationCheck(InvocationCheck):
         #   or ME.MAY_$METHOD_$SUBJECT<-CALLER
         # Give exception on any failure, success if all pass
         if subjects and len(subjects) > 0:
+            facts = self._generate_bindings(client_urn, subjects, bindings,
+                                            options, arguments, session)
             for subject_type, subjects_of_type in subjects.items():
-                subjects_bindings = \
-                    self._generate_bindings_for_subjects(client_urn, 
-                                                         subject_type, 
-                                                         subjects_of_type, 
-                                                         bindings,
-                                                         options, arguments,
-                                                         session)
+                subjects_bindings = facts[subject_type]
                 if self._verbose:
                     chapi_info("ABAC", "SUBJECT_BINDINGS = %s : %s" % \
                                    (subjects_of_type, subjects_bindings))
 
                 for subject in subjects_of_type:
                     self._generate_assertion_groups(subject_type, subject, \
-                                                        abac_manager)
+                                                        role_graph)
                     subjbindings = subjects_bindings[subject]
                     
-                    self._assert_bound_statements(abac_manager,
-                                                  self._assertions, subjbindings)
-                    self._assert_bound_statements(abac_manager, self._policies,
+                    self._assert_bound_statements(role_graph,
+                                                  self._compiled_assertions,
+                                                  subjbindings)
+                    self._assert_bound_statements(role_graph,
+                                                  self._compiled_policies,
                                                   subjbindings)
 
                     queries = [
@@ -712,8 +768,8 @@ class SubjectInvocationCheck(InvocationCheck):
                         ]
                     one_succeeded = False
                     for query in queries:
-                        ok, proof = abac_manager.query(query)
-                        if abac_manager._verbose:
+                        ok, proof = role_graph.query(query)
+                        if self._verbose:
                             chapi_audit_and_log("ABAC", 
                                                 "Test ABAC query %s OK = %s"% \
                                                     (query, ok), logging.DEBUG)
@@ -729,24 +785,21 @@ class SubjectInvocationCheck(InvocationCheck):
                                                              queries));
 
         else:
-            subject_type = 'MEMBER_URN'
-            subjects_of_type = [client_urn]
-            subjects_bindings \
-                = self._generate_bindings_for_subjects(client_urn,
-                                                       subject_type,
-                                                       subjects_of_type,
-                                                       bindings,
-                                                       options,
-                                                       arguments,
-                                                       session)
+            facts = self._generate_bindings(client_urn,
+                                            {'MEMBER_URN' : [client_urn]},
+                                            bindings, options, arguments,
+                                            session)
+            subjects_bindings = facts['MEMBER_URN']
             subjbindings = subjects_bindings[client_urn]
-            self._assert_bound_statements(abac_manager, self._assertions,
+            self._assert_bound_statements(role_graph,
+                                          self._compiled_assertions,
                                           subjbindings)
-            self._assert_bound_statements(abac_manager, self._policies,
+            self._assert_bound_statements(role_graph,
+                                          self._compiled_policies,
                                           subjbindings)
             query ="ME.MAY_%s<-CALLER" % method.upper()
-            ok, proof = abac_manager.query(query)
-            if abac_manager._verbose:
+            ok, proof = role_graph.query(query)
+            if self._verbose:
                 chapi_audit_and_log("ABAC", "Test ABAC query %s OK = %s" % \
                                         (query, ok), logging.DEBUG)
             if not ok:
@@ -757,6 +810,64 @@ class SubjectInvocationCheck(InvocationCheck):
                                                      arguments, query));
 
 
+# A graph of ABAC links (X<-Y: Y gets role X), answering queries of the
+# form X<-ROOT. The set of nodes reachable from ROOT is maintained as
+# links are registered, so each query is a set lookup.
+# Links may be seeded from a shared, read-only static link table.
+class ABACRoleGraph(object):
+
+    def __init__(self, root, static_links={}):
+        self._root = root
+        self._static_links = static_links
+        self._links = {}
+        self._reached = set([root])
+        self._reach_from(root)
+
+    # Add link X<-Y to given table of Y => set of X
+    # Return True if link is new
+    @staticmethod
+    def add_link(links, assertion):
+        parts = assertion.split('<-')
+        subject_role = parts[0]
+        principal = parts[1]
+        if principal not in links: links[principal] = set()
+        if subject_role in links[principal]:
+            return False
+        links[principal].add(subject_role)
+        return True
+
+    def register_assertion(self, assertion):
+        if ABACRoleGraph.add_link(self._links, assertion):
+            parts = assertion.split('<-')
+            if parts[1] in self._reached and parts[0] not in self._reached:
+                self._reached.add(parts[0])
+                self._reach_from(parts[0])
+
+    # Can we prove query statement Q (X<-target)?
+    # Return ok, proof (no proof is generated)
+    def query(self, query_expression):
+        count_abac_query()
+        parts = query_expression.split('<-')
+        if parts[1] == self._root:
+            return parts[0] in self._reached, None
+        return parts[0] in self._reachable(parts[1], set()), None
+
+    # Add everything reachable from node to the root's reached set
+    def _reach_from(self, node):
+        self._reachable(node, self._reached)
+
+    # Add all nodes reachable (by at least one link) from node to visited
+    def _reachable(self, node, visited):
+        pending = [node]
+        while pending:
+            current = pending.pop()
+            for links in (self._static_links, self._links):
+                for next_node in links.get(current, ()):
+                    if next_node not in visited:
+                        visited.add(next_node)
+                        pending.append(next_node)
+        return visited
+
 class RowCheck(object):
     def permit(self, client_cert, credentials, urn):
         raise CHAPIv1NotImplementedError("Abstract Base class: RowCheck")
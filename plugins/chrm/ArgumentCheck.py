@@ -26,6 +26,7 @@ from gcf.geni.util.urn_util import is_valid_urn
 from tools.geni_constants import *
 from gcf.sfa.trust.certificate import Certificate
 from tools.chapi_log import *
+from tools.dbutils import unpack_page_options
 import types
 import uuid
 import dateutil.parser
@@ -304,6 +305,7 @@ class FieldsArgumentCheck(ArgumentCheck):
 
 # Lookup - 'match' [{FIELD : VALUE], {FIELD : VALUE} ...]
 #        - 'filter' [FIELD, FIELD, FIELD]
+#        - 'limit' N, 'cursor' TOKEN (optional, see dbutils.PagedQuery)
 class LookupArgumentCheck(FieldsArgumentCheck):
 
     def __init__(self, mandatory_fields, supplemental_fields, matchable = []):
@@ -319,8 +321,12 @@ class LookupArgumentCheck(FieldsArgumentCheck):
         if 'filter' in options:
             self.validateFieldList(options['filter'])
 
+        # 'limit' and 'cursor'
+        unpack_page_options(options)
+
 # Lookup - 'match' [{FIELD : VALUE], {FIELD : VALUE} ...]
 #        - 'filter' [FIELD, FIELD, FIELD]
+#        - 'limit' N, 'cursor' TOKEN (optional, see dbutils.PagedQuery)
 class LookupArgumentCheckMatchOptional(FieldsArgumentCheck):
 
     def __init__(self, mandatory_fields, supplemental_fields, matchable = None):
@@ -336,6 +342,9 @@ class LookupArgumentCheckMatchOptional(FieldsArgumentCheck):
         if 'filter' in options:
             self.validateFieldList(options['filter'])
 
+        # 'limit' and 'cursor'
+        unpack_page_options(options)
+
 # Create - 'fields' [{FIELD : VALUE], {FIELD : VALUE} ...]
 # Make sure that all other fields are {"Create" : "Allowed"}
 # Make sure all required fields in the object spec are present
@@ -23,9 +23,17 @@
 
 import amsoil.core.pluginmanager as pm
 from sqlalchemy import *
+from sqlalchemy import event, exc
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import QueuePool
 import logging
+import threading
+import time
+from tools.chapi_log import *
+from tools.query_audit import QueryCapture
+from tools.call_stats import install_sql_timing
+from tools.metrics import get_metrics_registry
 
 Base = declarative_base()
 
@@ -36,6 +44,68 @@ class Aggregate(Base):
     slice_urn = Column(String)
     aggregate_url = Column(String)
 
+# Warn when waiting this long (seconds) for a pooled connection
+SLOW_CHECKOUT_SECS = 1.0
+
+# Counters for connection checkouts from a pool
+class PoolStatistics:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record_checkout(self, wait):
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+# A QueuePool that records how long callers wait to check out a connection
+class TimedQueuePool(QueuePool):
+
+    def __init__(self, *args, **kwargs):
+        QueuePool.__init__(self, *args, **kwargs)
+        self.statistics = PoolStatistics()
+
+    def _do_get(self):
+        start = time.time()
+        try:
+            conn = QueuePool._do_get(self)
+        except exc.TimeoutError:
+            self.statistics.record_timeout()
+            raise
+        wait = time.time() - start
+        self.statistics.record_checkout(wait)
+        if wait > SLOW_CHECKOUT_SECS:
+            chapi_warn("DB", "Waited %.2f seconds for a connection (%s)" % \
+                           (wait, self.status()))
+        return conn
+
+    # Keep statistics when the pool is replaced (e.g. on dispose)
+    def recreate(self):
+        pool = QueuePool.recreate(self)
+        pool.statistics = self.statistics
+        return pool
+
+# Test pooled connections on checkout, so a connection dropped by the
+# server (restart, idle timeout) is replaced rather than failing a call
+def _ping_connection(dbapi_connection, connection_record, connection_proxy):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("SELECT 1")
+    except Exception:
+        # The pool will discard this connection and retry with a new one
+        raise exc.DisconnectionError()
+    finally:
+        cursor.close()
+
 # Simple class to hold the basis of DB queries against GPO CH Database
 # Loads the database table schemas
 class CHDatabaseEngine:
@@ -43,14 +113,35 @@ class CHDatabaseEngine:
     # Grab a database engine and pre-fetch table meta-data for all
     # Tables we'll be using
     def __init__(self):
-        config = pm.getService('config')
-        self.db_url = config.get('chrm.db_url')
+        self.config = pm.getService('config')
+        self.db_url = self.config.get('chrm.db_url')
 
-        # , pool_size=20 seems possible - default is 5. Haven't seend a need to go higher.
-        self.db = create_engine(self.db_url)
+        # Size the pool against the number of server threads
+        self.pool_size = self.config.get('chrm.db_pool_size')
+        self.max_overflow = self.config.get('chrm.db_max_overflow')
+        self.db = self._createEngine(self.db_url)
 # FIXME: Make this log level a chapi config param
         # logging.getLogger('sqlalchemy').setLevel(logging.INFO)
         self.session_class = sessionmaker(bind=self.db)
+
+        # Optional read replicas for read-only sessions
+        # Each replica gets its own pool of the same size as the primary
+        replica_urls = self.config.get('chrm.db_replica_urls')
+        replica_urls = [url.strip() for url in replica_urls.split(',') \
+                            if url.strip()]
+        self.replica_policy = self.config.get('chrm.db_replica_policy')
+        if self.replica_policy not in ['round_robin', 'least_loaded']:
+            raise Exception("Unknown chrm.db_replica_policy: %s" % \
+                                self.replica_policy)
+        self.replica_staleness = \
+            self.config.get('chrm.db_replica_staleness')
+        self.replicas = [self._createEngine(url) for url in replica_urls]
+        self.replica_session_classes = \
+            [sessionmaker(bind=replica) for replica in self.replicas]
+        self._replica_lock = threading.Lock()
+        self._next_replica = 0
+        # Time of last write by each caller, for the staleness guard
+        self._last_write_by_caller = {}
         self.metadata = MetaData(self.db)
         Base.metadata.create_all(self.db)
 
@@ -68,6 +159,8 @@ class CHDatabaseEngine:
             Table('ma_member', self.metadata, autoload=True)
         self.MEMBER_ATTRIBUTE_TABLE = \
             Table('ma_member_attribute', self.metadata, autoload=True)
+        self.MEMBER_SUMMARY_TABLE = \
+            Table('ma_member_summary', self.metadata, autoload=True)
         self.SSH_KEY_TABLE = \
             Table('ma_ssh_key', self.metadata, autoload=True)
         self.OUTSIDE_CERT_TABLE = \
@@ -96,8 +189,130 @@ class CHDatabaseEngine:
         self.PROJECT_INVITATION_TABLE = Table('pa_project_member_invitation', \
                                                self.metadata, autoload=True)
 
+        get_metrics_registry().register_collector(self._collectPoolMetrics)
+
+    # Create an engine with the configured pool settings
+    def _createEngine(self, url):
+        config = self.config
+        engine_args = {'poolclass' : TimedQueuePool,
+                       'pool_size' : self.pool_size,
+                       'max_overflow' : self.max_overflow,
+                       'pool_timeout' : config.get('chrm.db_pool_timeout'),
+                       'pool_recycle' : config.get('chrm.db_pool_recycle')}
+        statement_timeout = config.get('chrm.db_statement_timeout')
+        if statement_timeout > 0 and url.startswith('postgresql'):
+            # Postgres takes the timeout in milliseconds
+            engine_args['connect_args'] = \
+                {'options' : '-c statement_timeout=%d' % \
+                     (statement_timeout * 1000)}
+        engine = create_engine(url, **engine_args)
+        if config.get('chrm.db_pool_pre_ping'):
+            event.listen(engine, 'checkout', _ping_connection)
+        # Record statements for tools/query_audit.py
+        capture_file = config.get('chrm.db_query_capture_file')
+        if capture_file:
+            if not hasattr(self, '_query_capture'):
+                self._query_capture = QueryCapture(capture_file)
+            self._query_capture.install(engine)
+        # Count and time statements of each call (see MethodContext)
+        if config.get('chapi.call_instrumentation'):
+            install_sql_timing(engine)
+        return engine
+
     # Get a new session on the database engine
-    def getSession(self):
-        return self.session_class()
+    # A read-only session goes to a replica if any are configured, unless
+    # the given caller wrote recently enough that a replica may not
+    # have caught up yet
+    def getSession(self, read_only=False, caller=None):
+        if read_only and self.replicas and not self._wroteRecently(caller):
+            session = self._chooseReplicaSessionClass()()
+        else:
+            session = self.session_class()
+        session.chapi_read_only = read_only
+        return session
+
+    # Is this a session for a read-only call? Such sessions are closed
+    # without committing, whether they are on a replica or the primary
+    def isReadOnlySession(self, session):
+        return getattr(session, 'chapi_read_only', False)
+
+    # Note that a caller committed a write to the primary
+    def recordWrite(self, caller):
+        if caller and self.replicas:
+            with self._replica_lock:
+                self._last_write_by_caller[caller] = time.time()
+
+    def _wroteRecently(self, caller):
+        if not caller:
+            return False
+        with self._replica_lock:
+            last_write = self._last_write_by_caller.get(caller)
+            if last_write is None:
+                return False
+            if time.time() - last_write < self.replica_staleness:
+                return True
+            del self._last_write_by_caller[caller]
+            return False
+
+    def _chooseReplicaSessionClass(self):
+        with self._replica_lock:
+            if self.replica_policy == 'least_loaded':
+                loads = [replica.pool.checkedout() \
+                             for replica in self.replicas]
+                index = loads.index(min(loads))
+            else:
+                index = self._next_replica
+                self._next_replica = (index + 1) % len(self.replicas)
+        return self.replica_session_classes[index]
+
+    # Return dictionary of pool size, utilisation and checkout wait times
+    # for the primary (default) or a given engine
+    def getPoolStatistics(self, engine=None):
+        if engine is None: engine = self.db
+        pool = engine.pool
+        stats = pool.statistics
+        capacity = self.pool_size + self.max_overflow
+        checked_out = pool.checkedout()
+        mean_wait = 0.0
+        if stats.checkouts > 0:
+            mean_wait = stats.total_wait / stats.checkouts
+        return {'pool_size' : pool.size(),
+                'capacity' : capacity,
+                'checked_out' : checked_out,
+                'checked_in' : pool.checkedin(),
+                'overflow' : pool.overflow(),
+                'utilisation' : float(checked_out) / capacity,
+                'checkouts' : stats.checkouts,
+                'checkout_timeouts' : stats.timeouts,
+                'checkout_wait_total' : stats.total_wait,
+                'checkout_wait_mean' : mean_wait,
+                'checkout_wait_max' : stats.max_wait}
 
+    # Return list of pool statistics for each replica
+    def getReplicaPoolStatistics(self):
+        return [self.getPoolStatistics(replica) for replica in self.replicas]
 
+    # Report pool statistics of the primary and replicas at /metrics
+    def _collectPoolMetrics(self):
+        pools = [('primary', self.getPoolStatistics())]
+        for index, stats in enumerate(self.getReplicaPoolStatistics()):
+            pools.append(('replica%d' % index, stats))
+        families = [('checked_out', 'gauge', 'Connections in use'),
+                    ('capacity', 'gauge', 'Maximum connections (with overflow)'),
+                    ('overflow', 'gauge', 'Connections beyond the pool size'),
+                    ('checkouts', 'counter', 'Connections checked out'),
+                    ('checkout_timeouts', 'counter',
+                     'Checkouts that timed out waiting for a connection'),
+                    ('checkout_wait_total', 'counter',
+                     'Seconds spent waiting for connections')]
+        metrics = []
+        for key, type, help in families:
+            name = 'chapi_db_pool_%s' % key
+            if key == 'checkout_wait_total':
+                name = 'chapi_db_pool_checkout_wait_seconds_total'
+            elif type == 'counter':
+                name = name + '_total'
+            metrics.append((name, type, help,
+                            [({'database' : database}, stats[key]) \
+                                 for database, stats in pools]))
+        return metrics
@@ -76,9 +76,8 @@ class CHv1PersistentImplementation(CHv1Implementation):
                         CH.field_mapping, session)
         rows = q.all()
 
-        authorities = [construct_result_row(row, selected_columns, \
-                                                CH.field_mapping, session) \
-                           for row in rows]
+        authorities = construct_result_rows(rows, selected_columns, \
+                                                CH.field_mapping, session)
 
         self.add_service_attributes(rows, authorities, session)
 
@@ -164,9 +164,8 @@ class SRv1Delegate(CHv1PersistentImplementation):
                             CH.field_mapping, session)
         rows = q.all()
 
-        services = [construct_result_row(row, selected_columns, \
-                                             CH.field_mapping, session) \
-                        for row in rows]
+        services = construct_result_rows(rows, selected_columns, \
+                                             CH.field_mapping, session)
 
         self.add_service_attributes(rows, services, session)
 
@@ -40,13 +40,26 @@ from tools.guard_utils import *
 from tools.policy_file_checker import PolicyFileChecker
 
 from sqlalchemy import *
+from sqlalchemy import event
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
+import atexit
+import Queue
+import threading
+import time
 
 
 logging_logger = amsoil.core.log.getLogger('logv1')
 xmlrpc = pm.getService('xmlrpc')
 
+# Event ids are taken from the sequence before inserting: inserts are
+# routed to monthly partitions by trigger, so INSERT ... RETURNING
+# returns nothing
+LOGGING_ENTRY_ID_SEQUENCE = 'logging_entry_id_seq'
+
+# Postgres advisory lock key held while maintaining logging partitions
+LOG_PARTITION_LOCK = 0x4c4f4750
+
 class Loggingv1Handler(HandlerBase):
 
     def __init__(self):
@@ -136,6 +149,143 @@ class Loggingv1Handler(HandlerBase):
                                                                 mc._session)
         return mc._result
 
+# Writes logging events in bulk from a background thread.
+# Events are queued only once the transaction that logged them commits.
+class AsyncLogWriter(threading.Thread):
+
+    def __init__(self, flush_interval=2, batch_size=500):
+        super(AsyncLogWriter, self).__init__(name='AsyncLogWriter')
+        self.daemon = True
+        self._flush_interval = flush_interval
+        self._batch_size = max(1, batch_size)
+        self._queue = Queue.Queue()
+        self._flush_lock = threading.Lock()
+        self.db = pm.getService('chdbengine')
+
+        self.written = 0
+        self.failed = 0
+        self.flushes = 0
+
+    def stats(self):
+        return {'queue_depth' : self._queue.qsize(),
+                'written' : self.written,
+                'failed' : self.failed,
+                'flushes' : self.flushes}
+
+    # Hold events logged in this session until it commits
+    def add(self, session, entry):
+        pending = getattr(session, 'chapi_log_events', None)
+        if pending is None:
+            pending = session.chapi_log_events = []
+            event.listen(session, 'after_commit', self._session_committed)
+            event.listen(session, 'after_rollback', self._session_rolled_back)
+        pending.append(entry)
+
+    def _session_committed(self, session):
+        for entry in session.chapi_log_events:
+            self._queue.put(entry)
+        session.chapi_log_events = []
+
+    def _session_rolled_back(self, session):
+        session.chapi_log_events = []
+
+    def run(self):
+        while True:
+            time.sleep(self._flush_interval)
+            self.flush()
+
+    # Write everything queued so far
+    def flush(self):
+        with self._flush_lock:
+            while not self._queue.empty():
+                batch = []
+                while len(batch) < self._batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except Queue.Empty:
+                        break
+                if batch:
+                    self._write(batch)
+
+    def _write(self, batch):
+        self.flushes += 1
+        session = self.db.getSession()
+        try:
+            # Allocate the event ids up front to tie attributes to events
+            q = text("select nextval('%s')" % LOGGING_ENTRY_ID_SEQUENCE + \
+                         " from generate_series(1, :n)")
+            ids = [row[0] for row in session.execute(q, {'n' : len(batch)})]
+            entries = []
+            attributes = []
+            for event_id, (entry, attrs) in zip(ids, batch):
+                entry = dict(entry)
+                entry['id'] = event_id
+                entries.append(entry)
+                attributes += [dict(attr, event_id=event_id)
+                               for attr in attrs]
+            session.execute(self.db.LOGGING_ENTRY_TABLE.insert(), entries)
+            if attributes:
+                ins = self.db.LOGGING_ENTRY_ATTRIBUTE_TABLE.insert()
+                session.execute(ins, attributes)
+            session.commit()
+            self.written += len(batch)
+        except Exception, e:
+            session.rollback()
+            self.failed += len(batch)
+            chapi_error(LOG_LOG_PREFIX,
+                        "Failed to write %d log events: %s" % (len(batch), e))
+        finally:
+            session.close()
+
+# Creates the coming months' logging partitions ahead of time, and
+# archives months older than archive_months (0 = never)
+class LogPartitionMaintainer(threading.Thread):
+
+    def __init__(self, interval=3600, archive_months=0):
+        super(LogPartitionMaintainer, self).__init__(name='LogPartitionMaintainer')
+        self.daemon = True
+        self._interval = interval
+        self._archive_months = archive_months
+        self.db = pm.getService('chdbengine')
+
+    def run(self):
+        while True:
+            try:
+                self.maintain()
+            except Exception, e:
+                chapi_log_exception(LOG_LOG_PREFIX, e)
+            time.sleep(self._interval)
+
+    # Returns False if another process holds the lock
+    def maintain(self):
+        session = self.db.getSession()
+        try:
+            q = text("select pg_try_advisory_xact_lock(:key)")
+            if not session.execute(q, {'key' : LOG_PARTITION_LOCK}).scalar():
+                session.rollback()
+                return False
+            session.execute(text("select logging_create_partition" + \
+                                     "(now() at time zone 'utc')"))
+            session.execute(text("select logging_create_partition" + \
+                                     "((now() at time zone 'utc')" + \
+                                     " + interval '1 month')"))
+            if self._archive_months > 0:
+                q = text("select logging_archive_before" + \
+                             "(date_trunc('month', now() at time zone 'utc')" + \
+                             " - :months * interval '1 month')")
+                archived = \
+                    session.execute(q, {'months' : self._archive_months}).scalar()
+                if archived:
+                    chapi_info(LOG_LOG_PREFIX,
+                               "Archived %d months of logging entries" % archived)
+            session.commit()
+            return True
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
 class Loggingv1Delegate(DelegateBase):
 
     columns = ['id', 'user_id', 'message', 'event_time']
@@ -150,10 +300,44 @@ class Loggingv1Delegate(DelegateBase):
         super(Loggingv1Delegate, self).__init__(logging_logger)
         self.db = pm.getService('chdbengine')
 
+        # Optionally write events in bulk, off the caller's transaction
+        self.async_writer = None
+        config = pm.getService('config')
+        if config.get('chapi.log_async'):
+            self.async_writer = \
+                AsyncLogWriter(config.get('chapi.log_async_flush_interval'),
+                               config.get('chapi.log_async_batch_size'))
+            self.async_writer.start()
+            atexit.register(self.async_writer.flush)
+
+        interval = config.get('chapi.log_partition_interval')
+        if interval and interval > 0:
+            maintainer = \
+                LogPartitionMaintainer(interval,
+                                       config.get('chapi.log_archive_months'))
+            maintainer.start()
+
     # The attributes argument is a dictionary of name/value pairs
     def log_event(self, client_cert, message, attributes, credentials, options,
                   session, none_user_id=False):
 
+        # A read-only caller's session is never committed, and may be on
+        # a replica that can't take the writes: always log its events on
+        # a primary session of our own, committed here
+        if self.db.isReadOnlySession(session):
+            log_session = self.db.getSession()
+            try:
+                result = self.log_event(client_cert, message, attributes,
+                                        credentials, options, log_session,
+                                        none_user_id)
+                log_session.commit()
+            except Exception:
+                log_session.rollback()
+                raise
+            finally:
+                log_session.close()
+            return result
+
         now = datetime.utcnow()
         # Record the event
         # Insert into logging_entry (event_time, user_id, message) values
@@ -162,20 +346,28 @@ class Loggingv1Delegate(DelegateBase):
         if not none_user_id:
             user_id = get_uuid_from_cert(client_cert)
 
+        entry = {'event_time' : str(now), 'message' : message}
         if user_id:
-            ins = self.db.LOGGING_ENTRY_TABLE.insert().values(event_time=str(now), user_id=str(user_id), message=message)
-        else:
-            ins = self.db.LOGGING_ENTRY_TABLE.insert().values(event_time=str(now), message=message)
-        result = session.execute(ins)
-        # Grab the event
-        event_id = result.inserted_primary_key[0]
-        # Register the attributes
-        for key, value in attributes.iteritems():
-            # Insert into logging_entry_attribute_table 
-            # (event_id, attribute_name, attribute_value) 
-            # values (event_id, key, value)
-            ins = self.db.LOGGING_ENTRY_ATTRIBUTE_TABLE.insert().values(event_id = event_id, attribute_name=key, attribute_value=str(value))
-            result = session.execute(ins)
+            entry['user_id'] = str(user_id)
+        attrs = [{'attribute_name' : key, 'attribute_value' : str(value),
+                  'event_time' : str(now)}
+                 for key, value in attributes.iteritems()]
+
+        if self.async_writer:
+            self.async_writer.add(session, (entry, attrs))
+            return self._successReturn(True)
+
+        # Grab the event id
+        q = text("select nextval('%s')" % LOGGING_ENTRY_ID_SEQUENCE)
+        event_id = session.execute(q).scalar()
+        ins = self.db.LOGGING_ENTRY_TABLE.insert().values(id=event_id, **entry)
+        session.execute(ins)
+        # Register all the attributes in one (multi-row) insert
+        if attrs:
+            for attr in attrs:
+                attr['event_id'] = event_id
+            ins = self.db.LOGGING_ENTRY_ATTRIBUTE_TABLE.insert().values(attrs)
+            session.execute(ins)
 
         return self._successReturn(True)
 
@@ -187,9 +379,8 @@ class Loggingv1Delegate(DelegateBase):
         min_event_time = datetime.utcnow() - relativedelta(hours=num_hours)
         q = q.filter(self.db.LOGGING_ENTRY_TABLE.c.event_time >= min_event_time)
         rows = q.all()
-        entries = [construct_result_row(row, self.columns, 
-                                        self.field_mapping, session) \
-                       for row in rows]
+        entries = construct_result_rows(rows, self.columns,
+                                        self.field_mapping, session)
         return self._successReturn(entries)
 
     def get_log_entries_for_context(self, client_cert, context_type, 
@@ -200,12 +391,13 @@ class Loggingv1Delegate(DelegateBase):
         q = q.filter(self.db.LOGGING_ENTRY_TABLE.c.id == self.db.LOGGING_ENTRY_ATTRIBUTE_TABLE.c.event_id)
         min_event_time = datetime.utcnow() - relativedelta(hours=num_hours)
         q = q.filter(self.db.LOGGING_ENTRY_TABLE.c.event_time >= min_event_time)
+        # Lets the database skip attribute partitions of older months
+        q = q.filter(self.db.LOGGING_ENTRY_ATTRIBUTE_TABLE.c.event_time >= min_event_time)
         q = q.filter(self.db.LOGGING_ENTRY_ATTRIBUTE_TABLE.c.attribute_name == context_type_names[context_type])
         q = q.filter(self.db.LOGGING_ENTRY_ATTRIBUTE_TABLE.c.attribute_value == context_id)
         rows = q.all()
-        entries = [construct_result_row(row, self.columns, \
-                                            self.field_mapping, session) \
-                       for row in rows]
+        entries = construct_result_rows(rows, self.columns,
+                                        self.field_mapping, session)
         return self._successReturn(entries)
 
     def get_log_entries_by_attributes(self, client_cert, attribute_sets, 
@@ -215,6 +407,7 @@ class Loggingv1Delegate(DelegateBase):
         q = q.filter(self.db.LOGGING_ENTRY_TABLE.c.id == self.db.LOGGING_ENTRY_ATTRIBUTE_TABLE.c.event_id)
         min_event_time = datetime.utcnow() - relativedelta(hours=num_hours)
         q = q.filter(self.db.LOGGING_ENTRY_TABLE.c.event_time >= min_event_time)
+        q = q.filter(self.db.LOGGING_ENTRY_ATTRIBUTE_TABLE.c.event_time >= min_event_time)
         conditions = []
         for attribute_set in attribute_sets:
             key = attribute_set.keys()[0]
@@ -224,11 +417,10 @@ class Loggingv1Delegate(DelegateBase):
         or_condition = or_(*conditions)
         q = q.filter(or_condition)
         q = q.distinct()
-        rows = q.all()
-        entries = [construct_result_row(row, self.columns, 
-                                        self.field_mapping, session) \
-                       for row in rows]
-        return self._successReturn(entries)
+        rows = PagedQuery(q, options, self.db.LOGGING_ENTRY_TABLE.c.id)
+        entries = construct_result_rows(rows, self.columns,
+                                        self.field_mapping, session)
+        return self._successReturn(entries, rows.cursor)
 
 
     def get_attributes_for_log_entry(self, client_cert, event_id, credentials,
@@ -237,10 +429,9 @@ class Loggingv1Delegate(DelegateBase):
         q = session.query(self.db.LOGGING_ENTRY_ATTRIBUTE_TABLE)
         q = q.filter(self.db.LOGGING_ENTRY_ATTRIBUTE_TABLE.c.event_id == event_id)
         rows = q.all()
-        entries = [construct_result_row(row, self.attribute_columns, \
-                                            self.attribute_field_mapping, \
-                                            session) \
-                       for row in rows]
+        entries = construct_result_rows(rows, self.attribute_columns,
+                                        self.attribute_field_mapping,
+                                        session)
         return self._successReturn(entries)
 
 
@@ -0,0 +1,232 @@
+#----------------------------------------------------------------------
+# Copyright (c) 2011-2015 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+
+import datetime
+import Queue
+import threading
+import time
+
+from sqlalchemy import text
+
+import amsoil.core.pluginmanager as pm
+from tools.chapi_log import *
+from tools.metrics import get_metrics_registry
+
+# Postgres advisory lock key (with a hash of the member id) held while
+# renewing a member's inside certificate, so that only one CH process
+# renews it
+INSIDE_CERT_RENEWAL_LOCK = 0x494E5344
+
+# Background renewal of inside (member) certificates.
+#
+# Lookups call enqueue() for certificates that expire within the
+# renewal window; a worker thread renews them in batches, and also
+# periodically scans the inside key table for certificates nobody has
+# looked up lately.
+class InsideCertRenewer(threading.Thread):
+
+    def __init__(self, delegate, window_days=14, batch_size=20,
+                 scan_interval=3600):
+        super(InsideCertRenewer, self).__init__(name='InsideCertRenewer')
+        self.daemon = True
+        self._delegate = delegate
+        self._window = datetime.timedelta(days=window_days)
+        self._batch_size = max(1, batch_size)
+        self._scan_interval = scan_interval
+        self._queue = Queue.Queue()
+        self._lock = threading.Lock()
+        # member_id => time enqueued
+        self._pending = {}
+        self._stopped = threading.Event()
+        self._last_scan = 0
+        self.db = pm.getService('chdbengine')
+
+        self.renewed = 0
+        self.failed = 0
+        self.batches = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        get_metrics_registry().register_collector(self._collectMetrics)
+
+    def needs_renewal(self, expiration):
+        return expiration - datetime.datetime.utcnow() < self._window
+
+    # Queue a member's inside certificate for renewal.
+    # Returns False if it is already queued
+    def enqueue(self, member_id):
+        with self._lock:
+            if member_id in self._pending:
+                return False
+            self._pending[member_id] = time.time()
+        self._queue.put(member_id)
+        return True
+
+    def stop(self):
+        self._stopped.set()
+
+    def stats(self):
+        with self._lock:
+            depth = len(self._pending)
+        avg_latency = 0.0
+        if self.renewed:
+            avg_latency = self.total_latency / self.renewed
+        return {'queue_depth' : depth,
+                'renewed' : self.renewed,
+                'failed' : self.failed,
+                'batches' : self.batches,
+                'avg_latency' : avg_latency,
+                'total_latency' : self.total_latency,
+                'max_latency' : self.max_latency}
+
+    # Report renewal statistics at /metrics
+    def _collectMetrics(self):
+        stats = self.stats()
+        families = [('queue_depth', 'gauge',
+                     'chapi_inside_cert_renewal_queue_depth',
+                     'Inside certificates waiting to be renewed'),
+                    ('renewed', 'counter',
+                     'chapi_inside_cert_renewals_total',
+                     'Inside certificates renewed'),
+                    ('failed', 'counter',
+                     'chapi_inside_cert_renewal_failures_total',
+                     'Inside certificate renewals that failed'),
+                    ('batches', 'counter',
+                     'chapi_inside_cert_renewal_batches_total',
+                     'Batches of inside certificate renewals'),
+                    ('total_latency', 'counter',
+                     'chapi_inside_cert_renewal_latency_seconds_total',
+                     'Seconds from queueing to renewal of renewed certificates'),
+                    ('max_latency', 'gauge',
+                     'chapi_inside_cert_renewal_latency_seconds_max',
+                     'Longest time from queueing to renewal')]
+        return [(name, type, help, [({}, stats[key])]) \
+                    for key, type, name, help in families]
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                if time.time() - self._last_scan >= self._scan_interval:
+                    self._last_scan = time.time()
+                    self.scan()
+                batch = self._next_batch()
+                if batch:
+                    self.renew_batch(batch)
+            except Exception, e:
+                chapi_log_exception(MA_LOG_PREFIX, e)
+
+    # Wait for work, then take whatever else is queued (up to batch size)
+    def _next_batch(self):
+        timeout = max(1, self._scan_interval - (time.time() - self._last_scan))
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except Queue.Empty:
+            return []
+        while len(batch) < self._batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except Queue.Empty:
+                break
+        return batch
+
+    # Queue the certificates of enabled members that expire within the
+    # renewal window. Certificates that have already expired are left to
+    # be renewed when their member's key is next looked up
+    def scan(self):
+        now = datetime.datetime.utcnow()
+        cutoff = now + self._window
+        session = self.db.getSession()
+        try:
+            table = self.db.INSIDE_KEY_TABLE
+            summary = self.db.MEMBER_SUMMARY_TABLE
+            q = session.query(table.c.member_id)
+            q = q.join(summary, summary.c.member_id == table.c.member_id)
+            q = q.filter(table.c.expiration >= now)
+            q = q.filter(table.c.expiration < cutoff)
+            q = q.filter(summary.c.member_enabled == True)
+            rows = q.all()
+        finally:
+            session.close()
+        queued = len([row for row in rows if self.enqueue(row.member_id)])
+        if queued:
+            chapi_info(MA_LOG_PREFIX,
+                       "Queued %d expiring inside certificates" % queued)
+
+    def renew_batch(self, member_ids):
+        self.batches += 1
+        session = self.db.getSession()
+        try:
+            for member_id in member_ids:
+                try:
+                    if self._renew(session, member_id):
+                        session.commit()
+                        self._record(member_id, True)
+                    else:
+                        session.rollback()
+                except Exception, e:
+                    session.rollback()
+                    self._record(member_id, False)
+                    chapi_warn(MA_LOG_PREFIX,
+                               "Failed to renew inside cert for %s: %s" \
+                                   % (member_id, e))
+        finally:
+            session.close()
+            # Anything not renewed above no longer needs it
+            with self._lock:
+                for member_id in member_ids:
+                    self._pending.pop(member_id, None)
+
+    # Renew a member's inside certificates (in the session's transaction)
+    # unless another process is renewing or has renewed them.
+    # Return True if any were renewed
+    def _renew(self, session, member_id):
+        # Released at the end of the transaction
+        q = text("select pg_try_advisory_xact_lock(:key, hashtext(:member_id))")
+        locked = session.execute(q, {'key' : INSIDE_CERT_RENEWAL_LOCK,
+                                     'member_id' : str(member_id)}).scalar()
+        if not locked:
+            return False
+        # Checked while holding the lock: another process (or an earlier
+        # batch) may have renewed them
+        table = self.db.INSIDE_KEY_TABLE
+        q = session.query(table.c.member_id, table.c.expiration,
+                          table.c.private_key)
+        q = q.filter(table.c.member_id == member_id)
+        rows = [row for row in q.all() if self.needs_renewal(row.expiration)]
+        for row in rows:
+            chapi_info(MA_LOG_PREFIX,
+                       "Renewing inside cert for %s" % (row.member_id))
+            self._delegate._renew_inside_cert(session, row.member_id,
+                                              row.private_key)
+        return len(rows) > 0
+
+    def _record(self, member_id, success):
+        with self._lock:
+            enqueued = self._pending.pop(member_id, None)
+        if not success:
+            self.failed += 1
+            return
+        self.renewed += 1
+        if enqueued:
+            latency = time.time() - enqueued
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
@@ -174,6 +174,9 @@ class MAv1Implementation(MAv1DelegateBase):
 
         self.logging_service = pm.getService('loggingv1handler')
 
+        # Set by the plugin: renews expiring inside certs in the background
+        self.cert_renewer = None
+
     # This call is unprotected: no checking of credentials
     def get_version(self, session):
         method = 'get_version'
@@ -208,8 +211,25 @@ class MAv1Implementation(MAv1DelegateBase):
                 return value
             else:
                 return [value]
+        name = MA.field_mapping[attr]
+        if name in MA.summary_attributes:
+            # Use the member summary table (one row per member)
+            column = self.db.MEMBER_SUMMARY_TABLE.c[name]
+            q = session.query(self.db.MEMBER_SUMMARY_TABLE.c.member_id)
+            if attr == "MEMBER_EMAIL":
+                column = func.lower(column)
+            if not isinstance(value, types.ListType):
+                q = q.filter(column == value)
+            elif len(value) == 0:
+                # Matches nothing, as with ma_member_attribute below
+                return []
+            else:
+                q = q.filter(column.in_(value))
+            rows = q.all()
+            return [row.member_id for row in rows]
+
         q = session.query(MemberAttribute.member_id)
-        q = q.filter(MemberAttribute.name == MA.field_mapping[attr])
+        q = q.filter(MemberAttribute.name == name)
 
         if attr=="MEMBER_EMAIL":
             if isinstance(value, types.ListType):
@@ -316,6 +336,8 @@ class MAv1Implementation(MAv1DelegateBase):
         uids = [set(self.get_uids_for_attribute(session, attr, value))
                 for attr, value in match_criteria.iteritems()]
         uids = set.intersection(*uids)
+        # Page through members by id ('limit' and 'cursor' options)
+        uids, cursor = page_keys(uids, options)
         #chapi_info(MA_LOG_PREFIX,
         #            "UIDS = %s COLS = %s CRIT = %s" % (uids,
         #                                               selected_columns,
@@ -377,7 +399,7 @@ class MAv1Implementation(MAv1DelegateBase):
             # keying the result.
             if 'MEMBER_URN' not in selected_columns:
                 del result[urn]['MEMBER_URN']
-        return self._successReturn(result)
+        return self._successReturn(result, cursor)
 
     # This call is unprotected: no checking of credentials
     def lookup_public_member_info(self, client_cert, 
@@ -572,6 +594,7 @@ class MAv1Implementation(MAv1DelegateBase):
                 all_keys[table][MA.field_mapping[attr]] = value
         for table, keys in all_keys.iteritems():
             self.update_keys(session, table, keys, uid)
+        invalidate_member_identifiers(uid)
             
         result = self._successReturn(True)
         return result
@@ -929,7 +952,7 @@ class MAv1Implementation(MAv1DelegateBase):
         private key in the outside cert table, use it. Otherwise
         generate a new private key along with the csr.
 
-        Return a tuple of (private_key, csr_file).
+        Return a tuple of (private_key, csr_pem).
 
         """
         q = session.query(OutsideCert.private_key)
@@ -938,11 +961,11 @@ class MAv1Implementation(MAv1DelegateBase):
         if len(rows) > 0 and rows[0].private_key:
             chapi_info(MA_LOG_PREFIX,
                        "Reusing private key for member %s" % (member_urn))
-            return make_csr_from_key(rows[0].private_key)
+            return make_csr_pem(rows[0].private_key)
         else:
             chapi_info(MA_LOG_PREFIX,
                        "Creating new private key for member %s" % (member_urn))
-            return make_csr()
+            return make_csr_pem()
 
     def _store_outside_cert(self, session, member_id, certificate, expiration,
                             private_key):
@@ -1005,19 +1028,14 @@ class MAv1Implementation(MAv1DelegateBase):
         if 'csr' in options:
             # CSR provided: Generate cert but no private key
             private_key = None
-            csr_data = options['csr']
-            (csr_fd, csr_file) = tempfile.mkstemp()
-            os.close(csr_fd)
-            open(csr_file, 'w').write(csr_data)
+            csr_pem = str(options['csr'])
         else:
             # No CSR provided: Generate cert and private key
-            private_key, csr_file = self._make_csr(member_urn, member_id,
-                                                   session)
+            private_key, csr_pem = self._make_csr(member_urn, member_id,
+                                                  session)
 
-        cert_pem = make_cert(member_id, member_email, member_urn,
-                             self.cert, self.key, csr_file)
-
-        os.unlink(csr_file)
+        cert_pem = make_cert_from_csr(member_id, member_email, member_urn,
+                                      self.cert, self.key, csr_pem)
 
         expiration = get_expiration_from_cert(cert_pem)
 
@@ -1075,11 +1093,10 @@ class MAv1Implementation(MAv1DelegateBase):
 
         #chapi_audit(MA_LOG_PREFIX, "Called authorize_client "+member_id+' '+client_urn)
         if authorize_sense:
-            private_key, csr_file = make_csr()
+            private_key, csr_pem = make_csr_pem()
             member_email = convert_member_uid_to_email(member_id, session)
-            cert_pem = make_cert(member_id, member_email, member_urn, \
-                                     self.cert, self.key, csr_file)
-            os.unlink(csr_file)
+            cert_pem = make_cert_from_csr(member_id, member_email, member_urn, \
+                                              self.cert, self.key, csr_pem)
             expiration = get_expiration_from_cert(cert_pem)
             signer_pem = open(self.cert).read()
             cert_chain = cert_pem + signer_pem
@@ -1127,12 +1144,11 @@ class MAv1Implementation(MAv1DelegateBase):
         send_email(tolist, unicode(self.ch_from_email), unicode(self.portal_admin_email),subject,msgbody)
 
     def is_enabled(self, member_id, session):
-        q = session.query(MemberAttribute.value).\
-            filter(MemberAttribute.member_id == member_id).\
-            filter(MemberAttribute.name == MA.field_mapping['_GENI_MEMBER_ENABLED'])
+        q = session.query(self.db.MEMBER_SUMMARY_TABLE.c.member_enabled).\
+            filter(self.db.MEMBER_SUMMARY_TABLE.c.member_id == member_id)
         rows = q.all()
 
-        return (len(rows)==0 or rows[0][0] == 'y')
+        return (len(rows)==0 or rows[0].member_enabled)
 
     # enable/disable a user/member  (private)
     def enable_user(self, client_cert, member_urn, enable_sense, 
@@ -1257,6 +1273,9 @@ Please see http://groups.geni.net/geni/wiki/ProjectLeadWelcome for information o
 
         if not was_enabled:
             self.update_attr(session, privilege, 'true', member_uid, 'f')
+            invalidate_abac_credentials(member_uid)
+            invalidate_member_privileges(convert_member_uid_to_urn(member_uid,
+                                                                   session))
 
             # log_event
             msg = "Granted member %s privilege %s" %  (self._get_displayname_for_member_id(member_uid, session), privilege)
@@ -1340,6 +1359,9 @@ Please see http://groups.geni.net/geni/wiki/ProjectLeadWelcome for information o
                             raise CHAPIv1ArgumentError(msg)
         if was_enabled:
             self.delete_attr(session, privilege, member_uid)
+            invalidate_abac_credentials(member_uid)
+            invalidate_member_privileges(convert_member_uid_to_urn(member_uid,
+                                                                   session))
 
             # log_event
             msg = "Revoking member %s privilege %s" %  (self._get_displayname_for_member_id(member_uid, session), privilege)
@@ -1608,13 +1630,11 @@ Please see http://groups.geni.net/geni/wiki/ProjectLeadWelcome for information o
                 val = getattr(row, MA.field_mapping[f])
                 result[row.member_id][f] = self.transform_for_result(val)
             # And check for expiration on each row...
-            dt = row.expiration - datetime.datetime.utcnow()
-            if dt.days < 14:
-                chapi_info(MA_LOG_PREFIX,
-                           "Renewing inside cert for %s" % (row.member_id))
-                # call renew
-                private_key = getattr(row, 'private_key', None)
-                self._renew_inside_cert(session, row.member_id, private_key)
+            # Renewal happens in the background; the caller gets the
+            # current certificate
+            if self.cert_renewer and \
+                    self.cert_renewer.needs_renewal(row.expiration):
+                self.cert_renewer.enqueue(row.member_id)
         return result
 
     def _renew_inside_cert(self, session, member_id, private_key):
@@ -1625,7 +1645,7 @@ Please see http://groups.geni.net/geni/wiki/ProjectLeadWelcome for information o
             q = q.filter(InsideKey.member_id == member_id)
             row = q.one()
             private_key = row.private_key
-        (pk, csr_file) = make_csr_from_key(private_key)
+        (pk, csr_pem) = make_csr_pem(private_key)
         q = session.query(MemberAttribute.name, MemberAttribute.value)
         q = q.filter(MemberAttribute.member_id == member_id)
         q = q.filter(MemberAttribute.name.in_(['email_address', 'urn']))
@@ -1633,8 +1653,9 @@ Please see http://groups.geni.net/geni/wiki/ProjectLeadWelcome for information o
         meminfo = dict()
         for row in rows:
             meminfo[row.name] = row.value
-        cert_pem = make_cert(member_id, meminfo['email_address'],
-                             meminfo['urn'], self.cert, self.key, csr_file)
+        cert_pem = make_cert_from_csr(member_id, meminfo['email_address'],
+                                      meminfo['urn'], self.cert, self.key,
+                                      csr_pem)
         expiration = get_expiration_from_cert(cert_pem)
         # Grab signer pem
         signer_pem = open(self.cert).read()
@@ -1666,9 +1687,7 @@ Please see http://groups.geni.net/geni/wiki/ProjectLeadWelcome for information o
                           expiration=expiration)
             # Returns row count on success, raises exception on error
             updated = q.update(values)
-            # Must explicitly commit here because we're run as part of
-            # a read-only method so no autocommit happens
-            session.commit()
+            # The caller (InsideCertRenewer) commits
             msg = 'Updated inside certificate for %s' % (member_id)
             chapi_info(MA_LOG_PREFIX, msg)
             return True
@@ -24,6 +24,7 @@
 import amsoil.core.pluginmanager as pm
 from MAv1Implementation import MAv1Implementation
 from MAv1Guard import MAv1Guard
+from InsideCertRenewer import InsideCertRenewer
 
 # Implementation of MA that works against GPO database. Replace
 # Default delegate with MAv1Implementation delegate
@@ -39,3 +40,11 @@ def setup():
     handler = pm.getService('mav1handler')
     handler.setDelegate(delegate)
     handler.setGuard(guard)
+
+    # Renew expiring inside certificates off the request path
+    renewer = InsideCertRenewer(delegate,
+                                config.get('chapi.cert_renewal_window_days'),
+                                config.get('chapi.cert_renewal_batch_size'),
+                                config.get('chapi.cert_renewal_scan_interval'))
+    delegate.cert_renewer = renewer
+    renewer.start()
@@ -217,13 +217,12 @@ class OpsMonHandler:
         opsmon_logger.info("Requested opsmon info for user %s" % user_id)
 
         # Grab all attributes of user based on username
-        ma1 = alias(self._db.MEMBER_ATTRIBUTE_TABLE)
-        ma2 = alias(self._db.MEMBER_ATTRIBUTE_TABLE)
-        q = session.query(ma2.c.name, ma2.c.value)
+        ms = self._db.MEMBER_SUMMARY_TABLE
+        ma = self._db.MEMBER_ATTRIBUTE_TABLE
+        q = session.query(ma.c.name, ma.c.value)
 
-        q = q.filter(ma1.c.member_id == ma2.c.member_id)
-        q = q.filter(ma1.c.name == 'username')
-        q = q.filter(ma1.c.value == user_id)
+        q = q.filter(ms.c.member_id == ma.c.member_id)
+        q = q.filter(ms.c.username == user_id)
         
         rows = q.all()
         if len(rows) == 0: return ""
@@ -23,6 +23,7 @@
 
 import amsoil.core.pluginmanager as pm
 from OpsMon import OpsMonHandler
+from Metrics import handle_metrics_request
 
 # Load the handler for the appropriate paths
 # Note this line must be present in the apache config for ch_ssl:
@@ -36,6 +37,11 @@ def setup():
                       '/info/<variety>/<id>',
                       methods=["GET"],
                       defaults={})
+    # Also needed in the apache config:
+    #  ScriptAlias /metrics /usr/share/geni-ch/chapi/AMsoil/src/main.py
+    rest.registerREST('metrics', handle_metrics_request, '/metrics',
+                      methods=["GET"],
+                      defaults={})
 
 
 
@@ -0,0 +1,83 @@
+#----------------------------------------------------------------------
+# Copyright (c) 2011-2015 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+
+import threading
+
+from sqlalchemy import text
+
+import amsoil.core.pluginmanager as pm
+from tools.chapi_log import *
+
+# Postgres advisory lock key held while sweeping, so that only one
+# CH process sweeps at a time
+EXPIRATION_SWEEP_LOCK = 0x53574550
+
+# Background thread that marks slices and projects expired (or restored)
+# as their expiration passes, so that request handlers need only
+# consult the expired flag
+class ExpirationSweeper(threading.Thread):
+
+    def __init__(self, delegate, interval):
+        super(ExpirationSweeper, self).__init__(name='ExpirationSweeper')
+        self.daemon = True
+        self._delegate = delegate
+        self._interval = interval
+        self._stopped = threading.Event()
+        self.db = pm.getService('chdbengine')
+        self.sweeps = 0
+        self.skipped = 0
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        chapi_info(SA_LOG_PREFIX,
+                   "Sweeping slice and project expirations every %d seconds" \
+                       % self._interval)
+        while not self._stopped.is_set():
+            try:
+                self.sweep()
+            except Exception, e:
+                chapi_log_exception(SA_LOG_PREFIX, e)
+            self._stopped.wait(self._interval)
+
+    # Run one sweep. Returns False if another process holds the lock
+    def sweep(self):
+        session = self.db.getSession()
+        try:
+            # Released at the end of the transaction
+            q = text("select pg_try_advisory_xact_lock(:key)")
+            locked = session.execute(q, {'key' : EXPIRATION_SWEEP_LOCK}).scalar()
+            if not locked:
+                self.skipped += 1
+                session.rollback()
+                return False
+            self._delegate.update_project_expirations(None, session)
+            session.commit()
+            self.sweeps += 1
+            return True
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
@@ -166,6 +166,8 @@ class SAv1PersistentImplementation(SAv1DelegateBase):
             # Force execute query in DB for time comparisons to happen there
             # And so if in this session we just updated a project expiration, it is seen
             q = q.update(update_fields, 'fetch')
+            if type == 'project':
+                invalidate_all_project_memberships()
 
         for row in rows:
             if type == 'slice':
@@ -204,9 +206,6 @@ class SAv1PersistentImplementation(SAv1DelegateBase):
 
     def lookup_slices(self, client_cert, credentials, options, session):
 
-        client_uuid = get_uuid_from_cert(client_cert)
-        self.update_slice_expirations(client_uuid, session)
-
         selected_columns, match_criteria = \
             unpack_query_options(options, SA.slice_field_mapping)
 
@@ -229,17 +228,19 @@ class SAv1PersistentImplementation(SAv1DelegateBase):
 
         # Order by expiration to get the active one or the most recently
         # expired instance and to provide deterministic behavior
+        # (Paged lookups are ordered by id instead)
         q = q.order_by(self.db.SLICE_TABLE.c.expiration)
 
-        rows = q.all()
+        paged = PagedQuery(q, options, self.db.SLICE_TABLE.c.id)
 
         # in python 2.7, could do dictionary comprehension !!!!!!!!
         slices = {}
-        for row in rows:
-            slices[row.slice_urn] = construct_result_row(row, \
-                selected_columns, SA.slice_field_mapping, session)
+        for row, result_row in iter_result_rows(paged, selected_columns,
+                                                SA.slice_field_mapping,
+                                                session):
+            slices[row.slice_urn] = result_row
 
-        result = self._successReturn(slices)
+        result = self._successReturn(slices, paged.cursor)
 
         return result
 
@@ -290,9 +291,6 @@ class SAv1PersistentImplementation(SAv1DelegateBase):
                            id_field, role_txt, member_txt, member_uid_txt, 
                        id_value, session):
 
-        client_uuid = get_uuid_from_cert(client_cert)
-        self.update_project_expirations(client_uuid, session)
-
         q = session.query(member_table, table.c[name_field],
                           self.db.MEMBER_ATTRIBUTE_TABLE.c.value,
                           self.db.ROLE_TABLE.c.name)
@@ -313,9 +311,6 @@ class SAv1PersistentImplementation(SAv1DelegateBase):
 
     def lookup_slices_for_member(self, client_cert, member_urn, \
                                  credentials, options, session):
-        client_uuid = get_uuid_from_cert(client_cert)
-        self.update_slice_expirations(client_uuid, session)
-
         rows = self.lookup_for_member(member_urn, self.db.SLICE_TABLE, 
                                       self.db.SLICE_MEMBER_TABLE, 
                                       SA.slice_field_mapping,
@@ -335,12 +330,15 @@ class SAv1PersistentImplementation(SAv1DelegateBase):
                         session):
 
         client_uuid = get_uuid_from_cert(client_cert)
-        self.update_slice_expirations(client_uuid, session)
 
         q = session.query(self.db.SLICE_TABLE.c.expiration, \
                               self.db.SLICE_TABLE.c.certificate)
         q = q.filter(self.db.SLICE_TABLE.c.slice_urn == slice_urn)
         q = q.filter(self.db.SLICE_TABLE.c.expired == 'f')
+        # The expired flag is set by a periodic sweep; don't issue a
+        # credential for a slice that expired since the last one
+        q = q.filter(or_(self.db.SLICE_TABLE.c.expiration == None,
+                         self.db.SLICE_TABLE.c.expiration > text("now() at time zone 'utc'")))
         rows = q.all()
         if len(rows) == 0:
             raise CHAPIv1ArgumentError("Can't get slice credential " + \
@@ -576,6 +574,7 @@ class SAv1PersistentImplementation(SAv1DelegateBase):
 
         # do the database write
         result = self.finish_create(session, slice, SA.slice_field_mapping)
+        invalidate_slice(slice.slice_urn)
 
         # Add slice lead member
         leadMember = SliceMember()
@@ -797,6 +796,7 @@ class SAv1PersistentImplementation(SAv1DelegateBase):
         leadMember.member_id = client_uuid
         leadMember.role = LEAD_ATTRIBUTE
         session.add(leadMember)
+        invalidate_project_memberships([get_urn_from_cert(client_cert)])
 #        ins = self.db.PROJECT_MEMBER_TABLE.insert().values(\
 #            project_id=project.project_id, \
 #                member_id = client_uuid, \
@@ -899,9 +899,6 @@ class SAv1PersistentImplementation(SAv1DelegateBase):
     # get info on a set of projects
     def lookup_projects(self, client_cert, credentials, options, session):
 
-        client_uuid = get_uuid_from_cert(client_cert)
-        self.update_project_expirations(client_uuid, session)
-
         columns, match_criteria = \
             unpack_query_options(options, SA.project_field_mapping)
 
@@ -916,16 +913,15 @@ class SAv1PersistentImplementation(SAv1DelegateBase):
         q = session.query(self.db.PROJECT_TABLE)
         q = add_filters(q, match_criteria, self.db.PROJECT_TABLE, \
                         SA.project_field_mapping, session)
-        rows = q.all()
+        paged = PagedQuery(q, options, self.db.PROJECT_TABLE.c.id)
         projects = {}
-        for row in rows:
+        for row, result_row in iter_result_rows(paged, columns,
+                                                SA.project_field_mapping,
+                                                session):
             project_urn = row_to_project_urn(self.authority, row)
-            result_row = construct_result_row(row, columns,
-                                              SA.project_field_mapping,
-                                              session)
             projects[project_urn] = result_row
 
-        result = self._successReturn(projects)
+        result = self._successReturn(projects, paged.cursor)
 
         return result
 
@@ -933,9 +929,6 @@ class SAv1PersistentImplementation(SAv1DelegateBase):
     def lookup_projects_for_member(self, client_cert, member_urn, \
                                    credentials, options, session):
 
-        client_uuid = get_uuid_from_cert(client_cert)
-        self.update_project_expirations(client_uuid, session)
-
         rows = self.lookup_for_member(member_urn, self.db.PROJECT_TABLE, 
                                       self.db.PROJECT_MEMBER_TABLE, 
                                       SA.project_field_mapping, 
@@ -1420,6 +1413,12 @@ class SAv1PersistentImplementation(SAv1DelegateBase):
                                                                                                 member[member_str], text_str))
                 q.update({"role" : role})
 
+        # Signed role credentials of these members may no longer hold
+        for member_id in urn_to_id.values():
+            invalidate_abac_credentials(member_id)
+        if text_str == 'project':
+            invalidate_project_memberships(all_urns)
+
         # before committing, check that there is exactly one lead
         q = session.query(member_class)
         q = q.filter(eval(id_str) == id)
@@ -1530,9 +1529,6 @@ class SAv1PersistentImplementation(SAv1DelegateBase):
         method = 'lookup_project_attributes'
         args = {'project_urn' : project_urn}
 
-        client_uuid = get_uuid_from_cert(client_cert)
-        self.update_project_expirations(client_uuid, session)
-
         if "match" in options and "PROJECT_UID" in options["match"]:
             project_id = options["match"]["PROJECT_UID"]
         else:
@@ -1679,11 +1675,12 @@ class SAv1PersistentImplementation(SAv1DelegateBase):
         # Note we do not expire slivers cause the session for this method is read-only
 
         rows = q.all()
+        result_rows = construct_result_rows(rows, columns,
+                                            SA.sliver_info_field_mapping,
+                                            session)
         slivers = {}
-        for row in rows:
-            slivers[row.sliver_urn] = \
-                construct_result_row(row, columns, \
-                                         SA.sliver_info_field_mapping, session)
+        for row, result_row in zip(rows, result_rows):
+            slivers[row.sliver_urn] = result_row
         return self._successReturn(slivers)
 
 
@@ -1772,10 +1769,9 @@ class SAv1PersistentImplementation(SAv1DelegateBase):
         if status:
             q = q.filter(self.db.PROJECT_REQUEST_TABLE.c.status == status)
         rows = q.all()
-        result = [construct_result_row(row, SA.project_request_columns, 
-                                       SA.project_request_field_mapping, 
-                                       session) \
-                      for row in rows]
+        result = construct_result_rows(rows, SA.project_request_columns,
+                                       SA.project_request_field_mapping,
+                                       session)
         result = self._successReturn(result)
 
         return result
@@ -1794,10 +1790,9 @@ class SAv1PersistentImplementation(SAv1DelegateBase):
 
         rows = q.all()
 #        print "ROWS = " + str(rows)
-        result = [construct_result_row(row, SA.project_request_columns, 
+        result = construct_result_rows(rows, SA.project_request_columns,
                                        SA.project_request_field_mapping,
-                                       session) \
-                      for row in rows]
+                                       session)
 
         return self._successReturn(result)
 
@@ -1817,10 +1812,9 @@ class SAv1PersistentImplementation(SAv1DelegateBase):
         q = q.filter(self.db.PROJECT_REQUEST_TABLE.c.status == PENDING_STATUS)
         rows = q.all()
 #        print "ROWS = " + str(rows)
-        result = [construct_result_row(row, SA.project_request_columns, 
+        result = construct_result_rows(rows, SA.project_request_columns,
                                        SA.project_request_field_mapping,
-                                       session) \
-                      for row in rows]
+                                       session)
         result = self._successReturn(result)
 
         return result
@@ -24,6 +24,7 @@
 import amsoil.core.pluginmanager as pm
 from SAv1PersistentImplementation import SAv1PersistentImplementation
 from SAv1Guard import SAv1Guard
+from ExpirationSweeper import ExpirationSweeper
 
 # Plugin for SARM (Slice Authority Resource Manager) Implemntation
 
@@ -38,3 +39,11 @@ def setup():
     handler.setDelegate(delegate)
     handler.setGuard(guard)
 
+    # Mark slices and projects expired in the background rather than
+    # on every lookup
+    config = pm.getService('config')
+    interval = config.get('chapi.expiration_sweep_interval')
+    if interval and interval > 0:
+        sweeper = ExpirationSweeper(delegate, interval)
+        sweeper.start()
+
@@ -24,12 +24,22 @@
 # Class to manage a set of ABAC credentials, certificates and prove queries
 
 from ConfigParser import ConfigParser
+import datetime
+import dateutil.parser
+import dateutil.tz
+import hashlib
+import json
 import optparse
 import os
+import re
+import select
 import subprocess
 import sys
 import tempfile
+import threading
 import ABAC
+from cache_utils import get_cache
+from call_stats import count_abac_query
 from chapi_log import *
 
 # Generate an ABACManager config file
@@ -94,37 +104,204 @@ def grab_output_from_subprocess(args):
         chunk = proc.stdout.read()
     return result
 
-# Run a subprocess and execute and grab results of ABAC query evaluation
+# Evaluate an ABAC query against a set of id certs and signed assertions
+# Return ok, proof where proof is the user-readable proof chain
+# The query is handed to a long-lived ABACManager worker process
+# (see ABACWorkerPool) rather than a freshly started interpreter
 def execute_abac_query(query, id_certs, raw_assertions = []):
-    config_filename, tempfiles = \
-        create_abac_manager_config_file({}, id_certs, {}, raw_assertions)
-
-    # Make the query call, pull result from stdout
-    chapi_home = os.getenv('CHAPIHOME')
-    chapi_tools = os.path.join(chapi_home, 'tools')
-    args = ['python', os.path.join(chapi_tools, 'ABACManager.py'),
-            '--config=%s' % config_filename,
-            '--query=%s' % query]
-    chapi_debug("ABAC", "Exec ABAC Query ARGS = %s" % " ".join(args))
-    result = grab_output_from_subprocess(args)
-
-    result_parts = result.split('\n')
-
-    ok = result_parts[0].find('Succeeded') >= 0
-    proof = "\n".join(result_parts[1:])
-    
-    # Delete the tempfiles
-    for tfile in tempfiles:
-        os.unlink(tfile)
-
-    return ok, proof
-
+    chapi_debug("ABAC", "Exec ABAC Query %s" % query)
+    count_abac_query()
+    request = {'op' : 'query',
+               'query' : query,
+               'id_certs' : id_certs,
+               'raw_assertions' : raw_assertions}
+    response = get_abac_worker_pool().execute(request)
+    if response is None or 'error' in response:
+        # Fail closed: an unanswered query proves nothing
+        return False, ''
+    return response['ok'], response['proof']
+
+# Prefix marking a worker response line on the worker's stdout
+# Anything else written there (e.g. by the ABAC library) is ignored
+ABAC_WORKER_RESPONSE_TAG = 'ABAC_WORKER_RESPONSE '
+
+# Default pool settings, overridden by chapi.abac_worker_* parameters
+ABAC_WORKER_COUNT = 2
+ABAC_WORKER_MAX_REQUESTS = 500
+ABAC_WORKER_TIMEOUT = 30
+
+# A long-lived 'ABACManager.py --worker' process reached over a pipe.
+# Requests and responses are single lines of JSON.
+class ABACWorker:
+
+    def __init__(self, max_requests, timeout):
+        chapi_home = os.getenv('CHAPIHOME')
+        chapi_tools = os.path.join(chapi_home, 'tools')
+        args = ['python', os.path.join(chapi_tools, 'ABACManager.py'),
+                '--worker']
+        self._proc = subprocess.Popen(args, stdin=subprocess.PIPE,
+                                      stdout=subprocess.PIPE,
+                                      close_fds=True)
+        self._remaining = max_requests
+        self._timeout = timeout
+        self._buffer = ''
+
+    # Send a request and wait (up to the timeout) for the tagged response
+    # Raise an exception if the worker dies or doesn't answer in time
+    def execute(self, request):
+        self._remaining -= 1
+        self._proc.stdin.write(json.dumps(request) + '\n')
+        self._proc.stdin.flush()
+        fd = self._proc.stdout.fileno()
+        while True:
+            while '\n' in self._buffer:
+                line, self._buffer = self._buffer.split('\n', 1)
+                if line.startswith(ABAC_WORKER_RESPONSE_TAG):
+                    return json.loads(line[len(ABAC_WORKER_RESPONSE_TAG):])
+            ready, _, _ = select.select([fd], [], [], self._timeout)
+            if not ready:
+                raise Exception("ABAC worker %d timed out" % self._proc.pid)
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                raise Exception("ABAC worker %d exited" % self._proc.pid)
+            self._buffer = self._buffer + chunk
+
+    # Is this worker still usable for another request?
+    def is_usable(self):
+        return self._remaining > 0 and self._proc.poll() is None
+
+    # Retire the worker: closing stdin makes a healthy worker exit
+    def stop(self, kill=False):
+        try:
+            if kill:
+                self._proc.kill()
+            else:
+                self._proc.stdin.close()
+            self._proc.wait()
+        except Exception:
+            pass
+
+# A bounded, thread-safe pool of ABACWorkers
+# At most 'size' requests are evaluated concurrently. Workers are started
+# on demand, recycled after max_requests to bound ABAC library leaks, and
+# replaced if they fail, so a crash only costs the request that caused it.
+class ABACWorkerPool:
+
+    def __init__(self, size=ABAC_WORKER_COUNT,
+                 max_requests=ABAC_WORKER_MAX_REQUESTS,
+                 timeout=ABAC_WORKER_TIMEOUT):
+        self._max_requests = max_requests
+        self._timeout = timeout
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._idle = []
+
+    def _checkout(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return ABACWorker(self._max_requests, self._timeout)
+
+    def _checkin(self, worker):
+        if worker.is_usable():
+            with self._lock:
+                self._idle.append(worker)
+        else:
+            worker.stop()
+
+    # Run a request on a worker, retrying once on a fresh worker
+    # Return the response dictionary or None if no worker could answer
+    def execute(self, request):
+        self._slots.acquire()
+        try:
+            for attempt in range(2):
+                worker = None
+                try:
+                    worker = self._checkout()
+                    response = worker.execute(request)
+                    self._checkin(worker)
+                    return response
+                except Exception, e:
+                    chapi_error("ABAC", "ABAC worker request failed: %s" % e)
+                    if worker:
+                        worker.stop(kill=True)
+            return None
+        finally:
+            self._slots.release()
+
+# Get an integer CHAPI configuration value, or the default when not
+# running inside CHAPI (e.g. from the command line)
+def _get_config_int(name, default):
+    try:
+        import amsoil.core.pluginmanager as pm
+        return int(pm.getService('config').get(name))
+    except Exception:
+        return default
+
+_abac_worker_pool = None
+_abac_worker_pool_lock = threading.Lock()
+
+# Get the process-wide ABAC worker pool, creating it on first use
+def get_abac_worker_pool():
+    global _abac_worker_pool
+    if _abac_worker_pool is None:
+        with _abac_worker_pool_lock:
+            if _abac_worker_pool is None:
+                size = _get_config_int('chapi.abac_worker_count',
+                                       ABAC_WORKER_COUNT)
+                max_requests = \
+                    _get_config_int('chapi.abac_worker_max_requests',
+                                    ABAC_WORKER_MAX_REQUESTS)
+                timeout = _get_config_int('chapi.abac_worker_timeout',
+                                          ABAC_WORKER_TIMEOUT)
+                _abac_worker_pool = ABACWorkerPool(size, max_requests,
+                                                   timeout)
+    return _abac_worker_pool
+
+# Evaluate one worker request inside the worker process
+def handle_worker_request(request):
+    # JSON hands back unicode; the ABAC library wants plain strings
+    id_certs = dict((str(name), str(cert))
+                    for name, cert in request['id_certs'].items())
+    raw_assertions = [str(ra) for ra in request['raw_assertions']]
+    if request['op'] == 'query':
+        manager = ABACManager(certs_by_name=id_certs,
+                              raw_assertions=raw_assertions)
+        ok, proof = manager.query(request['query'])
+        proof_text = "\n".join(manager.pretty_print_proof(proof))
+        del manager
+        return {'ok' : ok, 'proof' : proof_text}
+    raise Exception("Unknown ABAC worker operation: %s" % request['op'])
+
+# Worker main loop: answer one JSON request per line until stdin closes
+def run_worker():
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            break
+        try:
+            response = handle_worker_request(json.loads(line))
+        except Exception, e:
+            response = {'error' : str(e)}
+        sys.stdout.write(ABAC_WORKER_RESPONSE_TAG + json.dumps(response) +
+                         '\n')
+        sys.stdout.flush()
 
 
 # Generate an ABAC credential of a given assertion signed by "ME"
 # with a set of id_certs (a dictionary of {name : cert}
 # Run this as a separate process to avoid memory corruption
 def generate_abac_credential(assertion, me_cert, me_key, id_certs):
+    # Signed credentials are cached per assertion, principals and signer
+    cache = get_abac_credential_cache()
+    id_cert_digest = hashlib.sha1()
+    for name in sorted(id_certs.keys()):
+        id_cert_digest.update("%s=%s\n" % (name, id_certs[name]))
+    key = (assertion, id_cert_digest.hexdigest(), me_cert)
+    cred = cache.get(key)
+    if cred is not None:
+        return cred
+
     # Create config file
     id_cert_files = {'ME' : me_cert}
     id_key_files = {'ME' : me_key}
@@ -143,8 +320,69 @@ def generate_abac_credential(assertion, me_cert, me_key, id_certs):
     for tfile in tempfiles:
         os.unlink(tfile)
 
+    if cred:
+        cache.put(key, cred, _abac_credential_ttl(cred),
+                  _abac_credential_tags(id_certs))
+
     return cred
 
+# Don't hand out a cached credential this close to its expiration
+ABAC_CREDENTIAL_EXPIRATION_MARGIN = 300
+
+# Default credential cache settings, overridden by
+# chapi.abac_credential_cache_* parameters
+ABAC_CREDENTIAL_CACHE_SIZE = 1000
+ABAC_CREDENTIAL_CACHE_TTL = 3600
+
+ABAC_CREDENTIAL_EXPIRES_PATTERN = re.compile('<expires>([^<]+)</expires>')
+
+# Get the process-wide cache of signed ABAC credentials
+def get_abac_credential_cache():
+    size = _get_config_int('chapi.abac_credential_cache_size',
+                           ABAC_CREDENTIAL_CACHE_SIZE)
+    ttl = _get_config_int('chapi.abac_credential_cache_ttl',
+                          ABAC_CREDENTIAL_CACHE_TTL)
+    return get_cache('abac_credentials', size, ttl)
+
+# How long may a freshly signed credential be cached?
+# The configured TTL, cut short by the credential's own expiration
+def _abac_credential_ttl(cred):
+    ttl = _get_config_int('chapi.abac_credential_cache_ttl',
+                          ABAC_CREDENTIAL_CACHE_TTL)
+    match = ABAC_CREDENTIAL_EXPIRES_PATTERN.search(cred)
+    if match:
+        try:
+            expires = dateutil.parser.parse(match.group(1))
+            if expires.tzinfo:
+                expires = expires.astimezone(dateutil.tz.tzutc())
+                expires = expires.replace(tzinfo=None)
+            remaining = expires - datetime.datetime.utcnow()
+            remaining = remaining.days * 86400 + remaining.seconds
+            ttl = min(ttl, remaining - ABAC_CREDENTIAL_EXPIRATION_MARGIN)
+        except Exception:
+            pass
+    return ttl
+
+# Tag cached credentials with the UUIDs of their principals
+# so they can be dropped when a principal's roles change
+def _abac_credential_tags(id_certs):
+    # Imported here: the command line and worker don't need gcf
+    from cert_utils import get_uuid_from_cert
+    tags = []
+    for cert in id_certs.values():
+        try:
+            member_uid = get_uuid_from_cert(cert)
+        except Exception:
+            member_uid = None
+        if member_uid:
+            tags.append(str(member_uid))
+    return tags
+
+# Drop all cached credentials issued about the given member
+# To be called whenever a member's privileges or memberships change
+def invalidate_abac_credentials(member_uid):
+    get_abac_credential_cache().invalidate_tag(str(member_uid))
+
 
 class ABACManager:
 
@@ -605,9 +843,15 @@ def main(argv=sys.argv):
     parser.add_option('--config', 
                       help="Name of config file with Principals/Keys/Assertions/AssertionFiles sections", 
                       default = None)
+    parser.add_option('--worker', action='store_true', default=False,
+                      help="Serve JSON requests on stdin (see ABACWorker)")
 
     (options, args) = parser.parse_args(argv)
 
+    if options.worker:
+        run_worker()
+        return
+
     # We need either a query or credential expression
     if not options.query and not options.credential:
         parser.print_help()
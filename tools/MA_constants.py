@@ -127,6 +127,9 @@ field_mapping = {
     "OPERATOR": "OPERATOR"
 }
 
+# Attributes (internal names) also kept in the ma_member_summary table
+summary_attributes = ["urn", "email_address", "username", "eppn"]
+
 key_fields = ["KEY_MEMBER", "KEY_ID", "KEY_PUBLIC", "KEY_PRIVATE", "KEY_TYPE",
               "KEY_DESCRIPTION", "_GENI_KEY_MEMBER_UID", 
               "_GENI_KEY_FILENAME" ]
@@ -106,7 +106,8 @@ slice_field_mapping = {
     "SLICE_CREATION" :  "creation",
     "SLICE_PROJECT_URN" : {"base_field" : "project_id", 
                            "to_external" : convert_project_uid_to_urn,
-                           "to_internal" : convert_project_urn_to_uid},
+                           "to_internal" : convert_project_urn_to_uid,
+                           "vectorized" : True},
     "_GENI_SLICE_EMAIL" : "slice_email",
     "_GENI_SLICE_OWNER" : "owner_id", 
     "_GENI_PROJECT_UID": 'project_id'
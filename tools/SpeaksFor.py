@@ -21,6 +21,8 @@
 # IN THE WORK.
 #----------------------------------------------------------------------
 
+import datetime
+import hashlib
 import optparse
 import os, sys
 import gcf.sfa.trust.certificate
@@ -30,8 +32,43 @@ import gcf.sfa.trust.gid
 import chapi_log
 from cert_utils import *
 from ABACManager import *
+from cache_utils import get_cache
 from chapi.Exceptions import *
 
+# Bounds on the cache of successful certificate chain verifications
+CERT_VERIFY_CACHE_SIZE = 10000
+CERT_VERIFY_CACHE_TTL = 3600
+
+def get_cert_verify_cache():
+    return get_cache('speaksfor.verified_chains', CERT_VERIFY_CACHE_SIZE,
+                     CERT_VERIFY_CACHE_TTL)
+
+# Verify that the given cert chains to one of the trusted roots,
+# raising an exception if not.
+# Successes are cached by fingerprint and trusted roots version
+# (see HandlerBase.TrustedRoots) until the certificate expires.
+def verify_cert_chain(cert, trusted_roots):
+    version = getattr(trusted_roots, 'version', None)
+    key = None
+    if version:
+        key = (hashlib.sha1(cert).hexdigest(), version)
+        if get_cert_verify_cache().get(key):
+            return
+    gid = gcf.sfa.trust.gid.GID(string=cert)
+    gid.verify_chain(trusted_roots)
+    if key:
+        remaining = get_expiration_from_cert(cert) - \
+            datetime.datetime.utcnow()
+        ttl = min(CERT_VERIFY_CACHE_TTL,
+                  remaining.days * 86400 + remaining.seconds)
+        if ttl > 0:
+            get_cert_verify_cache().put(key, True, ttl)
+
+# Forget all cached verifications (called when the trusted roots or
+# MA CRL change, see HandlerBase.getTrustedRoots)
+def invalidate_cert_verifications():
+    get_cert_verify_cache().clear()
+
 
 # Determine if the given method context is 'speaks-for'
 # That is:
@@ -72,9 +109,8 @@ def determine_speaks_for(client_cert, credentials, options, trusted_roots=None):
     # cert and options as given
     if not speaking_for:
         if trusted_roots:
-            client_gid = gcf.sfa.trust.gid.GID(string=client_cert)
             try :
-                client_gid.verify_chain(trusted_roots)
+                verify_cert_chain(client_cert, trusted_roots)
             except Exception, e:
                 chapi_info("SPEAKSFOR", "Client %s: certificate not trusted"
                            % (client_urn))
@@ -99,9 +135,8 @@ def determine_speaks_for(client_cert, credentials, options, trusted_roots=None):
 
         # Need to validate the agent_cert against the trust roots
         if trusted_roots:
-            agent_gid = gcf.sfa.trust.gid.GID(string=agent_cert)
             try :
-                agent_gid.verify_chain(trusted_roots)
+                verify_cert_chain(agent_cert, trusted_roots)
             except Exception, e:
                 chapi_info("SPEAKSFOR", "Agent certificate not trusted %s"
                            % (agent_urn))
@@ -0,0 +1,161 @@
+#----------------------------------------------------------------------
+# Copyright (c) 2011-2015 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+
+# Bounded, thread-safe caches with per-entry expiration, shared by all
+# threads of the CHAPI process.
+#
+# Entries may carry tags (e.g. a member UID) so that everything derived
+# from some piece of state can be dropped when that state changes.
+
+from collections import OrderedDict
+import threading
+import time
+from metrics import get_metrics_registry
+
+# All named caches created in this process, by name
+_caches = {}
+_caches_lock = threading.Lock()
+
+class TimedCache:
+
+    def __init__(self, name, max_size=1000, default_ttl=60):
+        self._name = name
+        self._max_size = max_size
+        self._default_ttl = default_ttl
+        self._lock = threading.Lock()
+        # key => (expiration, value, tags), least recently used first
+        self._entries = OrderedDict()
+        # tag => set of keys
+        self._keys_by_tag = {}
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    # Return cached value for key, or default if absent or expired
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self._misses += 1
+                return default
+            if entry[0] <= time.time():
+                self._unlink(key, entry)
+                self._misses += 1
+                return default
+            # Re-insert to mark as most recently used
+            self._entries[key] = entry
+            self._hits += 1
+            return entry[1]
+
+    # Store value for key for ttl seconds (default_ttl if None)
+    def put(self, key, value, ttl=None, tags=()):
+        if ttl is None:
+            ttl = self._default_ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            old_entry = self._entries.pop(key, None)
+            if old_entry is not None:
+                self._unlink(key, old_entry)
+            tags = tuple(tags)
+            self._entries[key] = (time.time() + ttl, value, tags)
+            for tag in tags:
+                self._keys_by_tag.setdefault(tag, set()).add(key)
+            while len(self._entries) > self._max_size:
+                lru_key, lru_entry = self._entries.popitem(last=False)
+                self._unlink(lru_key, lru_entry)
+                self._evictions += 1
+
+    # Drop a single key
+    def invalidate(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._unlink(key, entry)
+
+    # Drop all entries stored with the given tag
+    def invalidate_tag(self, tag):
+        with self._lock:
+            for key in self._keys_by_tag.pop(tag, set()):
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    self._unlink(key, entry)
+
+    # Drop all entries
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_tag.clear()
+
+    # Return dictionary of cache size and hit/miss/eviction counts
+    def stats(self):
+        with self._lock:
+            return {'name' : self._name,
+                    'size' : len(self._entries),
+                    'max_size' : self._max_size,
+                    'hits' : self._hits,
+                    'misses' : self._misses,
+                    'evictions' : self._evictions}
+
+    # Remove key from tag index. Caller holds the lock and has
+    # already removed the key from _entries
+    def _unlink(self, key, entry):
+        for tag in entry[2]:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+# Get the process-wide cache of given name, creating it if necessary
+def get_cache(name, max_size=1000, default_ttl=60):
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = TimedCache(name, max_size, default_ttl)
+        return _caches[name]
+
+# Return stats of all process-wide caches
+def get_cache_stats():
+    with _caches_lock:
+        caches = _caches.values()
+    return [cache.stats() for cache in caches]
+
+# Report cache statistics at /metrics
+def _collect_cache_metrics():
+    stats = get_cache_stats()
+    families = [('hits', 'counter', 'Cache lookups that found an entry'),
+                ('misses', 'counter', 'Cache lookups that found no entry'),
+                ('evictions', 'counter', 'Entries evicted to bound caches'),
+                ('size', 'gauge', 'Entries in caches'),
+                ('max_size', 'gauge', 'Maximum entries in caches')]
+    metrics = []
+    for key, type, help in families:
+        name = 'chapi_cache_%s' % key
+        if type == 'counter':
+            name = name + '_total'
+        metrics.append((name, type, help,
+                        [({'cache' : cache['name']}, cache[key]) \
+                             for cache in stats]))
+    return metrics
+
+get_metrics_registry().register_collector(_collect_cache_metrics)
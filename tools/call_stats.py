@@ -0,0 +1,265 @@
+#----------------------------------------------------------------------
+# Copyright (c) 2011-2015 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+
+# Per-call cost instrumentation, enabled by chapi.call_instrumentation.
+#
+# MethodContext begins a CallStats for each CHAPI call, which is then
+# current for the thread until the call ends. While it is current, SQL
+# statements (see install_sql_timing) and ABAC queries (count_abac_query)
+# are added to it. When the call ends, its costs are logged and added to
+# the process-wide per-method totals (get_call_totals) and metrics.
+#
+# With chapi.call_profile_sample = N, one call in N also runs under
+# cProfile; its profile is saved if the call took at least
+# chapi.call_profile_threshold_ms.
+
+import cProfile
+import os
+import random
+import threading
+import time
+from chapi_log import *
+from metrics import get_metrics_registry
+
+CALL_PHASES = ['guard', 'delegate', 'commit']
+
+# The CallStats of the call running on each thread
+_current = threading.local()
+
+# Costs of one call
+class CallStats:
+
+    def __init__(self, method):
+        self.method = method
+        self.start = time.time()
+        self.elapsed = None
+        self.phases = dict([(phase, 0.0) for phase in CALL_PHASES])
+        self.sql_statements = 0
+        self.sql_time = 0.0
+        self.abac_queries = 0
+        self.profiler = None
+        self._phase = None
+        self._phase_start = None
+
+    # Charge time from now on to the given phase
+    def start_phase(self, phase):
+        now = time.time()
+        if self._phase:
+            self.phases[self._phase] += now - self._phase_start
+        self._phase = phase
+        self._phase_start = now
+
+    def finish(self):
+        self.start_phase(None)
+        self.elapsed = time.time() - self.start
+
+    # List of (name, value) to log
+    def fields(self):
+        fields = [('elapsed', "%.4f" % self.elapsed)]
+        fields += [(phase, "%.4f" % self.phases[phase]) \
+                       for phase in CALL_PHASES]
+        fields += [('sql_statements', self.sql_statements),
+                   ('sql_time', "%.4f" % self.sql_time),
+                   ('abac_queries', self.abac_queries)]
+        return fields
+
+# Return the CallStats of the call on this thread (None if none)
+def current_call_stats():
+    return getattr(_current, 'stats', None)
+
+# Note an ABAC query made by the call on this thread
+def count_abac_query():
+    stats = getattr(_current, 'stats', None)
+    if stats is not None:
+        stats.abac_queries += 1
+
+# Time the statements executed on an engine, for the call on the
+# thread executing them (statements outside a call are not counted)
+def install_sql_timing(engine):
+    from sqlalchemy import event
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    if getattr(_current, 'stats', None) is not None:
+        conn.info.setdefault('call_stats_starts', []).append(time.time())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    starts = conn.info.get('call_stats_starts')
+    if not starts:
+        return
+    start = starts.pop()
+    stats = getattr(_current, 'stats', None)
+    if stats is not None:
+        stats.sql_statements += 1
+        stats.sql_time += time.time() - start
+
+_registry = get_metrics_registry()
+_phase_seconds = _registry.counter(
+    'chapi_call_phase_seconds_total',
+    'Time spent in each phase of instrumented calls',
+    ('service', 'method', 'phase'))
+_sql_statements = _registry.counter(
+    'chapi_call_sql_statements_total',
+    'SQL statements executed by instrumented calls', ('service', 'method'))
+_sql_seconds = _registry.counter(
+    'chapi_call_sql_seconds_total',
+    'Time spent executing SQL statements in instrumented calls',
+    ('service', 'method'))
+_abac_queries = _registry.counter(
+    'chapi_call_abac_queries_total',
+    'ABAC queries made by instrumented calls', ('service', 'method'))
+
+# Add the costs of a call to the metrics served at /metrics
+def _count_call_metrics(stats, service):
+    labels = (service, stats.method)
+    for phase in CALL_PHASES:
+        _phase_seconds.inc(labels + (phase,), stats.phases[phase])
+    _sql_statements.inc(labels, stats.sql_statements)
+    _sql_seconds.inc(labels, stats.sql_time)
+    _abac_queries.inc(labels, stats.abac_queries)
+
+# Process-wide totals of call costs by method
+class CallTotals:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}
+
+    def add(self, stats, error):
+        with self._lock:
+            totals = self._totals.get(stats.method)
+            if totals is None:
+                totals = {'calls' : 0, 'errors' : 0, 'elapsed' : 0.0,
+                          'elapsed_max' : 0.0, 'sql_statements' : 0,
+                          'sql_time' : 0.0, 'abac_queries' : 0,
+                          'profiled' : 0}
+                for phase in CALL_PHASES:
+                    totals[phase] = 0.0
+                self._totals[stats.method] = totals
+            totals['calls'] += 1
+            if error:
+                totals['errors'] += 1
+            totals['elapsed'] += stats.elapsed
+            totals['elapsed_max'] = max(totals['elapsed_max'], stats.elapsed)
+            for phase in CALL_PHASES:
+                totals[phase] += stats.phases[phase]
+            totals['sql_statements'] += stats.sql_statements
+            totals['sql_time'] += stats.sql_time
+            totals['abac_queries'] += stats.abac_queries
+            if stats.profiler:
+                totals['profiled'] += 1
+
+    # Return dictionary method => dictionary of totals
+    def stats(self):
+        with self._lock:
+            return dict([(method, dict(totals)) \
+                             for method, totals in self._totals.items()])
+
+_call_totals = CallTotals()
+
+def get_call_totals():
+    return _call_totals
+
+# Settings from the chapi.call_* parameters
+class CallInstrumentation:
+
+    def __init__(self, enabled=False, profile_sample=0,
+                 profile_threshold_ms=1000, profile_dir=None):
+        self.enabled = enabled
+        self.profile_sample = profile_sample
+        self.profile_threshold = profile_threshold_ms / 1000.0
+        self.profile_dir = profile_dir
+
+    # Start recording the costs of a call on this thread
+    # Return its CallStats, or None if not instrumenting this call
+    # (disabled, or nested inside another instrumented call)
+    def begin(self, method):
+        if not self.enabled or current_call_stats() is not None:
+            return None
+        stats = CallStats(method)
+        _current.stats = stats
+        if self.profile_sample > 0 and \
+                random.randint(1, self.profile_sample) == 1:
+            stats.profiler = cProfile.Profile()
+            stats.profiler.enable()
+        stats.start_phase('guard')
+        return stats
+
+    # Stop recording a call: log its costs and add them to the totals
+    def end(self, stats, error, log_prefix, user):
+        stats.finish()
+        _current.stats = None
+        if stats.profiler:
+            stats.profiler.disable()
+        fields = stats.fields() + [('error', error)]
+        chapi_info(log_prefix, "Stats for %s: %s" % \
+                       (stats.method,
+                        " ".join(["%s=%s" % field for field in fields])),
+                   {'user' : user})
+        _call_totals.add(stats, error)
+        _count_call_metrics(stats, log_prefix)
+        if stats.profiler and stats.elapsed >= self.profile_threshold:
+            self._saveProfile(stats, log_prefix, user)
+
+    def _saveProfile(self, stats, log_prefix, user):
+        filename = os.path.join(self.profile_dir, "%s-%s-%d.prof" % \
+                                    (stats.method,
+                                     time.strftime('%Y%m%d%H%M%S',
+                                                   time.gmtime(stats.start)),
+                                     int(stats.elapsed * 1000)))
+        try:
+            if not os.path.isdir(self.profile_dir):
+                os.makedirs(self.profile_dir)
+            stats.profiler.dump_stats(filename)
+            chapi_info(log_prefix, "Saved profile of %s (%.3f seconds) in %s" \
+                           % (stats.method, stats.elapsed, filename),
+                       {'user' : user})
+        except Exception, e:
+            chapi_warn(log_prefix, "Cannot save profile of %s in %s: %s" % \
+                           (stats.method, filename, e))
+
+_call_instrumentation = None
+_call_instrumentation_lock = threading.Lock()
+
+# Get the process-wide settings, reading them on first use
+# (instrumentation is off when not running inside CHAPI)
+def get_call_instrumentation():
+    global _call_instrumentation
+    if _call_instrumentation is None:
+        with _call_instrumentation_lock:
+            if _call_instrumentation is None:
+                try:
+                    import amsoil.core.pluginmanager as pm
+                    config = pm.getService('config')
+                    instrumentation = CallInstrumentation(
+                        config.get('chapi.call_instrumentation'),
+                        config.get('chapi.call_profile_sample'),
+                        config.get('chapi.call_profile_threshold_ms'),
+                        config.get('chapi.call_profile_dir'))
+                except Exception:
+                    instrumentation = CallInstrumentation()
+                _call_instrumentation = instrumentation
+    return _call_instrumentation
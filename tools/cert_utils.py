@@ -27,8 +27,19 @@ import os
 import os.path
 import tempfile
 import datetime
+import hashlib
+import threading
+import uuid as uuidlib
+from collections import namedtuple
 import OpenSSL
 from chapi_log import *
+from cache_utils import get_cache
+
+# Key size for generated private keys
+CSR_KEY_BITS = 1024
+
+# Digest for certificates signed in-process (default_md in openssl.cnf)
+CERT_DIGEST = 'sha1'
 
 # A set of utilities to pull infomration out of X509 certs
 
@@ -43,51 +54,63 @@ def get_cert_from_credential(cred):
     cert_string = '-----BEGIN CERTIFICATE-----\n%s\n-----END CERTIFICATE-----' % raw_cert
     return cert_string
 
-# Pull out the UUID from the certificate
-def get_uuid_from_cert(cert):
+# Identity fields of a certificate, parsed once (see get_cert_info)
+CertInfo = namedtuple('CertInfo', ['urn', 'uuid', 'email', 'expiration'])
+
+# Bounds on the cache of parsed certificates
+CERT_INFO_CACHE_SIZE = 10000
+CERT_INFO_CACHE_TTL = 3600
+
+# Return the CertInfo for the given certificate (PEM).
+# Certificates are parsed once and remembered by digest.
+def get_cert_info(cert):
+    cache = get_cache('cert_utils.cert_info', CERT_INFO_CACHE_SIZE,
+                      CERT_INFO_CACHE_TTL)
+    key = hashlib.sha1(cert).hexdigest()
+    info = cache.get(key)
+    if info is None:
+        info = _parse_cert_info(cert)
+        cache.put(key, info)
+    return info
+
+def _parse_cert_info(cert):
     cert_object = gcf.sfa.trust.certificate.Certificate(string=cert)
     subject_alt_names = cert_object.get_extension('subjectAltName')
-    san_parts = subject_alt_names.split(',')
+    san_parts = [san_part.strip() for san_part in subject_alt_names.split(',')]
+    urn = None
     uuid = None
+    email = None
     for san_part in san_parts:
-        san_part = san_part.strip()
-        if san_part.startswith('URI:urn:uuid'):
+        if urn is None and san_part.startswith('URI:urn:publicid'):
+            urn = san_part[4:]
+        elif uuid is None and san_part.startswith('URI:urn:uuid'):
             uuid = san_part[13:]
-            break
+        elif email is None and san_part.startswith('email:'):
+            email = san_part[6:]
     # The MA cert has the uuid in the field URI:uuid (which is wrong)
     if uuid is None:
         for san_part in san_parts:
-            san_part = san_part.strip()
             if san_part.startswith('URI:uuid'):
                 uuid = san_part[9:]
                 break
-    return uuid
+    expiration = None
+    try:
+        expiration = get_expiration_from_cert(cert)
+    except Exception, e:
+        chapi_warn("UTILS", "Unable to read certificate expiration: %s" % e)
+    return CertInfo(urn, uuid, email, expiration)
+
+# Pull out the UUID from the certificate
+def get_uuid_from_cert(cert):
+    return get_cert_info(cert).uuid
 
 # Pull out the URN from the certificate
 def get_urn_from_cert(cert):
-    cert_object = gcf.sfa.trust.certificate.Certificate(string=cert)
-    subject_alt_names = cert_object.get_extension('subjectAltName')
-    san_parts = subject_alt_names.split(',')
-    urn = None
-    for san_part in san_parts:
-        san_part = san_part.strip()
-        if san_part.startswith('URI:urn:publicid'):
-            urn = san_part[4:]
-            break
-    return urn
+    return get_cert_info(cert).urn
 
 # Pull out the email from the certificate
 def get_email_from_cert(cert):
-    cert_object = gcf.sfa.trust.certificate.Certificate(string=cert)
-    subject_alt_names = cert_object.get_extension('subjectAltName')
-    san_parts = subject_alt_names.split(',')
-    email = None
-    for san_part in san_parts:
-        san_part = san_part.strip()
-        if san_part.startswith('email:'):
-            email = san_part[6:]
-            break
-    return email
+    return get_cert_info(cert).email
 
 # Pull expiration datetime from certificate
 def get_expiration_from_cert(cert):
@@ -152,10 +175,164 @@ def make_csr_from_key(private_key):
     os.unlink(key_file)
     return private_key, csr_file
 
-# Generate an X509 cert and private key
+# Whether to sign certificates in-process rather than with the
+# openssl command line tool. Defaults to True outside of CHAPI.
+def use_native_signing():
+    try:
+        import amsoil.core.pluginmanager as pm
+        config = pm.getService('config')
+        return bool(config.get('chapi.native_cert_signing'))
+    except Exception:
+        return True
+
+# Generate a private key and CSR in memory.
+# If private_key (PEM) is given, use it rather than making a new one.
+# Return (private key PEM, CSR PEM)
+def make_csr_pem(private_key=None):
+    if not use_native_signing():
+        if private_key:
+            private_key, csr_file = make_csr_from_key(private_key)
+        else:
+            private_key, csr_file = make_csr()
+        csr_pem = open(csr_file).read()
+        os.unlink(csr_file)
+        return private_key, csr_pem
+
+    if private_key:
+        pkey = OpenSSL.crypto.load_privatekey(OpenSSL.crypto.FILETYPE_PEM,
+                                              private_key)
+    else:
+        pkey = OpenSSL.crypto.PKey()
+        pkey.generate_key(OpenSSL.crypto.TYPE_RSA, CSR_KEY_BITS)
+        private_key = OpenSSL.crypto.dump_privatekey(OpenSSL.crypto.FILETYPE_PEM,
+                                                     pkey)
+    req = OpenSSL.crypto.X509Req()
+    req.set_pubkey(pkey)
+    req.sign(pkey, CERT_DIGEST)
+    csr_pem = OpenSSL.crypto.dump_certificate_request(OpenSSL.crypto.FILETYPE_PEM,
+                                                      req)
+    return private_key, csr_pem
+
+# Signs certificates with a CA cert and key held in memory.
+# Produces the same extensions as the v3_user section make_cert
+# hands to 'openssl ca'.
+class CertificateSigner(object):
+
+    def __init__(self, signer_cert_file, signer_key_file):
+        self._signer_cert = \
+            OpenSSL.crypto.load_certificate(OpenSSL.crypto.FILETYPE_PEM,
+                                            open(signer_cert_file).read())
+        self._signer_key = \
+            OpenSSL.crypto.load_privatekey(OpenSSL.crypto.FILETYPE_PEM,
+                                           open(signer_key_file).read())
+
+    # Sign the given CSR (PEM), returning the certificate PEM
+    def sign(self, uuid, email, urn, csr_pem, days=365,
+             use_csr_subject=False):
+        days = int(days)
+        req = OpenSSL.crypto.load_certificate_request(OpenSSL.crypto.FILETYPE_PEM,
+                                                      csr_pem)
+        # As 'openssl ca' does, refuse a CSR not signed by its own key
+        try:
+            req.verify(req.get_pubkey())
+        except OpenSSL.crypto.Error:
+            raise Exception("Signature did not match the certificate request")
+        cert = OpenSSL.crypto.X509()
+        cert.set_version(2)
+        # Random serials: no shared serial file to lock and update.
+        # 'openssl ca -revoke' adds unknown serials to its database.
+        cert.set_serial_number(uuidlib.uuid4().int >> 1)
+        cert.gmtime_adj_notBefore(0)
+        cert.gmtime_adj_notAfter(days * 24 * 60 * 60)
+        cert.set_issuer(self._signer_cert.get_subject())
+        if use_csr_subject:
+            cert.set_subject(req.get_subject())
+        else:
+            subject = cert.get_subject()
+            subject.CN = str(uuid)
+            if email:
+                subject.emailAddress = str(email)
+        cert.set_pubkey(req.get_pubkey())
+
+        if email:
+            san = "email:%s,URI:%s,URI:urn:uuid:%s" % (email, urn, uuid)
+        else:
+            san = "URI:%s,URI:urn:uuid:%s" % (urn, uuid)
+        X509Extension = OpenSSL.crypto.X509Extension
+        cert.add_extensions([
+                X509Extension('subjectKeyIdentifier', False, 'hash',
+                              subject=cert),
+                X509Extension('authorityKeyIdentifier', False,
+                              'keyid:always,issuer:always',
+                              issuer=self._signer_cert),
+                X509Extension('basicConstraints', False, 'CA:false'),
+                X509Extension('subjectAltName', False, str(san))])
+        cert.sign(self._signer_key, CERT_DIGEST)
+        return OpenSSL.crypto.dump_certificate(OpenSSL.crypto.FILETYPE_PEM,
+                                               cert)
+
+    # Sign a list of (uuid, email, urn, csr_pem) tuples.
+    # Return a list of certificate PEMs in the same order
+    def sign_batch(self, requests, days=365):
+        return [self.sign(uuid, email, urn, csr_pem, days)
+                for uuid, email, urn, csr_pem in requests]
+
+_signers = {}
+_signers_lock = threading.Lock()
+
+# Return the (cached) signer for the given CA cert and key files
+def get_certificate_signer(signer_cert_file, signer_key_file):
+    key = (signer_cert_file, signer_key_file)
+    with _signers_lock:
+        if key not in _signers:
+            _signers[key] = CertificateSigner(signer_cert_file,
+                                              signer_key_file)
+        return _signers[key]
+
+# Generate an X509 cert from a CSR held in memory
+# Return cert
+def make_cert_from_csr(uuid, email, urn, signer_cert_file, signer_key_file,
+                       csr_pem, days=365, use_csr_subject=False):
+    if use_native_signing():
+        signer = get_certificate_signer(signer_cert_file, signer_key_file)
+        return signer.sign(uuid, email, urn, csr_pem, days, use_csr_subject)
+
+    (csr_fd, csr_file) = tempfile.mkstemp()
+    os.write(csr_fd, csr_pem)
+    os.close(csr_fd)
+    try:
+        return _make_cert_openssl(uuid, email, urn, signer_cert_file,
+                                  signer_key_file, csr_file, days,
+                                  use_csr_subject)
+    finally:
+        os.unlink(csr_file)
+
+# Generate X509 certs for a list of (uuid, email, urn, csr_pem) tuples
+# Return a list of certs in the same order
+def make_certs(requests, signer_cert_file, signer_key_file, days=365):
+    if use_native_signing():
+        signer = get_certificate_signer(signer_cert_file, signer_key_file)
+        return signer.sign_batch(requests, days)
+    return [make_cert_from_csr(uuid, email, urn, signer_cert_file,
+                               signer_key_file, csr_pem, days)
+            for uuid, email, urn, csr_pem in requests]
+
+# Generate an X509 cert from a CSR file
 # Return cert
 def make_cert(uuid, email, urn, signer_cert_file, signer_key_file, csr_file,
               days=365, use_csr_subject=False):
+    if use_native_signing():
+        csr_pem = open(csr_file).read()
+        signer = get_certificate_signer(signer_cert_file, signer_key_file)
+        return signer.sign(uuid, email, urn, csr_pem, days, use_csr_subject)
+    return _make_cert_openssl(uuid, email, urn, signer_cert_file,
+                              signer_key_file, csr_file, days,
+                              use_csr_subject)
+
+# Generate an X509 cert with the openssl command line tool
+# Return cert
+def _make_cert_openssl(uuid, email, urn, signer_cert_file, signer_key_file,
+                       csr_file, days=365, use_csr_subject=False):
 
     import amsoil.core.pluginmanager as pm
     config = pm.getService('config')
@@ -38,14 +38,42 @@ PGCH_LOG_PREFIX = "PGCH"
 SR_LOG_PREFIX = "SR"
 LOG_LOG_PREFIX = "LOG"
 
+# Verbosity of the invocation and result messages of a method
+LOG_QUIET = 'quiet' # Not logged
+LOG_BRIEF = 'brief' # Truncated to LOG_MESSAGE_LENGTH characters
+LOG_FULL = 'full'   # Logged in full (at DEBUG level if enabled) and audited
+LOG_VERBOSITIES = [LOG_QUIET, LOG_BRIEF, LOG_FULL]
+
+# Length of brief invocation and result messages
+LOG_MESSAGE_LENGTH = 250
+
 # Class just to hold the is_verbose flag from Parameters.py
+# and the per-method verbosity (chapi.log_method_verbosity)
 class CHAPIVerbose(object):
     def __init__(self, verbose=False):
         self.verbose=verbose
+        self.method_verbosity = {}
     def setVerbose(self, verbose=True):
         self.verbose=verbose
     def isVerbose(self):
         return self.verbose
+    # Parse "method:verbosity, ..."
+    def setMethodVerbosity(self, spec):
+        method_verbosity = {}
+        for entry in spec.split(','):
+            if not entry.strip(): continue
+            parts = [part.strip() for part in entry.split(':')]
+            if len(parts) != 2 or parts[1] not in LOG_VERBOSITIES:
+                chapi_warn("LOGGING", "Ignoring log verbosity %s" % entry.strip())
+                continue
+            method_verbosity[parts[0]] = parts[1]
+        self.method_verbosity = method_verbosity
+    def methodVerbosity(self, method):
+        if method in self.method_verbosity:
+            return self.method_verbosity[method]
+        if self.verbose:
+            return LOG_FULL
+        return LOG_BRIEF
 
 verboseObj = CHAPIVerbose()
 
@@ -128,37 +156,133 @@ def chapi_log_exception(prefix, e, extra=None):
     chapi_error(prefix, msg, extra=extra)
     chapi_audit(prefix, msg, logging.ERROR, extra=extra)
 
-# Log an invocation of a method
-def chapi_log_invocation(prefix, method, credentials, options, arguments, extra=None):
-    msg = "Invoked %s Options %s Arguments %s" % (method, options, arguments)
-    # FIXME: Info or debug?
-    chapi_logger = chapi_get_logger()
-    if verboseObj.isVerbose() and chapi_logger.isEnabledFor(logging.DEBUG):
-        chapi_debug(prefix, msg, extra=extra)
+# Raised to stop formatting once enough has been written
+class _LimitReached(Exception):
+    pass
+
+# Collect text up to a limit
+class _BoundedText(object):
+    def __init__(self, limit):
+        self.pieces = []
+        self.remaining = limit
+    def write(self, text):
+        if len(text) >= self.remaining:
+            self.pieces.append(text[:self.remaining])
+            self.remaining = 0
+            raise _LimitReached()
+        self.pieces.append(text)
+        self.remaining -= len(text)
+
+def _write_sequence(out, items, opening, closing, write_item):
+    out.write(opening)
+    first = True
+    for item in items:
+        if not first: out.write(', ')
+        first = False
+        write_item(out, item)
+    out.write(closing)
+
+def _write_dict_item(out, item):
+    _write_repr(out, item[0])
+    out.write(': ')
+    _write_repr(out, item[1])
+
+# Write repr(value), stopping once out is full
+def _write_repr(out, value):
+    value_type = type(value)
+    if value_type is dict:
+        _write_sequence(out, value.iteritems(), '{', '}', _write_dict_item)
+    elif value_type is list:
+        _write_sequence(out, value, '[', ']', _write_repr)
+    elif value_type is tuple:
+        if len(value) == 1:
+            out.write('(')
+            _write_repr(out, value[0])
+            out.write(',)')
+        else:
+            _write_sequence(out, value, '(', ')', _write_repr)
+    elif isinstance(value, basestring) and len(value) > out.remaining:
+        # Don't copy all of a long string (e.g. a certificate)
+        out.write(repr(value[:out.remaining]))
     else:
-        if len(msg) > 260:
-            chapi_info(prefix, msg[:250] + "...", extra=extra)
+        out.write(repr(value))
+
+# Return the first limit characters of "%s" % value, formatting only
+# as much of value (e.g. a large lookup result) as needed
+def bounded_str(value, limit):
+    if isinstance(value, basestring):
+        return value[:limit]
+    out = _BoundedText(limit)
+    try:
+        if type(value) in (dict, list, tuple):
+            _write_repr(out, value)
         else:
-            chapi_info(prefix, msg, extra=extra)
+            out.write(str(value))
+    except _LimitReached:
+        pass
+    return ''.join(out.pieces)
 
-    if verboseObj.isVerbose():
-        # Send to syslog at INFO level
-        chapi_audit(prefix, msg, logging.INFO, extra=extra)
+# A log message "PREFIX: user: template % args", only formatted if and
+# when a handler emits it. With a limit, each argument is formatted only
+# as far as needed and the message is cut to limit characters.
+class LazyLogMessage(object):
+    def __init__(self, prefix, user, template, args, limit=None):
+        self.prefix = prefix
+        self.user = user
+        self.template = template
+        self.args = args
+        self.limit = limit
+        self._text = None
+    def __str__(self):
+        if self._text is None:
+            if self.limit is None:
+                msg = self.template % self.args
+            else:
+                # Allow for short messages a little over the limit
+                args = tuple([bounded_str(arg, self.limit + 11) \
+                                  for arg in self.args])
+                msg = self.template % args
+                if len(msg) > self.limit + 10:
+                    msg = msg[:self.limit] + "..."
+            if isinstance(msg, unicode): msg = msg.encode('utf-8')
+            if self.user is not None and self.user.strip() != '':
+                msg = "%s: %s" % (self.user.strip(), msg)
+            self._text = "%s: %s" % (self.prefix, msg)
+        return self._text
 
-# Log the result of an invocation of a method
-def chapi_log_result(prefix, method, result, extra=None):
-    msg = "Result from %s: %s" % (method, result)
-    # FIXME: Info or debug?
+# Log an invocation or result message at the method's verbosity
+# The records carry the user and method as fields
+def _chapi_log_call(prefix, method, template, args, extra):
+    verbosity = verboseObj.methodVerbosity(method)
+    if verbosity == LOG_QUIET:
+        return
+    user = None
+    if extra is not None:
+        user = extra.get('user')
+    fields = {'user' : user, 'method' : method}
     chapi_logger = chapi_get_logger()
-    if verboseObj.isVerbose() and chapi_logger.isEnabledFor(logging.DEBUG):
-        chapi_debug(prefix, msg, extra=extra)
-    else:
-        if len(msg) > 260:
-            chapi_info(prefix, msg[:250] + "...", extra=extra)
+    if verbosity == LOG_FULL:
+        msg = LazyLogMessage(prefix, user, template, args)
+        if chapi_logger.isEnabledFor(logging.DEBUG):
+            chapi_logger.debug(msg, extra=fields)
         else:
-            chapi_info(prefix, msg, extra=extra)
-
-    if verboseObj.isVerbose():
+            chapi_logger.info(LazyLogMessage(prefix, user, template, args,
+                                             LOG_MESSAGE_LENGTH),
+                              extra=fields)
         # Send to syslog at INFO level
-        chapi_audit(prefix, msg, logging.INFO, extra=extra)
+        chapi_get_audit_logger().info(msg, extra=fields)
+    else:
+        chapi_logger.info(LazyLogMessage(prefix, user, template, args,
+                                         LOG_MESSAGE_LENGTH),
+                          extra=fields)
+
+# Log an invocation of a method
+def chapi_log_invocation(prefix, method, credentials, options, arguments, extra=None):
+    _chapi_log_call(prefix, method, "Invoked %s Options %s Arguments %s",
+                    (method, options, arguments), extra)
+
+# Log the result of an invocation of a method
+def chapi_log_result(prefix, method, result, extra=None):
+    _chapi_log_call(prefix, method, "Result from %s: %s", (method, result),
+                    extra)
 
@@ -20,27 +20,122 @@
 # OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
 # IN THE WORK.
 #----------------------------------------------------------------------
+# Load test a CH method in-process, e.g.
+#
+#    python chapi_scaling.py --url https://localhost/SA \
+#        --object_file slice_uids.txt --user_file users.json \
+#        --method lookup_slices --match_field SLICE_UID \
+#        --num_concurrent 20 [--rate 50] --ramp 10 --warmup 10 --duration 60
+#
+# Each worker thread keeps its own persistent (keep-alive) TLS connection
+# as one of the users in user_file and calls
+#    method(credentials, {'match' : {match_field : <object IDs>}})
+#
+# Closed loop (default): num_concurrent workers call back to back.
+# Open loop (--rate): calls arrive at rate per second (Poisson) and are
+# served by up to num_concurrent workers; latency includes time queued.
+# Workers (closed loop) or the rate (open loop) ramp up over --ramp
+# seconds, the next --warmup seconds are not measured, then calls are
+# measured for --duration seconds (default num_iterations * frequency).
+# Throughput and latency are printed every --frequency seconds, followed
+# by a latency histogram and percentiles of the measured calls.
+
 import os, os.path, sys
 import json
 import optparse
+import Queue
 import random
-import subprocess
-import tempfile
+import ssl
+import threading
 import time
+import xmlrpclib
+
+from latency_stats import HISTOGRAM_BUCKETS, print_histogram, summarize
+
+# XMLRPC over one HTTPS connection, presenting a client certificate,
+# reused for every call (xmlrpclib reconnects if the server closes it)
+class PersistentSafeTransport(xmlrpclib.SafeTransport):
+
+    def __init__(self, cert, key):
+        # The CH certificate is not checked: we are measuring, not trusting
+        context = None
+        if hasattr(ssl, '_create_unverified_context'):
+            context = ssl._create_unverified_context()
+            context.load_cert_chain(cert, key)
+            xmlrpclib.SafeTransport.__init__(self, use_datetime=True,
+                                             context=context)
+        else:
+            xmlrpclib.SafeTransport.__init__(self, use_datetime=True)
+        self._x509 = {'cert_file' : cert, 'key_file' : key}
+
+    def get_host_info(self, host):
+        chost, extra_headers, x509 = \
+            xmlrpclib.SafeTransport.get_host_info(self, host)
+        if getattr(self, 'context', None):
+            return chost, extra_headers, x509
+        return chost, extra_headers, self._x509
+
+# A thread calling the method as one user over its own connection.
+# Closed loop: call back to back until stopped.
+# Open loop: take arrival times from a queue until given None.
+class LoadWorker(threading.Thread):
+
+    def __init__(self, tester, user, arrivals, stop_event):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self._tester = tester
+        self._user = user
+        self._arrivals = arrivals
+        self._stop_event = stop_event
+        # (start, latency, ok) of each call, read by the main thread
+        self.samples = []
+
+    def run(self):
+        transport = PersistentSafeTransport(self._user['cert'],
+                                            self._user['key'])
+        proxy = xmlrpclib.ServerProxy(self._tester._url, transport=transport,
+                                      allow_none=True)
+        method = getattr(proxy, self._tester._method)
+        while not self._stop_event.is_set():
+            if self._arrivals:
+                start = self._arrivals.get()
+                if start is None:
+                    break
+            else:
+                start = time.time()
+            ok = self._call(method)
+            self.samples.append((start, time.time() - start, ok))
+        transport.close()
+
+    def _call(self, method):
+        try:
+            result = method(self._tester._credentials, self._tester._options)
+        except Exception, e:
+            if self._tester._verbose:
+                print "Error calling %s: %s" % (self._tester._method, e)
+            return False
+        if isinstance(result, dict) and result.get('code', 0) != 0:
+            if self._tester._verbose:
+                print "Error calling %s: %s" % (self._tester._method,
+                                                result.get('output'))
+            return False
+        return True
 
 class ScalingTester:
     def __init__(self, url, object_file, user_file, 
-                 match_field, filter_fields, method, client_location):
+                 match_field, filter_fields, method, verbose=False):
         self._url = url
         self._method = method
         self._object_file = object_file
         self._user_file = user_file
         self._match_field = match_field
         self._filter_fields = self._parseFilterFields(filter_fields)
-        self._client_location = client_location
+        self._verbose = verbose
         self._object_ids = self._parseObjectIDs()
-        self._options_file = self._generateOptionsFile()
+        self._options = self._generateOptions()
+        self._credentials = []
         self._users = self._parseUsers()
+        self._workers = []
 
     def _parseObjectIDs(self): 
         ids_raw = open(self._object_file).read()
@@ -55,63 +150,110 @@ class ScalingTester:
         if not filter_fields: return None
         return [ff.strip() for ff in filter_fields.split(',')]
 
-    # Make an options file for querying all objects by ID by field
-    def _generateOptionsFile(self): 
-        (fd, filename) = tempfile.mkstemp()
-        os.close(fd)
+    # Options for querying all objects by ID by field
+    def _generateOptions(self):
         options = {'match' : {self._match_field : self._object_ids}}
         if self._filter_fields:
             options['filter'] = self._filter_fields
-        options_data = json.dumps(options)
-        open(filename, 'w').write(options_data)
-        return filename
-
-    def invoke(self, num_concurrent):
-        (fd, script_filename) = tempfile.mkstemp()
-        os.close(fd)
-        script_file = open(script_filename, 'w')
-        for i in range(num_concurrent):
-            user_index = random.randint(0, len(self._users)-1)
-            user_cert = self._users[user_index]['cert']
-            user_key = self._users[user_index]['key']
-#            print "CERT = %s KEY = %s" % (user_cert, user_key)
-        
-            command_template = "time (python %s --key %s --cert %s " + \
-                "--options_file %s --method %s --url %s 2&>1 > /dev/null) &\n"
-            command =  command_template % \
-                (self._client_location, user_key, user_cert, \
-                     self._options_file, self._method, self._url)
-            script_file.write(command)
-
-        script_file.close()
-#        print "SC = " + script_filename
-        output = self.run_script(script_filename)
-        real_timing_raw = \
-            [line for line in output.split('\n') if line.startswith('real')]
-        real_timing = [rt.split('\t')[1] for rt in real_timing_raw]
-        secs = [self.parseTime(rt) for rt in real_timing]
-        mean = 0; 
-        for sec in secs: mean = mean + sec
-        mean = mean / num_concurrent
-        print "Mean  %s : %s" % (mean, secs) 
-
-    def run_script(self, script_filename):
-        run_script_command = ["/bin/bash", script_filename]
-        proc = subprocess.Popen(run_script_command, stderr=subprocess.PIPE)
-
-        result = ''
-        chunk = proc.stderr.read()
-        while chunk:
-            result = result + chunk
-            chunk = proc.stderr.read()
-        return result
-
-    def parseTime(self, time_min_sec):
-        parts = time_min_sec.split('m')
-        min = int(parts[0]) 
-        sec = float(parts[1].split('s')[0])
-        sec = 60*min + sec
-        return sec
+        return options
+
+    def _startWorker(self, arrivals, stop_event):
+        user = random.choice(self._users)
+        worker = LoadWorker(self, user, arrivals, stop_event)
+        self._workers.append(worker)
+        worker.start()
+
+    # Samples of all workers started in [start, end)
+    def _samples(self, start, end):
+        samples = []
+        for worker in self._workers:
+            samples += [sample for sample in list(worker.samples) \
+                            if start <= sample[0] < end]
+        return samples
+
+    def _report(self, label, start, end):
+        samples = self._samples(start, end)
+        latencies = [latency for call_start, latency, ok in samples if ok]
+        summary = summarize(latencies, len(samples) - len(latencies),
+                            end - start)
+        if 'p50' in summary:
+            print "%s: %d ok %d errors %.1f/sec " \
+                "mean %.3f p50 %.3f p95 %.3f p99 %.3f" % \
+                (label, summary['count'], summary['errors'],
+                 summary['throughput'], summary['mean'], summary['p50'],
+                 summary['p95'], summary['p99'])
+        else:
+            print "%s: %d ok %d errors" % \
+                (label, summary['count'], summary['errors'])
+        return summary
+
+    # Run the load, printing a report every interval seconds, and
+    # return the summary of the measured calls
+    def run(self, num_concurrent, rate, ramp, warmup, duration, interval):
+        stop_event = threading.Event()
+        arrivals = None
+        if rate:
+            arrivals = Queue.Queue()
+            for i in range(num_concurrent):
+                self._startWorker(arrivals, stop_event)
+
+        begin = time.time()
+        measure_start = begin + ramp + warmup
+        measure_end = measure_start + duration
+        next_report = begin + interval
+        next_arrival = begin
+        while True:
+            now = time.time()
+            if now >= measure_end:
+                break
+            if now >= next_report:
+                phase = "measure"
+                if now <= begin + ramp:
+                    phase = "ramp"
+                elif now <= measure_start:
+                    phase = "warmup"
+                self._report("%6.1fs %-7s" % (now - begin, phase),
+                             next_report - interval, next_report)
+                next_report += interval
+            ramp_fraction = 1.0
+            if ramp > 0:
+                ramp_fraction = min(1.0, (now - begin) / ramp)
+            if rate:
+                # Open loop: queue each arrival as it falls due.
+                # Candidates come at the full rate and are thinned to
+                # the ramped rate at their own arrival time
+                while next_arrival <= now:
+                    arrival_fraction = 1.0
+                    if ramp > 0:
+                        arrival_fraction = \
+                            min(1.0, (next_arrival - begin) / ramp)
+                    if random.random() < arrival_fraction:
+                        arrivals.put(next_arrival)
+                    next_arrival += random.expovariate(rate)
+                wake = min(next_arrival, next_report, measure_end)
+            else:
+                # Closed loop: add workers as the ramp proceeds
+                while len(self._workers) < \
+                        max(1, int(round(num_concurrent * ramp_fraction))):
+                    self._startWorker(None, stop_event)
+                wake = min(now + 0.1, next_report, measure_end)
+            time.sleep(max(0, wake - time.time()))
+
+        stop_event.set()
+        if arrivals:
+            backlog = arrivals.qsize()
+            if backlog:
+                print "%d calls were still queued (rate exceeds capacity)" % \
+                    backlog
+            for worker in self._workers:
+                arrivals.put(None)
+        for worker in self._workers:
+            worker.join()
+
+        summary = self._report("Total", measure_start, measure_end)
+        if 'histogram' in summary:
+            print_histogram(summary['histogram'])
+        return summary
 
 def parseOptions(args):
     parser = optparse.OptionParser()
@@ -130,14 +272,28 @@ def parseOptions(args):
                       default="SLICE_UID")
     parser.add_option("--filter_fields", help="List of object fields to select",
                       default=None)
-    parser.add_option("--client_location", help="Location of client.py",
+    parser.add_option("--client_location",
+                      help="Unused (calls are made in-process)",
                       default = "client.py")
     parser.add_option("--num_concurrent", 
                       help="Number concurrent calls", default=1)
-    parser.add_option("--frequency", help='Time to wait between invocations',
+    parser.add_option("--frequency", help='Seconds between progress reports',
                       default=5)
-    parser.add_option("--num_iterations", help="Total iterations to run",
+    parser.add_option("--num_iterations",
+                      help="Number of reports to measure " + \
+                          "(if --duration is not given)",
                       default=10)
+    parser.add_option("--rate",
+                      help="Calls per second (open loop); " + \
+                          "default is closed loop", default=None)
+    parser.add_option("--ramp", help="Seconds to ramp up the load over",
+                      default=0)
+    parser.add_option("--warmup", help="Seconds to run before measuring",
+                      default=0)
+    parser.add_option("--duration", help="Seconds to measure", default=None)
+    parser.add_option("--output", help="File to write JSON results to",
+                      default=None)
+    parser.add_option("--verbose", action="store_true", default=False)
 
     [opts, args] = parser.parse_args(args)
     if not opts.url or not opts.object_file or not opts.user_file:
@@ -151,16 +307,27 @@ def main(args = sys.argv):
     opts = parseOptions(args)
     st = ScalingTester(opts.url, opts.object_file, opts.user_file, \
                            opts.match_field, opts.filter_fields, \
-                           opts.method, opts.client_location)
+                           opts.method, opts.verbose)
 
-    num_iters = int(opts.num_iterations)
-    for iter in range(num_iters):
-        st.invoke(int(opts.num_concurrent))
-        if iter < num_iters-1:
-            time.sleep(int(opts.frequency))
-    
+    interval = float(opts.frequency)
+    duration = interval * int(opts.num_iterations)
+    if opts.duration:
+        duration = float(opts.duration)
+    rate = None
+    if opts.rate:
+        rate = float(opts.rate)
+    summary = st.run(int(opts.num_concurrent), rate, float(opts.ramp),
+                     float(opts.warmup), duration, interval)
+
+    if opts.output:
+        results = {'url' : opts.url, 'method' : opts.method,
+                   'match_field' : opts.match_field,
+                   'num_objects' : len(st._object_ids),
+                   'num_concurrent' : int(opts.num_concurrent),
+                   'rate' : rate, 'duration' : duration,
+                   'histogram_buckets' : HISTOGRAM_BUCKETS}
+        results.update(summary)
+        json.dump(results, open(opts.output, 'w'), indent=2)
 
 if __name__ == "__main__":
     sys.exit(main())
-    
-    
@@ -23,7 +23,10 @@
 
 from chapi_log import *
 from chapi.Exceptions import *
+import base64
+import json
 import types
+from operator import attrgetter
 from datetime import *
 from  sqlalchemy.orm import aliased
 
@@ -85,6 +88,23 @@ def convert_to_external(internal_field, mapping):
     return external_field
 
 
+# Apply the 'to_internal' or 'to_external' converter of a mapping entry
+# to a list of values, returning the converted values in order.
+# If the entry is marked 'vectorized', its converters take and return
+# whole lists (resolving them in one query); otherwise the converter is
+# called once per distinct value
+def convert_values(mapping_entry, direction, values, session):
+    if not values:
+        return []
+    converter = mapping_entry[direction]
+    distinct_values = list(set(values))
+    if mapping_entry.get('vectorized'):
+        converted = converter(distinct_values, session)
+    else:
+        converted = [converter(value, session) for value in distinct_values]
+    converted_values = dict(zip(distinct_values, converted))
+    return [converted_values[value] for value in values]
+
 # Add filter clauses to a query based on given match criteria
 # Return updated query
 def add_filters(query, match_criteria, table, mapping, session):
@@ -97,8 +117,9 @@ def add_filters(query, match_criteria, table, mapping, session):
                 column = table.c[base_field]
                 to_internal = internal_match_field['to_internal']
                 if isinstance(match_value, types.ListType):
-                    match_value = \
-                        [to_internal(mv, session) for mv in match_value]
+                    match_value = convert_values(internal_match_field,
+                                                 'to_internal', match_value,
+                                                 session)
                 else:
                     match_value = to_internal(match_value, session)
             else:
@@ -114,26 +135,77 @@ def add_filters(query, match_criteria, table, mapping, session):
 
 STANDARD_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
 
+# Value as returned to clients: datetimes in the standard format
+def _external_value(value):
+    if isinstance(value, datetime):
+        return value.strftime(STANDARD_DATETIME_FORMAT)
+    return value
+
+# Conversion of rows (sets of values indexed by internal fields)
+# into result rows {external_field : value, external_field : value}.
+# The mapping lookups are done once, when the projection is built,
+# rather than for every column of every row.
+class RowProjection(object):
+
+    def __init__(self, columns, mapping):
+        # (external name, row => value)
+        self._plain = []
+        # (external name, row => internal value, mapping entry)
+        self._converted = []
+        for column in columns:
+            internal_name = convert_to_internal(column, mapping)
+            if isinstance(internal_name, types.DictionaryType):
+                getter = attrgetter(internal_name['base_field'])
+                self._converted.append((column, getter, internal_name))
+            elif isinstance(internal_name, types.FunctionType):
+                self._plain.append((column, internal_name))
+            else:
+                self._plain.append((column, attrgetter(internal_name)))
+
+    def __call__(self, row, session):
+        return self.project_rows([row], session)[0]
+
+    # Project a list of rows.
+    # Converters are applied a column at a time over all the rows
+    # (see convert_values)
+    def project_rows(self, rows, session):
+        result_rows = []
+        for row in rows:
+            result_row = {}
+            for column, getter in self._plain:
+                result_row[column] = _external_value(getter(row))
+            result_rows.append(result_row)
+        for column, getter, mapping_entry in self._converted:
+            values = convert_values(mapping_entry, 'to_external',
+                                    [getter(row) for row in rows], session)
+            for value, result_row in zip(values, result_rows):
+                result_row[column] = _external_value(value)
+        return result_rows
+
 # Construct a result row {external_field : value, external_field : value} 
 # from row which is a set of values indexed by internal fields
 def construct_result_row(row, columns, mapping, session):
-    result_row = {}
-    for column in columns:
-        internal_name = convert_to_internal(column, mapping)
-#        print "IN = " + str(internal_name) + " " + str(type(internal_name))
-        if isinstance(internal_name, types.DictionaryType):
-            base_field = internal_name['base_field']
-            internal_value = eval("row.%s" % base_field)
-            to_external = internal_name['to_external']
-            column_value = to_external(internal_value, session)
-        elif isinstance(internal_name, types.FunctionType):
-            column_value = internal_name(row)
-        else:
-            column_value = eval("row.%s" % internal_name)
-        if isinstance(column_value, datetime):
-            column_value = column_value.strftime(STANDARD_DATETIME_FORMAT)
-        result_row[column] = column_value
-    return result_row
+    return RowProjection(columns, mapping)(row, session)
+
+# Construct the result rows for a list of rows (in order)
+def construct_result_rows(rows, columns, mapping, session):
+    return [result_row for row, result_row \
+                in iter_result_rows(rows, columns, mapping, session)]
+
+# Project rows as they are iterated (e.g. streamed by a PagedQuery),
+# STREAM_BATCH_SIZE rows at a time, yielding (row, result row) pairs
+def iter_result_rows(rows, columns, mapping, session):
+    projection = RowProjection(columns, mapping)
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == STREAM_BATCH_SIZE:
+            for item in zip(batch, projection.project_rows(batch, session)):
+                yield item
+            batch = []
+    if batch:
+        for item in zip(batch, projection.project_rows(batch, session)):
+            yield item
 
 def unpack_query_options(options, mapping):
     """Unpack the query options and return a tuple of
@@ -151,20 +223,90 @@ def unpack_query_options(options, mapping):
 
     return selected_columns, match_criteria
 
+# Keyset pagination of lookups
+#   'limit' : maximum number of results to return
+#   'cursor' : token returned with the previous page (as 'cursor')
+# Results are ordered by a stable key; a page continues after the
+# last key of the previous page.
+
+# Rows fetched from the database at a time when streaming results
+STREAM_BATCH_SIZE = 500
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key))
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(str(cursor)))
+    except Exception:
+        raise CHAPIv1ArgumentError("Invalid cursor option: %s" % cursor)
+
+# Return (limit, key after which to start) from options.
+# Either may be None
+def unpack_page_options(options):
+    limit = None
+    if 'limit' in options:
+        limit = options['limit']
+        if not isinstance(limit, (int, long)) or isinstance(limit, bool) \
+                or limit <= 0:
+            raise CHAPIv1ArgumentError("Invalid limit option: %s" % limit)
+    after = None
+    if 'cursor' in options:
+        after = decode_cursor(options['cursor'])
+    return limit, after
+
+# A query restricted to the page requested by options, whose rows are
+# streamed from the database as they are iterated.
+# After iterating, cursor is the token for the next page (or None).
+class PagedQuery(object):
+
+    def __init__(self, query, options, key_column):
+        self.limit, after = unpack_page_options(options)
+        self._key = key_column.key
+        if self.limit or after is not None:
+            query = query.order_by(None).order_by(key_column)
+        if after is not None:
+            query = query.filter(key_column > after)
+        if self.limit:
+            # One extra row tells us whether there is another page
+            query = query.limit(self.limit + 1)
+        self._query = query.execution_options(stream_results=True)
+        self.cursor = None
+
+    def __iter__(self):
+        count = 0
+        last_key = None
+        for row in self._query.yield_per(STREAM_BATCH_SIZE):
+            if self.limit and count == self.limit:
+                self.cursor = encode_cursor(last_key)
+                break
+            last_key = getattr(row, self._key)
+            count += 1
+            yield row
+
+# Restrict a list of keys (e.g. member ids) to the page requested by
+# options. Return the sorted keys of the page and the cursor for the
+# next page (or None)
+def page_keys(keys, options):
+    limit, after = unpack_page_options(options)
+    keys = sorted(keys)
+    if after is not None:
+        keys = [key for key in keys if key > after]
+    cursor = None
+    if limit and len(keys) > limit:
+        keys = keys[:limit]
+        cursor = encode_cursor(keys[-1])
+    return keys, cursor
+
 # Split the set of member urns into enabled and disabled member urns
 def check_disabled_users(db, member_urns, session):
     if member_urns is None or (isinstance(member_urns, types.ListType) and len(member_urns) == 0):
         return [], []
-    ma1 = aliased(db.MEMBER_ATTRIBUTE_TABLE)
-    ma2 = aliased(db.MEMBER_ATTRIBUTE_TABLE)
-    q = session.query(ma1.c.value)
-    q = q.filter(ma1.c.member_id == ma2.c.member_id)
-    q = q.filter(ma1.c.name == 'urn')
-    q = q.filter(ma1.c.value.in_(member_urns))
-    q = q.filter(ma2.c.name == 'member_enabled')
-    q = q.filter(ma2.c.value == 'n')
+    q = session.query(db.MEMBER_SUMMARY_TABLE.c.urn)
+    q = q.filter(db.MEMBER_SUMMARY_TABLE.c.urn.in_(member_urns))
+    q = q.filter(db.MEMBER_SUMMARY_TABLE.c.member_enabled == False)
     rows = q.all()
-    disabled_members = [row.value for row in rows]
+    disabled_members = [row.urn for row in rows]
     enabled_members = [member_urn for member_urn in member_urns \
                            if member_urn not in disabled_members]
     return enabled_members, disabled_members
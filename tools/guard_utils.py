@@ -27,7 +27,7 @@
 import amsoil.core.pluginmanager as pm
 from  sqlalchemy import *
 from  sqlalchemy.orm import aliased
-import threading
+from cache_utils import get_cache
 from geni_utils import *
 from cert_utils import *
 from geni_constants import *
@@ -39,38 +39,94 @@ from dbutils import add_filters
 from chapi_log import *
 import json
 
-# context support
-_context = threading.local()
-
 # Set up caching of constant relationships of different sorts
+# These caches are shared by all threads. Entries expire after a lifetime
+# and are dropped explicitly by the write paths that change them
+# (see the invalidate_* functions below)
+
+# How long do we keep cache entries for operator privileges
+OPERATOR_CACHE_LIFETIME_SECS = 60
+# How long do we keep cache entries for PI privileges
+PI_CACHE_LIFETIME_SECS = 60
+# How long do we keep cache entries for a member's projects
+PROJECT_NAMES_CACHE_LIFETIME_SECS = 60
+# How long do we keep cache entries for mutable member identifiers
+MEMBER_IDENTIFIER_CACHE_LIFETIME_SECS = 600
+# How long do we keep cache entries for immutable mappings
+CONSTANT_CACHE_LIFETIME_SECS = 3600
+
+# Maximum number of entries in each cache
+GUARD_CACHE_SIZE = 10000
+
+GUARD_CACHE_LIFETIMES = {
+    'project_names_for_user' : PROJECT_NAMES_CACHE_LIFETIME_SECS,
+    'member_uid_to_email' : MEMBER_IDENTIFIER_CACHE_LIFETIME_SECS,
+    'member_email_to_uid' : MEMBER_IDENTIFIER_CACHE_LIFETIME_SECS,
+    'member_eppn_to_uid' : MEMBER_IDENTIFIER_CACHE_LIFETIME_SECS,
+    'operator_privilege' : OPERATOR_CACHE_LIFETIME_SECS,
+    'pi_privilege' : PI_CACHE_LIFETIME_SECS
+    }
+
+# All caches created through cache_get
+GUARD_CACHE_NAMES = set()
 
 # Get the cache of a given name (or create if doesn't exist)
 def cache_get(k):
-    if not hasattr(_context, 'cache'):
-        _context.cache = dict()
-    if k not in _context.cache:
-        _context.cache[k] = dict()
-    return _context.cache[k]
+    GUARD_CACHE_NAMES.add(k)
+    lifetime = GUARD_CACHE_LIFETIMES.get(k, CONSTANT_CACHE_LIFETIME_SECS)
+    return get_cache('guard_utils.%s' % k, GUARD_CACHE_SIZE, lifetime)
 
-# Remove cache 
+# Empty all caches
 def cache_clear():
-    if hasattr(_context, 'cache'):
-        del _context.cache
-
-# Manage caches that timeout
-
-# Lookup the entry for a given urn (keys: timestamp and value) if not timed out
-def timed_cache_lookup(cache, urn, lifetime):
-    timeout = datetime.utcnow() - timedelta(seconds=lifetime)
-    if urn in cache and cache[urn]['timestamp'] > timeout:
-        return cache[urn]
-    return None
-
-# Register value with timestamp
-def timed_cache_register(cache, urn, value):
-    now = datetime.utcnow()
-    cache[urn] = {'timestamp' : now, 'value' : value}
-    
+    for k in list(GUARD_CACHE_NAMES):
+        cache_get(k).clear()
+
+# Return stats (size, hits, misses) of all caches
+def cache_stats():
+    return [cache_get(k).stats() for k in sorted(GUARD_CACHE_NAMES)]
+
+# Marker for keys not in cache (cached values may be False or None)
+_NOT_CACHED = object()
+
+# Look up a list of keys in a cache
+# Return dictionary of cached key => value and list of uncached keys
+def cache_lookup_all(cache, keys):
+    found = {}
+    for key in keys:
+        value = cache.get(key, _NOT_CACHED)
+        if value is not _NOT_CACHED:
+            found[key] = value
+    uncached = [key for key in keys if key not in found]
+    return found, uncached
+
+# Drop cached privileges of a member (by urn)
+# Call whenever OPERATOR or PROJECT_LEAD privileges change
+def invalidate_member_privileges(member_urn):
+    cache_get('operator_privilege').invalidate(member_urn)
+    cache_get('pi_privilege').invalidate(member_urn)
+
+# Drop cached project names for members (by urn)
+# Call whenever project membership of these members changes
+def invalidate_project_memberships(member_urns):
+    cache = cache_get('project_names_for_user')
+    for member_urn in member_urns:
+        cache.invalidate(member_urn)
+
+# Drop all cached project names (e.g. after projects expire)
+def invalidate_all_project_memberships():
+    cache_get('project_names_for_user').clear()
+
+# Drop cached information about a slice (by urn)
+# Call when a slice is (re)created
+def invalidate_slice(slice_urn):
+    cache_get('slice_urns').invalidate(slice_urn)
+
+# Drop cached identifiers of a member (by uid)
+# Call when a member's email or EPPN changes
+def invalidate_member_identifiers(member_uid):
+    cache_get('member_uid_to_email').invalidate(member_uid)
+    cache_get('member_email_to_uid').clear()
+    cache_get('member_eppn_to_uid').clear()
 
 # Some helper methods
 
@@ -96,8 +152,9 @@ def flatten_urn(urn):
 def lookup_project_names_for_user(user_urn, session):
     db = pm.getService('chdbengine')
     cache = cache_get('project_names_for_user')
-    if user_urn in cache:
-        return cache[user_urn]
+    project_names = cache.get(user_urn)
+    if project_names is not None:
+        return project_names
 
     q = session.query(db.PROJECT_TABLE, db.MEMBER_ATTRIBUTE_TABLE, \
                           db.PROJECT_MEMBER_TABLE)
@@ -111,17 +168,17 @@ def lookup_project_names_for_user(user_urn, session):
     rows = q.all()
     
     project_names = [row.project_name for row in rows]
-    cache[user_urn] = project_names
+    cache.put(user_urn, project_names)
     return project_names
 
-# Check that a list of UID's are all in the cache, 
+# Check that a list of UID's are all in the found dictionary, 
 # otherwise raise ArgumentException
-def validate_uid_list(uids, cache, label):
+def validate_uid_list(uids, found, label):
     bad_uids = []
     good_urns = []
     for uid in uids:
-        if uid in cache:
-            good_urns.append(cache[uid])
+        if uid in found:
+            good_urns.append(found[uid])
         else:
             bad_uids.append(uid)
     if len(bad_uids) > 0:
@@ -135,7 +192,7 @@ def ensure_valid_urns(urn_type, urns, session, authority):
     db = pm.getService('chdbengine')
     if urn_type == 'PROJECT_URN':
         cache = cache_get('project_urns')
-        not_found_urns = [urn for urn in urns if urn not in cache]
+        found, not_found_urns = cache_lookup_all(cache, urns)
         if len(not_found_urns) == 0:
 #            chapi_debug('UTILS', "No cache misses for project URNs")
             rows = []
@@ -148,13 +205,14 @@ def ensure_valid_urns(urn_type, urns, session, authority):
         for row in rows:
             project_name = row.project_name
             project_urn = to_project_urn(authority, project_name)
-            cache[project_urn] = True
-        bad_urns = [urn for urn in not_found_urns if urn not in cache]
+            found[project_urn] = True
+            cache.put(project_urn, True)
+        bad_urns = [urn for urn in not_found_urns if urn not in found]
         if len(bad_urns) > 0: 
             raise CHAPIv1ArgumentError('Unknown project urns: [%s]' % bad_urns)
     elif urn_type == 'SLICE_URN':
         cache = cache_get('slice_urns')
-        not_found_urns = [urn for urn in urns if urn not in cache]
+        found, not_found_urns = cache_lookup_all(cache, urns)
         if len(not_found_urns) == 0:
 #            chapi_debug('UTILS', "No cache misses for slice URNs")
             rows = []
@@ -163,13 +221,14 @@ def ensure_valid_urns(urn_type, urns, session, authority):
             q = q.filter(db.SLICE_TABLE.c.slice_urn.in_(not_found_urns))
             rows = q.all()
         for row in rows:
-            cache[row.slice_urn] = True
-        bad_urns = [urn for urn in not_found_urns if urn not in cache]
+            found[row.slice_urn] = True
+            cache.put(row.slice_urn, True)
+        bad_urns = [urn for urn in not_found_urns if urn not in found]
         if len(bad_urns) > 0: 
             raise CHAPIv1ArgumentError('Unknown slice urns: [%s]' % bad_urns)
     elif urn_type == 'MEMBER_URN':
         cache = cache_get('member_urns')
-        not_found_urns = [urn for urn in urns if urn not in cache]
+        found, not_found_urns = cache_lookup_all(cache, urns)
         if len(not_found_urns) == 0:
 #            chapi_debug('UTILS', "No cache misses for member URNs")
             rows = []
@@ -179,8 +238,9 @@ def ensure_valid_urns(urn_type, urns, session, authority):
             q = q.filter(db.MEMBER_ATTRIBUTE_TABLE.c.value.in_(not_found_urns))
             rows = q.all()
         for row in rows:
-            cache[row.value] = True
-        bad_urns = [urn for urn in not_found_urns if urn not in cache]
+            found[row.value] = True
+            cache.put(row.value, True)
+        bad_urns = [urn for urn in not_found_urns if urn not in found]
         if len(bad_urns) > 0: 
             raise CHAPIv1ArgumentError('Unknown member urns: [%s]' % bad_urns)
     elif urn_type == 'SLIVER_URN':
@@ -205,7 +265,7 @@ def convert_slice_uid_to_urn(slice_uid, session):
         return []
 
     cache = cache_get('slice_uid_to_urn')
-    uncached_uids = [id for id in slice_uids if id not in cache]
+    found, uncached_uids = cache_lookup_all(cache, slice_uids)
 
     if len(uncached_uids) > 0:
         q = session.query(db.SLICE_TABLE.c.slice_urn, \
@@ -215,15 +275,16 @@ def convert_slice_uid_to_urn(slice_uid, session):
         for row in rows:
             slice_id = row.slice_id
             slice_urn = row.slice_urn
-            cache[slice_id] = slice_urn
+            found[slice_id] = slice_urn
+            cache.put(slice_id, slice_urn)
 
     if not isinstance(slice_uid, list):
-        if slice_uid in cache:
-            return cache[slice_uid]
+        if slice_uid in found:
+            return found[slice_uid]
         else:
             raise CHAPIv1ArgumentError('Unknown slice uid: %s' % slice_uid)
     else:
-        return validate_uid_list(slice_uids, cache, 'slice')
+        return validate_uid_list(slice_uids, found, 'slice')
 
 # Take a uid or list of uids, make sure they're all in the cache
 # and return a urn or list of urns
@@ -240,7 +301,7 @@ def convert_project_uid_to_urn(project_uid, session):
 
 
     cache = cache_get('project_uid_to_urn')
-    uncached_uids = [id for id in project_uids if id not in cache]
+    found, uncached_uids = cache_lookup_all(cache, project_uids)
 
     if len(uncached_uids) > 0:
         q = session.query(db.PROJECT_TABLE.c.project_name, \
@@ -251,16 +312,17 @@ def convert_project_uid_to_urn(project_uid, session):
             project_id = row.project_id
             project_name = row.project_name
             project_urn = to_project_urn(authority, project_name)
-            cache[project_id] = project_urn
+            found[project_id] = project_urn
+            cache.put(project_id, project_urn)
 
     if not isinstance(project_uid, list):
-        if project_uid in cache:
-            return cache[project_uid]
+        if project_uid in found:
+            return found[project_uid]
         else:
             raise CHAPIv1ArgumentError("Unknown project uid: %s " % \
                                            project_uid)
     else:
-        return validate_uid_list(project_uids, cache, 'project')
+        return validate_uid_list(project_uids, found, 'project')
 
 # Take a project urn or list of urns, make sure they're all in the cache
 # and return a uid or list of uid
@@ -277,7 +339,7 @@ def convert_project_urn_to_uid(project_urn, session):
 
 
     cache = cache_get('project_urn_to_uid')
-    uncached_urns = [id for id in project_urns if id not in cache]
+    found, uncached_urns = cache_lookup_all(cache, project_urns)
 
     if len(uncached_urns) > 0:
         uncached_names = [from_project_urn(urn) for urn in uncached_urns]
@@ -289,16 +351,17 @@ def convert_project_urn_to_uid(project_urn, session):
             project_id = row.project_id
             project_name = row.project_name
             project_urn = to_project_urn(authority, project_name)
-            cache[project_urn] = project_id
+            found[project_urn] = project_id
+            cache.put(project_urn, project_id)
 
     if not isinstance(project_urn, list):
-        if project_urn in cache:
-            return cache[project_urn]
+        if project_urn in found:
+            return found[project_urn]
         else:
             raise CHAPIv1ArgumentError("Unknown project urn: %s " % \
                                            project_urn)
     else:
-        return validate_uid_list(project_urns, cache, 'project')
+        return validate_uid_list(project_urns, found, 'project')
 
 # Convert a project URN to project name
 def convert_project_urn_to_name(urn, session):
@@ -318,26 +381,27 @@ def convert_member_uid_to_urn(member_uid, session):
     if not isinstance(member_uid, list): member_uids = [member_uid]
 
     cache = cache_get('member_uid_to_urn')
-    uncached_uids = [id for id in member_uids if id not in cache]
+    found, uncached_uids = cache_lookup_all(cache, member_uids)
 
     if len(uncached_uids) > 0:
-        q = session.query(db.MEMBER_ATTRIBUTE_TABLE.c.value, \
-                              db.MEMBER_ATTRIBUTE_TABLE.c.member_id)
-        q = q.filter(db.MEMBER_ATTRIBUTE_TABLE.c.member_id.in_(uncached_uids))
-        q = q.filter(db.MEMBER_ATTRIBUTE_TABLE.c.name == 'urn')
+        q = session.query(db.MEMBER_SUMMARY_TABLE.c.urn.label('value'), \
+                              db.MEMBER_SUMMARY_TABLE.c.member_id)
+        q = q.filter(db.MEMBER_SUMMARY_TABLE.c.member_id.in_(uncached_uids))
+        q = q.filter(db.MEMBER_SUMMARY_TABLE.c.urn != None)
         rows = q.all()
         for row in rows:
             member_urn = row.value
             member_id = row.member_id
-            cache[member_id] = member_urn
+            found[member_id] = member_urn
+            cache.put(member_id, member_urn)
             
     if not isinstance(member_uid, list):
-        if member_uid in cache:
-            return cache[member_uid]
+        if member_uid in found:
+            return found[member_uid]
         else:
             raise CHAPIv1ArgumentError('Unknown member uid: %s ' % member_uid)
     else:
-        return validate_uid_list(member_uids, cache, 'member')
+        return validate_uid_list(member_uids, found, 'member')
 
 # Take a uid or list of uids, make sure they're all in the cache
 # and return an email or list of emails
@@ -347,26 +411,27 @@ def convert_member_uid_to_email(member_uid, session):
     if not isinstance(member_uid, list): member_uids = [member_uid]
 
     cache = cache_get('member_uid_to_email')
-    uncached_uids = [id for id in member_uids if id not in cache]
+    found, uncached_uids = cache_lookup_all(cache, member_uids)
 
     if len(uncached_uids) > 0:
-        q = session.query(db.MEMBER_ATTRIBUTE_TABLE.c.value, \
-                              db.MEMBER_ATTRIBUTE_TABLE.c.member_id)
-        q = q.filter(db.MEMBER_ATTRIBUTE_TABLE.c.member_id.in_(uncached_uids))
-        q = q.filter(db.MEMBER_ATTRIBUTE_TABLE.c.name == 'email_address')
+        q = session.query(db.MEMBER_SUMMARY_TABLE.c.email_address.label('value'), \
+                              db.MEMBER_SUMMARY_TABLE.c.member_id)
+        q = q.filter(db.MEMBER_SUMMARY_TABLE.c.member_id.in_(uncached_uids))
+        q = q.filter(db.MEMBER_SUMMARY_TABLE.c.email_address != None)
         rows = q.all()
         for row in rows:
             member_email = row.value
             member_id = row.member_id
-            cache[member_id] = member_email
+            found[member_id] = member_email
+            cache.put(member_id, member_email)
             
     if not isinstance(member_uid, list):
-        if member_uid in cache:
-            return cache[member_uid]
+        if member_uid in found:
+            return found[member_uid]
         else:
             raise CHAPIv1ArgumentError('Unknown member uid: %s' % member_uid)
     else:
-        return validate_uid_list(member_uids, cache, 'member')
+        return validate_uid_list(member_uids, found, 'member')
 
 # Take an email or list of emails, make sure they're all in the cache
 # and return a uid or list of uids
@@ -376,24 +441,24 @@ def convert_member_email_to_uid(member_email, session):
     if not isinstance(member_email, list): member_emails = [member_email]
 
     cache = cache_get('member_email_to_uid')
-    uncached_emails = [em.lower() for em in member_emails \
-                           if em.lower() not in cache]
+    found, uncached_emails = \
+        cache_lookup_all(cache, [em.lower() for em in member_emails])
 
     if len(uncached_emails) > 0:
-        q = session.query(db.MEMBER_ATTRIBUTE_TABLE.c.value, \
-                              db.MEMBER_ATTRIBUTE_TABLE.c.member_id)
-        q = q.filter(func.lower(db.MEMBER_ATTRIBUTE_TABLE.c.value).in_(uncached_emails))
-        q = q.filter(db.MEMBER_ATTRIBUTE_TABLE.c.name == 'email_address')
+        q = session.query(db.MEMBER_SUMMARY_TABLE.c.email_address.label('value'), \
+                              db.MEMBER_SUMMARY_TABLE.c.member_id)
+        q = q.filter(func.lower(db.MEMBER_SUMMARY_TABLE.c.email_address).in_(uncached_emails))
         rows = q.all()
         for row in rows:
             email_value = row.value.lower()
             member_id = row.member_id
-            cache[email_value] = member_id
+            found[email_value] = member_id
+            cache.put(email_value, member_id)
 
     # Unlike most other 'convert' routines, we want to return 
     # only the list of good uid's and not error on bad emails
     # To support bulk email or asking about whether an email is valid
-    uids = [cache[em.lower()] for em in member_emails if em.lower() in cache]
+    uids = [found[em.lower()] for em in member_emails if em.lower() in found]
     return uids
 
 # Take an EPPN or list of EPPNs, make sure they're all in the cache
@@ -404,28 +469,28 @@ def convert_member_eppn_to_uid(member_eppn, session):
     if not isinstance(member_eppn, list): member_eppns = [member_eppn]
 
     cache = cache_get('member_eppn_to_uid')
-    uncached_eppns = [me.lower() for me in member_eppns if me.lower() \
-                          not in cache]
+    found, uncached_eppns = \
+        cache_lookup_all(cache, [me.lower() for me in member_eppns])
 
     if len(uncached_eppns) > 0:
-        q = session.query(db.MEMBER_ATTRIBUTE_TABLE.c.value, \
-                              db.MEMBER_ATTRIBUTE_TABLE.c.member_id)
-        q = q.filter(func.lower(db.MEMBER_ATTRIBUTE_TABLE.c.value).in_(uncached_eppns))
-        q = q.filter(db.MEMBER_ATTRIBUTE_TABLE.c.name == 'eppn')
+        q = session.query(db.MEMBER_SUMMARY_TABLE.c.eppn.label('value'), \
+                              db.MEMBER_SUMMARY_TABLE.c.member_id)
+        q = q.filter(func.lower(db.MEMBER_SUMMARY_TABLE.c.eppn).in_(uncached_eppns))
         rows = q.all()
         for row in rows:
             eppn_value = row.value.lower()
             member_id = row.member_id
-            cache[eppn_value] = member_id
+            found[eppn_value] = member_id
+            cache.put(eppn_value, member_id)
 
     if not isinstance(member_eppn, list):
-        if member_eppn in cache:
-            return cache[member_eppn]
+        if member_eppn in found:
+            return found[member_eppn]
         else:
             # Return an empty list if we can't find the eppn.
             return list()
     else:
-        return validate_uid_list(member_eppns, cache, 'member_eppn_to_uid')
+        return validate_uid_list(member_eppns, found, 'member_eppn_to_uid')
 
 def lookup_slice_urn_for_sliver_urn(sliver_urn, session):
     db = pm.getService('chdbengine')
@@ -439,34 +504,24 @@ def lookup_slice_urn_for_sliver_urn(sliver_urn, session):
         return None
     
 
-# How long do we keep cache entries for operator privileges
-OPERATOR_CACHE_LIFETIME_SECS = 60
-# How long do we keep cache entries for PI privileges
-PI_CACHE_LIFETIME_SECS = 60
-
-
 # Lookup whether given user (by urn) has 'operator' 
-# as an attribute in ma_member_attribute
+# as an attribute in ma_member_attribute (flagged in ma_member_summary)
 def lookup_operator_privilege(user_urn, session):
     db = pm.getService('chdbengine')
     cache = cache_get('operator_privilege')
-    entry = timed_cache_lookup(cache, user_urn, OPERATOR_CACHE_LIFETIME_SECS)
-    if entry:
-        return entry['value']
-
-    ma1 = alias(db.MEMBER_ATTRIBUTE_TABLE)
-    ma2 = alias(db.MEMBER_ATTRIBUTE_TABLE)
-    q = session.query(ma2.c.value)
-    q = q.filter(ma1.c.member_id == ma2.c.member_id)
-    q = q.filter(ma1.c.name == 'urn')
-    q = q.filter(ma1.c.value == user_urn)
-    q = q.filter(ma2.c.name == 'OPERATOR')
+    is_operator = cache.get(user_urn)
+    if is_operator is not None:
+        return is_operator
+
+    q = session.query(db.MEMBER_SUMMARY_TABLE.c.member_id)
+    q = q.filter(db.MEMBER_SUMMARY_TABLE.c.urn == user_urn)
+    q = q.filter(db.MEMBER_SUMMARY_TABLE.c.is_operator == True)
 
     rows = q.all()
     is_operator = (len(rows)>0)
 #    chapi_debug('UTILS', 'lookup_operator_privilege: %s = %s' % \
 #                    (user_urn, is_operator)
-    timed_cache_register(cache, user_urn, is_operator)
+    cache.put(user_urn, is_operator)
     return is_operator
 
 # Is given user an authority?
@@ -478,23 +533,21 @@ def lookup_authority_privilege(user_urn, session):
 def lookup_pi_privilege(user_urn, session):
     db = pm.getService('chdbengine')
     cache = cache_get('pi_privilege')
-    entry = timed_cache_lookup(cache, user_urn, PI_CACHE_LIFETIME_SECS)
-    if entry:
-        return entry['value']
-
-    ma1 = alias(db.MEMBER_ATTRIBUTE_TABLE)
-    ma2 = alias(db.MEMBER_ATTRIBUTE_TABLE)
-    q = session.query(ma2.c.value)
-    q = q.filter(ma1.c.member_id == ma2.c.member_id)
-    q = q.filter(ma1.c.name == 'urn')
-    q = q.filter(ma1.c.value == user_urn)
-    q = q.filter(ma2.c.name == 'PROJECT_LEAD')
+    is_project_lead = cache.get(user_urn)
+    if is_project_lead is not None:
+        return is_project_lead
+
+    q = session.query(db.MEMBER_ATTRIBUTE_TABLE.c.value)
+    q = q.filter(db.MEMBER_SUMMARY_TABLE.c.member_id == \
+                     db.MEMBER_ATTRIBUTE_TABLE.c.member_id)
+    q = q.filter(db.MEMBER_SUMMARY_TABLE.c.urn == user_urn)
+    q = q.filter(db.MEMBER_ATTRIBUTE_TABLE.c.name == 'PROJECT_LEAD')
 
 #    print "Q = " + str(q)
 
     rows = q.all()
     is_project_lead = (len(rows)>0)
-    timed_cache_register(cache, user_urn, is_project_lead)
+    cache.put(user_urn, is_project_lead)
     return is_project_lead
 
 # Get role of member on each of list of projects
@@ -593,21 +646,19 @@ def shares_project(member1_urn, member2_urns, session, project_uid = None):
     db = pm.getService("chdbengine")
     pm1 = aliased(db.PROJECT_MEMBER_TABLE)
     pm2 = aliased(db.PROJECT_MEMBER_TABLE)
-    ma1 = aliased(db.MEMBER_ATTRIBUTE_TABLE)
-    ma2 = aliased(db.MEMBER_ATTRIBUTE_TABLE)
+    ma1 = aliased(db.MEMBER_SUMMARY_TABLE)
+    ma2 = aliased(db.MEMBER_SUMMARY_TABLE)
 
     q = session.query(pm1.c.project_id, 
-                      ma1.c.value.label('member1'), 
-                      ma2.c.value.label('member2'))
+                      ma1.c.urn.label('member1'), 
+                      ma2.c.urn.label('member2'))
     if project_uid is not None:
         q = q.filter(pm1.c.project_id == project_uid)
     q = q.filter(pm1.c.project_id == pm2.c.project_id)
     q = q.filter(pm1.c.member_id == ma1.c.member_id)
     q = q.filter(pm2.c.member_id == ma2.c.member_id)
-    q = q.filter(ma1.c.name == 'urn')
-    q = q.filter(ma2.c.name == 'urn')
-    q = q.filter(ma1.c.value == member1_urn)
-    q = q.filter(ma2.c.value.in_(member2_urns))
+    q = q.filter(ma1.c.urn == member1_urn)
+    q = q.filter(ma2.c.urn.in_(member2_urns))
 
     rows = q.all()
 
@@ -622,12 +673,12 @@ def shares_slice(member1_urn, member2_urns, session, slice_uid = None):
     st = aliased(db.SLICE_TABLE)
     sm1 = aliased(db.SLICE_MEMBER_TABLE)
     sm2 = aliased(db.SLICE_MEMBER_TABLE)
-    ma1 = aliased(db.MEMBER_ATTRIBUTE_TABLE)
-    ma2 = aliased(db.MEMBER_ATTRIBUTE_TABLE)
+    ma1 = aliased(db.MEMBER_SUMMARY_TABLE)
+    ma2 = aliased(db.MEMBER_SUMMARY_TABLE)
 
     q = session.query(st.c.expired, sm1.c.slice_id, sm2.c.slice_id, 
-                      ma1.c.value.label('member1'), 
-                      ma2.c.value.label('member2'))
+                      ma1.c.urn.label('member1'), 
+                      ma2.c.urn.label('member2'))
     if slice_uid is not None:
         q = q.filter(sm1.c.slice_id == slice_uid)
     q = q.filter(st.c.slice_id == sm1.c.slice_id)
@@ -635,10 +686,8 @@ def shares_slice(member1_urn, member2_urns, session, slice_uid = None):
     q = q.filter(sm1.c.slice_id == sm2.c.slice_id)
     q = q.filter(sm1.c.member_id == ma1.c.member_id)
     q = q.filter(sm2.c.member_id == ma2.c.member_id)
-    q = q.filter(ma1.c.name == 'urn')
-    q = q.filter(ma2.c.name == 'urn')
-    q = q.filter(ma1.c.value == member1_urn)
-    q = q.filter(ma2.c.value.in_(member2_urns))
+    q = q.filter(ma1.c.urn == member1_urn)
+    q = q.filter(ma2.c.urn.in_(member2_urns))
 
     rows = q.all()
 
@@ -652,16 +701,15 @@ def has_role_on_some_project(member_urns, role, session):
     db = pm.getService("chdbengine")
     q = session.query(db.PROJECT_MEMBER_TABLE.c.member_id, \
                           db.PROJECT_MEMBER_TABLE.c.role, \
-                          db.MEMBER_ATTRIBUTE_TABLE.c.value)
-    q = q.filter(db.MEMBER_ATTRIBUTE_TABLE.c.name == 'urn')
-    q = q.filter(db.MEMBER_ATTRIBUTE_TABLE.c.value.in_(member_urns))
-    q = q.filter(db.MEMBER_ATTRIBUTE_TABLE.c.member_id == \
+                          db.MEMBER_SUMMARY_TABLE.c.urn)
+    q = q.filter(db.MEMBER_SUMMARY_TABLE.c.urn.in_(member_urns))
+    q = q.filter(db.MEMBER_SUMMARY_TABLE.c.member_id == \
                      db.PROJECT_MEMBER_TABLE.c.member_id)
     q = q.filter(db.PROJECT_MEMBER_TABLE.c.role == role)
 
     rows = q.all()
 
-    members_with_role = [row.value for row in rows]
+    members_with_role = [row.urn for row in rows]
     return members_with_role
 
 # Return the list of members who have a pending request from or 
@@ -680,18 +728,16 @@ def has_pending_request_on_project_lead_by(lead_urns, requestor_urns,
     db = pm.getService("chdbengine")
     pm1 = aliased(db.PROJECT_MEMBER_TABLE)
     pm2 = aliased(db.PROJECT_MEMBER_TABLE)
-    ma1 = aliased(db.MEMBER_ATTRIBUTE_TABLE)
-    ma2 = aliased(db.MEMBER_ATTRIBUTE_TABLE)
+    ma1 = aliased(db.MEMBER_SUMMARY_TABLE)
+    ma2 = aliased(db.MEMBER_SUMMARY_TABLE)
 
     q = session.query(db.PROJECT_REQUEST_TABLE.c.status, 
-                      ma1.c.value.label('lead_urn'),
-                      ma2.c.value.label('requestor_urn'))
+                      ma1.c.urn.label('lead_urn'),
+                      ma2.c.urn.label('requestor_urn'))
     q = q.filter(pm1.c.member_id == ma1.c.member_id)
     q = q.filter(db.PROJECT_REQUEST_TABLE.c.requestor == ma2.c.member_id)
-    q = q.filter(ma1.c.name == 'urn')
-    q = q.filter(ma2.c.name == 'urn')
-    q = q.filter(ma1.c.value.in_(lead_urns))
-    q = q.filter(ma2.c.value.in_(requestor_urns))
+    q = q.filter(ma1.c.urn.in_(lead_urns))
+    q = q.filter(ma2.c.urn.in_(requestor_urns))
     q = q.filter(db.PROJECT_REQUEST_TABLE.c.context_id == pm1.c.project_id)
     q = q.filter(pm1.c.role.in_([LEAD_ATTRIBUTE, ADMIN_ATTRIBUTE]))
     q = q.filter(db.PROJECT_REQUEST_TABLE.c.status == PENDING_STATUS)
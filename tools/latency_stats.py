@@ -0,0 +1,71 @@
+#----------------------------------------------------------------------
+# Copyright (c) 2011-2015 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+
+# Latency summaries shared by the load tools (chapi_scaling.py and
+# portal_benchmark.py), so that their reports can be compared.
+
+# Upper bounds (seconds) of latency histogram buckets
+HISTOGRAM_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                     2.5, 5.0, 10.0, 30.0]
+
+# Nearest-rank percentile of a sorted list
+def percentile(values, fraction):
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))
+    return values[index]
+
+# Return list of counts of latencies in each HISTOGRAM_BUCKETS bucket
+# (and a last count of those beyond the last bucket)
+def histogram(latencies):
+    counts = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+    for latency in latencies:
+        bucket = 0
+        while bucket < len(HISTOGRAM_BUCKETS) and \
+                latency > HISTOGRAM_BUCKETS[bucket]:
+            bucket += 1
+        counts[bucket] += 1
+    return counts
+
+# Summarize the latencies (seconds) of the successful calls and the
+# number of failed calls made over elapsed seconds
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    summary = {'count' : len(latencies), 'errors' : errors,
+               'throughput' : len(latencies) / elapsed}
+    if latencies:
+        summary.update({'mean' : sum(latencies) / len(latencies),
+                        'p50' : percentile(latencies, 0.50),
+                        'p95' : percentile(latencies, 0.95),
+                        'p99' : percentile(latencies, 0.99),
+                        'max' : latencies[-1],
+                        'histogram' : histogram(latencies)})
+    return summary
+
+# Print a histogram returned by histogram()
+def print_histogram(counts):
+    bounds = ["<= %gs" % bound for bound in HISTOGRAM_BUCKETS] + \
+        ["> %gs" % HISTOGRAM_BUCKETS[-1]]
+    biggest = max(counts)
+    for bound, count in zip(bounds, counts):
+        print "%9s %7d %s" % (bound, count, '#' * (50 * count / biggest))
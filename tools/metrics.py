@@ -0,0 +1,207 @@
+#----------------------------------------------------------------------
+# Copyright (c) 2011-2015 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+
+# Process-wide metrics, served in the Prometheus text exposition format
+# at /metrics (see plugins/opsmon/Metrics.py).
+#
+# Counters and histograms are updated on the call path, so each thread
+# updates a shard of its own without locking; the shards are summed
+# only when the metrics are rendered. Values kept elsewhere (database
+# pool and cache statistics) are read at render time by collectors.
+
+import bisect
+import threading
+from chapi_log import *
+
+# Upper bounds (seconds) of latency histogram buckets
+DEFAULT_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0]
+
+def _format_labels(labelnames, labels):
+    if not labelnames:
+        return ''
+    pairs = []
+    for name, value in zip(labelnames, labels):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').\
+            replace('\n', '\\n')
+        pairs.append('%s="%s"' % (name, value))
+    return '{%s}' % ','.join(pairs)
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+# A metric whose values are kept in per-thread shards:
+# dictionaries of label values (tuple) => value
+class _ShardedMetric:
+
+    def __init__(self, name, help, labelnames):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+
+    # The shard of this thread (only this thread writes to it)
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    # Return list of (labels, value) items of each shard
+    def _shardItems(self):
+        with self._shards_lock:
+            shards = list(self._shards)
+        return [shard.items() for shard in shards]
+
+class Counter(_ShardedMetric):
+
+    type = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def render(self):
+        totals = {}
+        for items in self._shardItems():
+            for labels, value in items:
+                totals[labels] = totals.get(labels, 0) + value
+        return ["%s%s %s" % (self.name, _format_labels(self.labelnames, labels),
+                             _format_value(value)) \
+                    for labels, value in sorted(totals.items())]
+
+class Histogram(_ShardedMetric):
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames, buckets=DEFAULT_BUCKETS):
+        _ShardedMetric.__init__(self, name, help, labelnames)
+        self.buckets = list(buckets)
+
+    # Each value is a list of the count in each bucket, the count above
+    # the last bucket and the sum of all observations
+    def observe(self, labels, value):
+        shard = self._shard()
+        counts = shard.get(labels)
+        if counts is None:
+            counts = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def render(self):
+        totals = {}
+        for items in self._shardItems():
+            for labels, counts in items:
+                total = totals.get(labels)
+                if total is None:
+                    total = totals[labels] = [0] * len(counts)
+                for i, count in enumerate(list(counts)):
+                    total[i] += count
+        lines = []
+        bucket_labelnames = self.labelnames + ('le',)
+        for labels, counts in sorted(totals.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ['+Inf'], counts[:-1]):
+                cumulative += count
+                lines.append("%s_bucket%s %d" % \
+                                 (self.name,
+                                  _format_labels(bucket_labelnames,
+                                                 labels + (bound,)),
+                                  cumulative))
+            formatted_labels = _format_labels(self.labelnames, labels)
+            lines.append("%s_sum%s %s" % (self.name, formatted_labels,
+                                          _format_value(counts[-1])))
+            lines.append("%s_count%s %d" % (self.name, formatted_labels,
+                                            cumulative))
+        return lines
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+
+    def _getOrCreate(self, name, create):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = create()
+            return self._metrics[name]
+
+    def counter(self, name, help, labelnames=()):
+        return self._getOrCreate(name,
+                                 lambda: Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._getOrCreate(name,
+                                 lambda: Histogram(name, help, labelnames,
+                                                   buckets))
+
+    # Register a function called at render time, returning a list of
+    # (name, type, help, samples) where samples is a list of
+    # (dictionary of labels, value)
+    def register_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    # Return all metrics in the text exposition format
+    def render(self):
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.append("# HELP %s %s" % (metric.name, metric.help))
+            lines.append("# TYPE %s %s" % (metric.name, metric.type))
+            lines += metric.render()
+        for collector in collectors:
+            try:
+                families = collector()
+            except Exception, e:
+                chapi_warn("METRICS", "Metrics collector %s failed: %s" % \
+                               (collector, e))
+                continue
+            for name, type, help, samples in families:
+                lines.append("# HELP %s %s" % (name, help))
+                lines.append("# TYPE %s %s" % (name, type))
+                for labels, value in samples:
+                    labelnames = sorted(labels.keys())
+                    lines.append("%s%s %s" % \
+                                     (name,
+                                      _format_labels(labelnames,
+                                                     [labels[label] \
+                                                          for label in labelnames]),
+                                      _format_value(value)))
+        return "\n".join(lines) + "\n"
+
+_metrics_registry = MetricsRegistry()
+
+def get_metrics_registry():
+    return _metrics_registry
@@ -0,0 +1,291 @@
+#----------------------------------------------------------------------
+# Copyright (c) 2011-2015 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+
+# Replay a weighted mix of portal page workloads (see portal_client.py)
+# against a CH with a number of concurrent simulated users, e.g.
+#
+#    python portal_benchmark.py --url https://localhost/MA \
+#        --user_file /tmp/dataset/users.json --users 20 --duration 300 \
+#        --mix home=6,project=2,slice=2 --output results.json \
+#        [--db_url postgresql://...]
+#
+# users.json is a list of {cert, key, eppn} (see generate_dataset.py).
+# Reports per-method and per-page latency percentiles and throughput.
+# With --db_url, also reports the number of SQL statements the database
+# ran during the benchmark (requires the pg_stat_statements extension).
+# Alternatively, with --capture_file naming the CH's
+# chrm.db_query_capture_file, the statements captured are counted.
+# The JSON output can be compared across releases.
+
+import datetime
+import json
+import optparse
+import random
+import sys
+import threading
+import time
+
+from latency_stats import HISTOGRAM_BUCKETS, summarize
+from portal_client import emulate_portal_page, PORTAL_PAGES
+
+# Parse "home=6,project=2" into [(page, weight)]
+def parse_mix(mix):
+    weights = []
+    for entry in mix.split(','):
+        page, weight = entry.split('=')
+        page = page.strip()
+        if page not in PORTAL_PAGES:
+            raise Exception("Unknown page %s: pages are %s" % \
+                                (page, PORTAL_PAGES))
+        weights.append((page, float(weight)))
+    return weights
+
+def choose_page(rng, weights):
+    point = rng.random() * sum([weight for page, weight in weights])
+    for page, weight in weights:
+        point -= weight
+        if point < 0:
+            return page
+    return weights[-1][0]
+
+# Latencies (seconds) and error counts by name, shared by all users
+class Recorder:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    # Discard everything recorded so far
+    def reset(self):
+        with self._lock:
+            self.latencies = {}
+            self.errors = {}
+
+    def record(self, name, latency, success):
+        with self._lock:
+            if success:
+                self.latencies.setdefault(name, []).append(latency)
+            else:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    def summary(self, elapsed):
+        with self._lock:
+            names = set(self.latencies.keys() + self.errors.keys())
+            return dict([(name, summarize(self.latencies.get(name, []),
+                                          self.errors.get(name, 0), elapsed)) \
+                             for name in sorted(names)])
+
+# Wrap a service client so every call is timed as SERVICE.method
+class TimedClient:
+
+    def __init__(self, client, service, recorder):
+        self._client = client
+        self._service = service
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+        label = "%s.%s" % (self._service, name)
+        recorder = self._recorder
+        def timed_call(*args):
+            start = time.time()
+            try:
+                result = method(*args)
+            except Exception:
+                recorder.record(label, time.time() - start, False)
+                raise
+            success = not isinstance(result, dict) or \
+                result.get('code', 0) == 0
+            recorder.record(label, time.time() - start, success)
+            return result
+        return timed_call
+
+# Options for emulate_portal_page
+class PageOptions:
+
+    def __init__(self, url, user, page):
+        self.url = url
+        self.cert = user['cert']
+        self.key = user['key']
+        self.eppn = user['eppn']
+        self.credentials = []
+        self.page = page
+
+# One simulated user: fetch pages (with think time) until told to stop
+class SimulatedUser(threading.Thread):
+
+    def __init__(self, opts, users, weights, seed, method_recorder,
+                 page_recorder, stop_event):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self._opts = opts
+        self._rng = random.Random(seed)
+        self._user = self._rng.choice(users)
+        self._weights = weights
+        self._method_recorder = method_recorder
+        self._page_recorder = page_recorder
+        self._stop_event = stop_event
+
+    def _wrap_client(self, client, service):
+        return TimedClient(client, service, self._method_recorder)
+
+    def run(self):
+        think_time = float(self._opts.think_time)
+        while not self._stop_event.is_set():
+            page = choose_page(self._rng, self._weights)
+            page_opts = PageOptions(self._opts.url, self._user, page)
+            start = time.time()
+            try:
+                emulate_portal_page(page_opts, wrap_client=self._wrap_client,
+                                    quiet=True)
+                success = True
+            except Exception, e:
+                if self._opts.verbose:
+                    print "Error on %s page for %s: %s" % \
+                        (page, self._user['eppn'], e)
+                success = False
+            self._page_recorder.record(page, time.time() - start, success)
+            if think_time > 0:
+                self._stop_event.wait(self._rng.expovariate(1.0 / think_time))
+
+# Total statements run by the database (None if not available)
+def count_db_statements(db_url):
+    from sqlalchemy import create_engine
+    try:
+        engine = create_engine(db_url)
+        return engine.execute("select sum(calls) from pg_stat_statements").scalar()
+    except Exception, e:
+        print "Cannot count database statements: %s" % e
+        return None
+
+# Statements recorded so far in a query capture file (see query_audit.py)
+def count_captured_statements(capture_file):
+    try:
+        return sum([1 for line in open(capture_file)])
+    except IOError, e:
+        print "Cannot count captured statements: %s" % e
+        return None
+
+def count_statements(opts):
+    if opts.db_url:
+        return count_db_statements(opts.db_url)
+    if opts.capture_file:
+        return count_captured_statements(opts.capture_file)
+    return None
+
+def parseOptions(args):
+    parser = optparse.OptionParser()
+    parser.add_option("--url", help="URL of the MA (other services are " + \
+                          "found by replacing /MA)", default=None)
+    parser.add_option("--user_file",
+                      help="JSON file of users: list of {cert, key, eppn}",
+                      default=None)
+    parser.add_option("--users", help="Number of concurrent simulated users",
+                      default=10)
+    parser.add_option("--mix", help="Weighted page mix, e.g. home=6,slice=2",
+                      default="home=6,project=2,slice=2")
+    parser.add_option("--duration", help="Seconds to run (after warm-up)",
+                      default=60)
+    parser.add_option("--warmup", help="Seconds to run before measuring",
+                      default=10)
+    parser.add_option("--think_time", help="Mean seconds between pages",
+                      default=1)
+    parser.add_option("--seed", help="Random seed", default=1)
+    parser.add_option("--db_url", help="Database to count statements on",
+                      default=None)
+    parser.add_option("--capture_file",
+                      help="CH query capture file to count statements in",
+                      default=None)
+    parser.add_option("--output", help="File to write JSON results to",
+                      default=None)
+    parser.add_option("--verbose", action="store_true", default=False)
+
+    [opts, args] = parser.parse_args(args)
+    if not opts.url or not opts.user_file:
+        print "--url and --user_file are required"
+        sys.exit(0)
+
+    return opts
+
+def main(args = sys.argv):
+    opts = parseOptions(args)
+    users = json.load(open(opts.user_file))
+    weights = parse_mix(opts.mix)
+    method_recorder = Recorder()
+    page_recorder = Recorder()
+    stop_event = threading.Event()
+
+    rng = random.Random(int(opts.seed))
+    threads = [SimulatedUser(opts, users, weights, rng.random(),
+                             method_recorder, page_recorder, stop_event) \
+                   for i in range(int(opts.users))]
+    for thread in threads:
+        thread.start()
+
+    # Discard what was recorded while warming up
+    time.sleep(float(opts.warmup))
+    method_recorder.reset()
+    page_recorder.reset()
+    db_statements = count_statements(opts)
+
+    start = time.time()
+    time.sleep(float(opts.duration))
+    elapsed = time.time() - start
+    methods = method_recorder.summary(elapsed)
+    pages = page_recorder.summary(elapsed)
+    if db_statements is not None:
+        db_statements = count_statements(opts) - db_statements
+    # Let each user finish the page it is on
+    stop_event.set()
+    for thread in threads:
+        thread.join()
+
+    results = {'date' : datetime.datetime.utcnow().isoformat(),
+               'url' : opts.url, 'users' : int(opts.users),
+               'mix' : opts.mix, 'duration' : elapsed,
+               'think_time' : float(opts.think_time),
+               'db_statements' : db_statements,
+               'histogram_buckets' : HISTOGRAM_BUCKETS,
+               'methods' : methods, 'pages' : pages}
+    num_pages = sum([page['count'] for page in pages.values()])
+    if db_statements is not None and num_pages:
+        results['db_statements_per_page'] = float(db_statements) / num_pages
+
+    print "%-45s %7s %6s %8s %8s %8s %8s" % \
+        ('', 'count', 'errors', 'p50', 'p95', 'p99', 'per sec')
+    for name, summary in pages.items() + methods.items():
+        if not summary['count']:
+            print "%-45s %7d %6d" % (name, 0, summary['errors'])
+            continue
+        print "%-45s %7d %6d %8.3f %8.3f %8.3f %8.2f" % \
+            (name, summary['count'], summary['errors'], summary['p50'],
+             summary['p95'], summary['p99'], summary['throughput'])
+    if db_statements is not None:
+        print "Database statements: %d" % db_statements
+
+    if opts.output:
+        json.dump(results, open(opts.output, 'w'), indent=2)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -22,11 +22,15 @@
 #----------------------------------------------------------------------
 
 from gcf.omnilib.util.dossl import _do_ssl
+import random
 import xmlrpclib
 from gcf.omnilib.frameworks.framework_base import Framework_Base
 
 # Emulate CHAPI traffic supporting specific portal pages: 
-# e.g. home, projects, slices
+# e.g. home, project, slice
+
+# Pages emulated by emulate_portal_page
+PORTAL_PAGES = ['home', 'project', 'slice']
 
 class MAClientFramework(Framework_Base):
     def __init__(self, config, opts):
@@ -36,7 +40,11 @@ class MAClientFramework(Framework_Base):
         self.fwtype = "MA Ciient"
         self.opts = opts
 
-def emulate_portal_page(opts, verbose = False):
+# opts has url (of the MA), cert, key, credentials, page and eppn
+# wrap_client, if given, is called as wrap_client(client, service) for
+# each service client (e.g. to time calls)
+def emulate_portal_page(opts, verbose = False, wrap_client = None,
+                        quiet = False):
 
     suppress_errors = None
     reason = "Testing"
@@ -51,9 +59,25 @@ def emulate_portal_page(opts, verbose = False):
     sa_client = framework.make_client(sa_url, opts.key, opts.cert, verbose=False)
     cs_client = framework.make_client(cs_url, opts.key, opts.cert, verbose=False)
     log_client = framework.make_client(log_url, opts.key, opts.cert, verbose=False)
+    if wrap_client:
+        ma_client = wrap_client(ma_client, 'MA')
+        sa_client = wrap_client(sa_client, 'SA')
+        cs_client = wrap_client(cs_client, 'CS')
+        log_client = wrap_client(log_client, 'LOG')
+
+    if not quiet:
+        print "Fetching %s page for %s" % (opts.page, opts.eppn)
+
+    # Every page starts by looking up the member by EPPN
+    if opts.page != "home":
+        client_options = {'match' : {'_GENI_MEMBER_EPPN' : opts.eppn}}
+        (public_info, msg) = _do_ssl(framework, suppress_errors, reason, 
+                                     ma_client.lookup_public_member_info, 
+                                     opts.credentials, client_options)
+        member_urn = public_info['value'].keys()[0]
+        member_uid = public_info['value'][member_urn]['MEMBER_UID']
 
     if opts.page == "home":
-        print "Fetching home page for %s" % opts.eppn
         # Lookup public member info by EPPN
         client_options = {'match' : {'_GENI_MEMBER_EPPN' : opts.eppn}}
         (public_info, msg) = _do_ssl(framework, suppress_errors, reason, 
@@ -239,9 +263,96 @@ def emulate_portal_page(opts, verbose = False):
             print "Result = %s " % log_entries
 
 
-        print "Done fetching home page for %s" % opts.eppn
+    elif opts.page == "project":
+        # Pick one of the member's current projects
+        client_options = {'_dummy' : ''}
+        (projects_info, msg) = _do_ssl(framework, suppress_errors, reason, 
+                                       sa_client.lookup_projects_for_member,
+                                       member_urn, 
+                                       opts.credentials, client_options)
+        project_infos = [project_info for project_info in projects_info['value']
+                         if not project_info['EXPIRED']]
+        if project_infos:
+            project_info = random.choice(project_infos)
+            project_urn = project_info['PROJECT_URN']
+            client_options = {'match' : {'PROJECT_UID' : 
+                                         [project_info['PROJECT_UID']]}}
+            (projects, msg) = _do_ssl(framework, suppress_errors, reason, 
+                                      sa_client.lookup_projects,
+                                      opts.credentials, client_options)
+            client_options = {'_dummy' : ''}
+            (project_members, msg) = _do_ssl(framework, suppress_errors,
+                                             reason,
+                                             sa_client.lookup_project_members,
+                                             project_urn,
+                                             opts.credentials, client_options)
+            client_options = {'match' : {'SLICE_PROJECT_URN' : project_urn,
+                                         'SLICE_EXPIRED' : False}}
+            (slices, msg) = _do_ssl(framework, suppress_errors, reason, 
+                                    sa_client.lookup_slices,
+                                    opts.credentials, client_options)
+            member_uids = [member['PROJECT_MEMBER_UID'] \
+                               for member in project_members['value']]
+            client_options = {'match' : {'MEMBER_UID' : member_uids}}
+            (members_info, msg) = _do_ssl(framework, suppress_errors, reason, 
+                                          ma_client.lookup_identifying_member_info,
+                                          opts.credentials, client_options)
+            (log_entries, msg) = _do_ssl(framework, suppress_errors, reason, 
+                                         log_client.get_log_entries_for_context,
+                                         1, project_info['PROJECT_UID'], 24,
+                                         opts.credentials, {})
+            if verbose:
+                print "Result = %s " % projects
+                print "Result = %s " % project_members
+                print "Result = %s " % slices
+                print "Result = %s " % members_info
+
+    elif opts.page == "slice":
+        # Pick one of the member's current slices
+        client_options = {'_dummy' : ''}
+        (slices_info, msg) = _do_ssl(framework, suppress_errors, reason, 
+                                     sa_client.lookup_slices_for_member,
+                                     member_urn, 
+                                     opts.credentials, client_options)
+        slice_infos = [slice_info for slice_info in slices_info['value']
+                       if not slice_info['EXPIRED']]
+        if slice_infos:
+            slice_info = random.choice(slice_infos)
+            slice_urn = slice_info['SLICE_URN']
+            client_options = {'match' : {'SLICE_URN' : [slice_urn]}}
+            (slices, msg) = _do_ssl(framework, suppress_errors, reason, 
+                                    sa_client.lookup_slices,
+                                    opts.credentials, client_options)
+            client_options = {'_dummy' : ''}
+            (slice_members, msg) = _do_ssl(framework, suppress_errors, reason,
+                                           sa_client.lookup_slice_members,
+                                           slice_urn,
+                                           opts.credentials, client_options)
+            client_options = {'match' : {'SLIVER_INFO_SLICE_URN' : slice_urn}}
+            (slivers, msg) = _do_ssl(framework, suppress_errors, reason, 
+                                     sa_client.lookup_sliver_info,
+                                     opts.credentials, client_options)
+            member_uids = [member['SLICE_MEMBER_UID'] \
+                               for member in slice_members['value']]
+            client_options = {'match' : {'MEMBER_UID' : member_uids}}
+            (members_info, msg) = _do_ssl(framework, suppress_errors, reason, 
+                                          ma_client.lookup_identifying_member_info,
+                                          opts.credentials, client_options)
+            (log_entries, msg) = _do_ssl(framework, suppress_errors, reason, 
+                                         log_client.get_log_entries_for_context,
+                                         2, slice_info['SLICE_UID'], 24,
+                                         opts.credentials, {})
+            if verbose:
+                print "Result = %s " % slices
+                print "Result = %s " % slice_members
+                print "Result = %s " % slivers
+                print "Result = %s " % members_info
 
     else:
-        print "Page not supported: %s" % page_name
+        print "Page not supported: %s" % opts.page
+        return
+
+    if not quiet:
+        print "Done fetching %s page for %s" % (opts.page, opts.eppn)
 
 
@@ -0,0 +1,324 @@
+#----------------------------------------------------------------------
+# Copyright (c) 2011-2015 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+
+# Audit the SQL the CH actually issues against the indexes of a database.
+#
+# 1. Capture: set chrm.db_query_capture_file in chapi.ini and exercise
+#    the CH (e.g. with portal_benchmark.py). Every statement is appended
+#    to the file as a JSON line {"statement" : ..., "parameters" : ...}
+#
+# 2. Audit: run EXPLAIN on each distinct captured statement against a
+#    seeded database, report sequential scans of large tables and
+#    propose indexes for their filter columns:
+#
+#    python query_audit.py --db_url postgresql://... --capture FILE \
+#        --report report.json [--baseline last-release.json] \
+#        [--update_file update-N.sql]
+#
+# With --baseline, statements that got more expensive (or newly scan a
+# large table) since the baseline report are listed as regressions and
+# the exit status is 1.
+
+import datetime
+import json
+import optparse
+import re
+import sys
+import threading
+import uuid
+
+# Tables with fewer (estimated) rows than this are fine to scan
+DEFAULT_MIN_ROWS = 1000
+
+# Cost increase over the baseline reported as a regression
+DEFAULT_TOLERANCE = 0.2
+
+# Statements not worth explaining
+SKIPPED_STATEMENT_PREFIXES = ['insert', 'select 1', 'select pg_', 'set ',
+                              'begin', 'commit', 'rollback', 'show ']
+
+# A column compared in a plan filter, e.g. "((name)::text = 'urn'::text)"
+FILTER_COLUMN_PATTERN = \
+    re.compile(r"\(*([a-z_][a-z0-9_]*)\)*(?:::[a-z ]+)?\)* (=|<>|>=|<=|>|<|~~) ")
+
+def _json_value(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, buffer):
+        return None
+    return str(value)
+
+# Append each statement executed on an engine to a file (JSON lines)
+class QueryCapture:
+
+    def __init__(self, filename):
+        self._lock = threading.Lock()
+        self._file = open(filename, 'a')
+
+    def install(self, engine):
+        from sqlalchemy import event
+        event.listen(engine, 'before_cursor_execute', self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context,
+                executemany):
+        if executemany:
+            return
+        line = json.dumps({'statement' : statement,
+                           'parameters' : parameters},
+                          default=_json_value)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+# Read a capture file: return list of [statement, parameters, count]
+# for each distinct statement (with the parameters of its first use)
+def load_capture(filename):
+    statements = {}
+    order = []
+    for line in open(filename):
+        line = line.strip()
+        if not line:
+            continue
+        entry = json.loads(line)
+        statement = entry['statement']
+        lowered = statement.strip().lower()
+        if [p for p in SKIPPED_STATEMENT_PREFIXES if lowered.startswith(p)]:
+            continue
+        if statement in statements:
+            statements[statement][2] += 1
+        else:
+            statements[statement] = [statement, entry['parameters'], 1]
+            order.append(statement)
+    return [statements[statement] for statement in order]
+
+# Return the JSON plan of a statement
+def explain(conn, statement, parameters):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + statement, parameters)
+        plan = cursor.fetchone()[0]
+    finally:
+        cursor.close()
+        # EXPLAIN doesn't run the statement, but don't leave a
+        # transaction (or an error) open
+        conn.rollback()
+    if isinstance(plan, basestring):
+        plan = json.loads(plan)
+    return plan[0]['Plan']
+
+# Yield every node of a plan
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        for node in plan_nodes(child):
+            yield node
+
+# Return list of (column, is_equality) compared in a plan filter
+def filter_columns(filter_text):
+    columns = []
+    for column, operator in FILTER_COLUMN_PATTERN.findall(filter_text):
+        if column not in [c for c, e in columns]:
+            columns.append((column, operator == '='))
+    return columns
+
+# Return dictionary table => estimated number of rows
+def table_sizes(conn):
+    cursor = conn.cursor()
+    cursor.execute("select relname, reltuples from pg_class " + \
+                       "where relkind = 'r'")
+    sizes = dict(cursor.fetchall())
+    cursor.close()
+    return sizes
+
+# Return dictionary table => list of index column lists
+def table_indexes(conn):
+    cursor = conn.cursor()
+    cursor.execute("select t.relname, i.indkey::int2[], " + \
+                       "array(select attname from pg_attribute a " + \
+                       "      where a.attrelid = t.oid and a.attnum > 0 " + \
+                       "      order by a.attnum) " + \
+                       "from pg_index i join pg_class t on t.oid = i.indrelid")
+    indexes = {}
+    for table, keys, names in cursor.fetchall():
+        # indkey entries are attribute numbers (0 for an expression)
+        columns = [key > 0 and names[key - 1] or None for key in keys]
+        indexes.setdefault(table, []).append(columns)
+    cursor.close()
+    return indexes
+
+# Is there an index whose leading columns are the given columns?
+def is_indexed(indexes, table, columns):
+    for index_columns in indexes.get(table, []):
+        if index_columns[:len(columns)] == columns:
+            return True
+    return False
+
+def audit(conn, captured, min_rows):
+    sizes = table_sizes(conn)
+    indexes = table_indexes(conn)
+    statements = []
+    # (table, columns) => number of statements that would use the index
+    proposals = {}
+    for statement, parameters, count in captured:
+        result = {'statement' : statement, 'count' : count}
+        try:
+            plan = explain(conn, statement, parameters)
+        except Exception, e:
+            result['error'] = str(e).strip()
+            statements.append(result)
+            continue
+        result['total_cost'] = plan['Total Cost']
+        result['seq_scans'] = []
+        for node in plan_nodes(plan):
+            if node['Node Type'] != 'Seq Scan':
+                continue
+            table = node['Relation Name']
+            if sizes.get(table, 0) < min_rows:
+                continue
+            scan = {'table' : table, 'rows' : sizes[table],
+                    'filter' : node.get('Filter')}
+            result['seq_scans'].append(scan)
+            if not scan['filter']:
+                continue
+            columns = filter_columns(scan['filter'])
+            # Equality columns first, then (at most one) range column
+            columns = [c for c, equality in columns if equality] + \
+                [c for c, equality in columns if not equality][:1]
+            if columns and not is_indexed(indexes, table, columns):
+                key = (table, tuple(columns))
+                proposals[key] = proposals.get(key, 0) + 1
+        statements.append(result)
+    proposed = [{'table' : table, 'columns' : list(columns),
+                 'statements' : used} \
+                    for (table, columns), used in sorted(proposals.items())]
+    return statements, proposed
+
+# Return list of regressions of a report relative to a baseline report
+def compare_reports(report, baseline, tolerance):
+    baseline_statements = dict([(s['statement'], s) \
+                                    for s in baseline['statements']])
+    regressions = []
+    for current in report['statements']:
+        previous = baseline_statements.get(current['statement'])
+        if not previous or 'total_cost' not in current or \
+                'total_cost' not in previous:
+            continue
+        old_tables = set([s['table'] for s in previous['seq_scans']])
+        new_tables = set([s['table'] for s in current['seq_scans']])
+        if current['total_cost'] > previous['total_cost'] * (1 + tolerance) \
+                or new_tables - old_tables:
+            regressions.append({'statement' : current['statement'],
+                                'baseline_cost' : previous['total_cost'],
+                                'cost' : current['total_cost'],
+                                'new_seq_scans' : \
+                                    sorted(new_tables - old_tables)})
+    return regressions
+
+def write_update_file(filename, proposed):
+    out = open(filename, 'w')
+    out.write("-- -------------------\n")
+    out.write("-- Indexes proposed by query_audit.py for sequential scans\n")
+    out.write("-- of large tables in the captured CH queries\n")
+    out.write("-- -------------------\n")
+    for proposal in proposed:
+        table = proposal['table']
+        columns = proposal['columns']
+        out.write("\n-- Used by %d captured statements\n" % \
+                      proposal['statements'])
+        out.write("CREATE INDEX %s_%s ON %s (%s);\n" % \
+                      (table, '_'.join(columns), table, ', '.join(columns)))
+    out.close()
+
+def parseOptions(args):
+    parser = optparse.OptionParser()
+    parser.add_option("--db_url", help="URL of (seeded) database to audit",
+                      default=None)
+    parser.add_option("--capture", help="Captured statements file",
+                      default=None)
+    parser.add_option("--report", help="File to write the JSON report to",
+                      default=None)
+    parser.add_option("--baseline",
+                      help="Earlier JSON report to check for regressions",
+                      default=None)
+    parser.add_option("--update_file",
+                      help="File to write proposed indexes to (SQL)",
+                      default=None)
+    parser.add_option("--min_rows", help="Ignore scans of smaller tables",
+                      default=DEFAULT_MIN_ROWS)
+    parser.add_option("--tolerance",
+                      help="Cost increase (fraction) that is a regression",
+                      default=DEFAULT_TOLERANCE)
+
+    [opts, args] = parser.parse_args(args)
+    if not opts.db_url or not opts.capture:
+        print "--db_url and --capture are required"
+        sys.exit(0)
+
+    return opts
+
+def main(args = sys.argv):
+    opts = parseOptions(args)
+    from sqlalchemy import create_engine
+    conn = create_engine(opts.db_url).raw_connection()
+
+    captured = load_capture(opts.capture)
+    statements, proposed = audit(conn, captured, int(opts.min_rows))
+    conn.close()
+
+    report = {'generated' : datetime.datetime.utcnow().isoformat(),
+              'statements' : statements,
+              'proposed_indexes' : proposed}
+
+    print "Explained %d distinct statements" % len(statements)
+    for statement in statements:
+        if 'error' in statement:
+            print "Failed: %s (%s)" % (statement['statement'],
+                                       statement['error'])
+    for proposal in proposed:
+        print "Proposed index on %s (%s) for %d statements" % \
+            (proposal['table'], ', '.join(proposal['columns']),
+             proposal['statements'])
+
+    status = 0
+    if opts.baseline:
+        baseline = json.load(open(opts.baseline))
+        regressions = compare_reports(report, baseline, float(opts.tolerance))
+        report['regressions'] = regressions
+        for regression in regressions:
+            print "Regression: cost %.1f => %.1f %s: %s" % \
+                (regression['baseline_cost'], regression['cost'],
+                 regression['new_seq_scans'], regression['statement'])
+        if regressions:
+            status = 1
+
+    if opts.report:
+        json.dump(report, open(opts.report, 'w'), indent=2)
+    if opts.update_file and proposed:
+        write_update_file(opts.update_file, proposed)
+
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())